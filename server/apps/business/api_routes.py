@@ -53,7 +53,7 @@ from apps.business.api import (
     search_ai_products_by_name_prefix_api,
     manual_refresh_daily_remaining_service
 )
-from apps.business.views import upload_orders_excel
+from apps.business.views import upload_orders_excel, get_order_import_job, get_scheduler_job_runs
 
 def business_api_routes(app):
     """
@@ -102,7 +102,8 @@ def business_api_routes(app):
     app.add_route(route_type="GET", endpoint="/user_entitlements/generate/:order_id", handler=generate_user_entitlement_from_order_api) # 根据订单生成用户权益
     app.add_route(route_type="GET", endpoint="/user_entitlements/batch_generate", handler=batch_generate_user_entitlements_api) # 批量根据订单生成用户权益
 
-    app.add_route(route_type="POST", endpoint="/orders/upload", handler=upload_orders_excel) # 上传订单Excel文件
+    app.add_route(route_type="POST", endpoint="/orders/upload", handler=upload_orders_excel) # 上传订单Excel文件（后台导入）
+    app.add_route(route_type="GET", endpoint="/orders/upload/:job_id", handler=get_order_import_job) # 查询订单导入任务进度
 
     app.add_route(route_type="DELETE", endpoint="/del_courses/:course_id", handler=delete_course_permanently_api) # 彻底删除课程
     app.add_route(route_type="DELETE", endpoint="/del_ai_products/:ai_product_id", handler=delete_ai_product_permanently_api) # 彻底删除AI产品
@@ -121,3 +122,4 @@ def business_api_routes(app):
     app.add_route(route_type="POST", endpoint="/ai_products/search", handler=search_ai_products_by_name_prefix_api) # 根据AI产品名称开头搜索AI产品
 
     app.add_route(route_type="PATCH", endpoint="/manual_refresh_daily_remaining", handler=manual_refresh_daily_remaining_service) # 手动刷新所有生效中用户权益的剩余额度
+    app.add_route(route_type="GET", endpoint="/scheduler/runs", handler=get_scheduler_job_runs) # 查询定时任务执行记录（耗时、状态、结果）
@@ -1,9 +1,10 @@
+from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, insert, update, bindparam, and_, or_
 from sqlalchemy.sql import func
 from core.database import AsyncSessionLocal
 from core.logger import setup_logger
-from apps.business.models import Courses, Entitlement_rules, Orders, User_entitlements, Upload_error_orders, Batch_generate_entitlements_error, product_card
+from apps.business.models import Courses, Entitlement_rules, Orders, User_entitlements, Upload_error_orders, Batch_generate_entitlements_error, product_card, Sync_watermark
 from common.utils.dynamic_query import dynamic_query
 
 # 设置日志记录器
@@ -338,6 +339,20 @@ async def get_entitlement_rules_by_filters(db: AsyncSession, filters=None, order
     # 返回所有完整记录（ORM 对象列表）
     return result.scalars().all()
 
+async def get_entitlement_rules_by_course_ids(db: AsyncSession, course_ids: list):
+    """
+    根据课程ID列表批量查询未删除的权益规则
+    """
+    if not course_ids:
+        return []
+    result = await db.execute(
+        select(Entitlement_rules).where(
+            Entitlement_rules.course_id.in_(course_ids),
+            Entitlement_rules.is_deleted == False
+        )
+    )
+    return result.scalars().all()
+
 async def check_entitlement_rule_exists(rule_id: str) -> bool:
     """
     检查权益规则是否已存在
@@ -535,6 +550,75 @@ async def get_orders_by_filters(db: AsyncSession, filters=None, order_by=None, p
         logger.error(f"查询订单列表失败: {str(e)}")
         raise
 
+async def get_orders_by_ids(db: AsyncSession, order_ids: list):
+    """
+    根据订单ID列表批量查询订单
+    :return: 订单列表
+    """
+    if not order_ids:
+        return []
+    result = await db.execute(select(Orders).where(Orders.order_id.in_(order_ids)))
+    return result.scalars().all()
+
+async def apply_order_import_chunk(db: AsyncSession, new_orders: list = None, refunded_order_ids: list = None, errors: list = None):
+    """
+    在一个事务内批量写入一批导入的订单
+    :param new_orders: 新建的订单数据列表
+    :param refunded_order_ids: 已存在且需要标记为已退款的订单ID
+    :param errors: 上传错误订单记录列表 [{"order_id", "error_message"}]
+    """
+    try:
+        if new_orders:
+            await db.execute(insert(Orders), new_orders)
+        if refunded_order_ids:
+            await db.execute(
+                update(Orders)
+                .where(Orders.order_id.in_(refunded_order_ids))
+                .values(is_refund=True)
+                .execution_options(synchronize_session=False)
+            )
+        if errors:
+            await db.execute(insert(Upload_error_orders), errors)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def get_orders_after(db: AsyncSession, filters: dict = None, after_order_id: str = None, limit: int = 1000):
+    """
+    按订单ID游标分页查询订单（不统计总数，适合遍历大表）
+    :param filters: 过滤条件
+    :param after_order_id: 上一页最后一个订单ID，为空时从头开始
+    :param limit: 每页数量
+    :return: 订单列表（按订单ID升序）
+    """
+    filters = dict(filters or {})
+    if after_order_id is not None:
+        filters["order_id"] = {"gt": after_order_id}
+    query = await dynamic_query(db, Orders, filters, {"order_id": "asc"}, limit)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def get_orders_after_watermark(db: AsyncSession, last_created_at=None, last_id: str = None, until=None, limit: int = 500):
+    """
+    按 (created_at, order_id) 游标查询新订单
+    :param last_created_at: 水位线的创建时间，为空时从头开始
+    :param last_id: 水位线的订单ID
+    :param until: 只查询创建时间不晚于该时间的订单
+    :param limit: 每页数量
+    :return: 订单列表（按 created_at, order_id 升序）
+    """
+    query = select(Orders).where(Orders.is_deleted == False)
+    if last_created_at is not None:
+        query = query.where(or_(
+            Orders.created_at > last_created_at,
+            and_(Orders.created_at == last_created_at, Orders.order_id > (last_id or ""))
+        ))
+    if until is not None:
+        query = query.where(Orders.created_at <= until)
+    result = await db.execute(query.order_by(Orders.created_at, Orders.order_id).limit(limit))
+    return result.scalars().all()
+
 async def check_order_exists(order_id: str) -> bool:
     """
     检查订单是否已存在
@@ -587,6 +671,219 @@ async def update_user_entitlement(db: AsyncSession, entitlement_id: str, user_en
     await db.refresh(user_entitlement)
     return user_entitlement
 
+async def reserve_user_entitlement(db: AsyncSession, entitlement_id: str, amount: int = 1):
+    """
+    预扣用户权益次数（条件更新，剩余次数不足时不扣减）
+    :param entitlement_id: 用户权益ID
+    :param amount: 扣减次数
+    :return: 扣减后的剩余次数，剩余次数不足时返回None
+    """
+    result = await db.execute(
+        update(User_entitlements)
+        .where(
+            User_entitlements.entitlement_id == entitlement_id,
+            User_entitlements.daily_remaining >= amount
+        )
+        .values(daily_remaining=User_entitlements.daily_remaining - amount)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if result.rowcount == 0:
+        return None
+    remaining = await db.execute(
+        select(User_entitlements.daily_remaining).where(User_entitlements.entitlement_id == entitlement_id)
+    )
+    return remaining.scalar_one()
+
+async def release_user_entitlement(db: AsyncSession, entitlement_id: str, amount: int = 1):
+    """
+    归还预扣的用户权益次数（业务处理失败时调用），归还后不超过权益规则的每日次数
+    :param entitlement_id: 用户权益ID
+    :param amount: 归还次数
+    """
+    await db.execute(
+        update(User_entitlements)
+        .where(
+            User_entitlements.entitlement_id == entitlement_id,
+            User_entitlements.rule_id == Entitlement_rules.rule_id
+        )
+        .values(daily_remaining=func.least(User_entitlements.daily_remaining + amount, Entitlement_rules.daily_limit))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+async def get_latest_user_entitlement(db: AsyncSession, phone: str, ai_product_id: str):
+    """
+    获取用户在指定AI产品下最新的未删除权益
+    """
+    result = await db.execute(
+        select(User_entitlements)
+        .where(
+            User_entitlements.phone == phone,
+            User_entitlements.ai_product_id == ai_product_id,
+            User_entitlements.is_deleted == False
+        )
+        .order_by(User_entitlements.created_at.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+async def get_user_entitlement_remaining(db: AsyncSession, entitlement_id: str):
+    """
+    获取用户权益的当日剩余次数，权益不存在时返回None
+    """
+    result = await db.execute(
+        select(User_entitlements.daily_remaining).where(User_entitlements.entitlement_id == entitlement_id)
+    )
+    return result.scalar_one_or_none()
+
+async def bulk_decrease_user_entitlement_remaining(db: AsyncSession, usage: dict):
+    """
+    批量扣减用户权益的当日剩余次数（不低于0）
+    :param usage: {entitlement_id: 扣减次数}
+    """
+    if not usage:
+        return
+    # 使用表对象执行 executemany，避免走ORM按主键批量更新的路径
+    table = User_entitlements.__table__
+    await db.execute(
+        update(table)
+        .where(table.c.entitlement_id == bindparam("b_entitlement_id"))
+        .values(daily_remaining=func.greatest(table.c.daily_remaining - bindparam("b_used"), 0)),
+        [{"b_entitlement_id": entitlement_id, "b_used": used} for entitlement_id, used in usage.items()]
+    )
+    await db.commit()
+
+async def refresh_user_entitlements_daily_remaining(db: AsyncSession, now, chunk_size: int = 5000):
+    """
+    将所有未删除且在有效期内的用户权益的当日剩余次数重置为对应权益规则的每日上限
+    按主键分批执行 UPDATE ... JOIN entitlement_rules，每批单独提交，避免长时间持有大范围行锁
+    :param now: 当前时间（判断有效期）
+    :param chunk_size: 每批更新的权益数量
+    :return: dict，scanned 为扫描的有效权益数量，updated 为更新的行数，chunks 为批次数
+    """
+    active = (
+        User_entitlements.is_deleted == False,
+        User_entitlements.start_date <= now,
+        User_entitlements.end_date >= now
+    )
+    stats = {"scanned": 0, "updated": 0, "chunks": 0}
+    last_id = None
+    while True:
+        # 按主键游标取下一批有效权益ID
+        query = select(User_entitlements.entitlement_id).where(*active)
+        if last_id is not None:
+            query = query.where(User_entitlements.entitlement_id > last_id)
+        result = await db.execute(query.order_by(User_entitlements.entitlement_id).limit(chunk_size))
+        entitlement_ids = result.scalars().all()
+        if not entitlement_ids:
+            break
+
+        result = await db.execute(
+            update(User_entitlements)
+            .where(
+                User_entitlements.entitlement_id.in_(entitlement_ids),
+                User_entitlements.rule_id == Entitlement_rules.rule_id,
+                Entitlement_rules.is_deleted == False,
+                *active
+            )
+            .values(daily_remaining=Entitlement_rules.daily_limit)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        stats["scanned"] += len(entitlement_ids)
+        stats["updated"] += result.rowcount
+        stats["chunks"] += 1
+        last_id = entitlement_ids[-1]
+        if len(entitlement_ids) < chunk_size:
+            break
+    return stats
+
+async def get_active_entitlement_order_ids(db: AsyncSession, order_ids: list) -> set:
+    """
+    查询指定订单中已生成未删除用户权益的订单ID
+    :return: 订单ID集合
+    """
+    if not order_ids:
+        return set()
+    result = await db.execute(
+        select(User_entitlements.order_id).where(
+            User_entitlements.order_id.in_(order_ids),
+            User_entitlements.is_deleted == False
+        )
+    )
+    return set(result.scalars().all())
+
+async def apply_entitlement_chunk(db: AsyncSession, entitlements: list = None, generated_order_ids: list = None,
+                                  revoked_order_ids: list = None, deleted_entitlement_ids: list = None,
+                                  errors: list = None, watermark: dict = None):
+    """
+    在一个事务内批量写入一批订单的权益生成结果（批量生成权益和订单增量同步共用）
+    :param entitlements: 新建的用户权益数据列表
+    :param generated_order_ids: 已生成权益的订单ID（is_generate 置为 True）
+    :param revoked_order_ids: 已退款的订单ID（删除对应用户权益，is_generate 置为 False）
+    :param deleted_entitlement_ids: 需要额外删除（逻辑删除）的用户权益ID
+    :param errors: 批量生成权益错误记录列表 [{"order_id", "error_message"}]
+    :param watermark: 同步水位线 {"name", "last_created_at", "last_id"}，与本批结果一起提交
+    """
+    try:
+        if entitlements:
+            await db.execute(insert(User_entitlements), entitlements)
+        if generated_order_ids:
+            await db.execute(
+                update(Orders)
+                .where(Orders.order_id.in_(generated_order_ids))
+                .values(is_generate=True)
+                .execution_options(synchronize_session=False)
+            )
+        if deleted_entitlement_ids:
+            await db.execute(
+                update(User_entitlements)
+                .where(User_entitlements.entitlement_id.in_(deleted_entitlement_ids))
+                .values(is_active=False, is_deleted=True)
+                .execution_options(synchronize_session=False)
+            )
+        if revoked_order_ids:
+            await db.execute(
+                update(User_entitlements)
+                .where(
+                    User_entitlements.order_id.in_(revoked_order_ids),
+                    User_entitlements.is_deleted == False
+                )
+                .values(is_active=False, is_deleted=True)
+                .execution_options(synchronize_session=False)
+            )
+            await db.execute(
+                update(Orders)
+                .where(Orders.order_id.in_(revoked_order_ids))
+                .values(is_generate=False)
+                .execution_options(synchronize_session=False)
+            )
+        if errors:
+            await db.execute(insert(Batch_generate_entitlements_error), errors)
+        if watermark:
+            await db.merge(Sync_watermark(**watermark, updated_at=datetime.utcnow()))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def get_user_entitlements_by_phones(db: AsyncSession, phones: list, rule_ids: list):
+    """
+    批量查询指定手机号、权益规则下未删除的用户权益
+    """
+    if not phones or not rule_ids:
+        return []
+    result = await db.execute(
+        select(User_entitlements).where(
+            User_entitlements.phone.in_(phones),
+            User_entitlements.rule_id.in_(rule_ids),
+            User_entitlements.is_deleted == False
+        )
+    )
+    return result.scalars().all()
+
 async def delete_user_entitlement(db: AsyncSession, entitlement_id: str):
     """
     删除用户权益
@@ -663,6 +960,14 @@ async def check_user_entitlement_exists(entitlement_id: str) -> bool:
 
 
 
+# 同步水位线表操作
+async def get_sync_watermark(db: AsyncSession, name: str):
+    """
+    获取同步任务的水位线
+    """
+    return await db.get(Sync_watermark, name)
+
+
 # 上传错误订单CRUD操作
 async def create_upload_error_order(db: AsyncSession, error_data: dict):
     """创建上传错误订单记录"""
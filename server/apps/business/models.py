@@ -298,3 +298,32 @@ class product_card(Base):
             logger.error(f"Error converting product_card to dict: {str(e)}")
             return {}
 
+
+class Sync_watermark(Base):
+    """
+    增量同步水位线模型，记录后台同步任务已处理到的位置 (created_at, 主键)
+    """
+    __tablename__ = 'sync_watermark'
+
+    name = Column(VARCHAR(50), primary_key=True) # 同步任务名称
+    last_created_at = Column(DateTime, nullable=True) # 已处理记录的最大创建时间
+    last_id = Column(String(50), nullable=True) # 同一创建时间下已处理记录的最大主键
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow) # 更新时间
+
+    def __repr__(self):
+        return (f"Sync_watermark(name={self.name}, "
+                f"last_created_at={self.last_created_at}, "
+                f"last_id={self.last_id})")
+
+    def to_dict(self):
+        """转换为字典"""
+        try:
+            return {
+                "name": self.name,
+                "last_created_at": self.last_created_at.isoformat() if self.last_created_at else None,
+                "last_id": self.last_id,
+                "updated_at": self.updated_at.isoformat() if self.updated_at else None
+            }
+        except Exception as e:
+            logger.error(f"Error converting sync_watermark to dict: {str(e)}")
+            return {}
@@ -0,0 +1,204 @@
+"""
+订单Excel导入任务
+
+上传的Excel在工作线程中以只读流式模式解析，课程名称通过预加载的 课程名称 -> 课程ID 映射匹配，
+订单按批查询已有记录并在一个事务内批量写入；任务在后台执行，进度保存在 Redis 中供查询接口读取
+"""
+import os
+import asyncio
+from datetime import datetime
+from core.cache import Cache
+from core.database import AsyncSessionLocal
+from core.logger import setup_logger
+from common.utils.r_excel import ExcelReader
+from apps.business import crud as business_crud
+from apps.business.utils import generate_uuid
+
+logger = setup_logger('order_import')
+
+# 每批写入的订单数量
+ORDER_IMPORT_CHUNK_SIZE = int(os.getenv('ORDER_IMPORT_CHUNK_SIZE', 1000))
+# 导入任务进度的保存时间（秒）
+ORDER_IMPORT_JOB_TTL = int(os.getenv('ORDER_IMPORT_JOB_TTL', 86400))
+# 进度中保留的错误信息和无效行条数（完整错误记录见上传错误订单表）
+ORDER_IMPORT_MAX_ERROR_MESSAGES = int(os.getenv('ORDER_IMPORT_MAX_ERROR_MESSAGES', 200))
+
+
+class OrderImportJob:
+    """
+    订单导入任务管理器（进程内单例）
+    """
+    _running_jobs = {}
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"order_import:job:{job_id}"
+
+    @staticmethod
+    def _course_key(course_name: str) -> str:
+        """课程名称匹配键：合并空白并忽略大小写（与数据库默认排序规则的比较结果一致）"""
+        return ' '.join(course_name.split()).casefold()
+
+    @classmethod
+    async def create(cls, file_name: str, file_content: bytes) -> dict:
+        """
+        创建导入任务并在后台执行
+        :return: 任务进度
+        """
+        job_id = generate_uuid("IMPORT")
+        job = {
+            "job_id": job_id,
+            "file_name": file_name,
+            "status": "pending",
+            "total": 0,
+            "processed": 0,
+            "success": 0,
+            "update": 0,
+            "error": 0,
+            "error_messages": [],
+            "rejected": 0,
+            "rejected_rows": [],
+            "message": None,
+            "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "finished_at": None
+        }
+        await cls._save(job)
+        task = asyncio.create_task(cls._run(job, file_content))
+        cls._running_jobs[job_id] = task
+        task.add_done_callback(lambda _: cls._running_jobs.pop(job_id, None))
+        logger.info(f"创建订单导入任务: job_id={job_id}, file_name={file_name}")
+        return job
+
+    @classmethod
+    async def get(cls, job_id: str):
+        """获取任务进度，任务不存在或已过期时返回None"""
+        return await Cache.get(cls._key(job_id))
+
+    @classmethod
+    async def _save(cls, job: dict):
+        try:
+            await Cache.set(cls._key(job["job_id"]), job, expire=ORDER_IMPORT_JOB_TTL)
+        except Exception as e:
+            logger.error(f"保存订单导入任务进度失败: job_id={job['job_id']}, error={str(e)}")
+
+    @classmethod
+    async def _run(cls, job: dict, file_content: bytes):
+        """执行导入任务"""
+        try:
+            job["status"] = "parsing"
+            await cls._save(job)
+            # 解析Excel是CPU密集操作，放到线程中执行，避免阻塞事件循环
+            orders, rejected = await asyncio.to_thread(ExcelReader.process_uploaded_excel, file_content)
+            # Excel中格式无效的行（手机号、支付时间、订单号）
+            job["rejected"] = len(rejected)
+            job["rejected_rows"] = [
+                f"第 {row['行号']} 行: {row['原因']}"
+                for row in rejected.head(ORDER_IMPORT_MAX_ERROR_MESSAGES).to_dict('records')
+            ]
+            if not orders:
+                job["status"] = "failed"
+                job["message"] = "Excel文件中没有有效的订单数据"
+                return
+
+            job["status"] = "importing"
+            job["total"] = len(orders)
+            await cls._save(job)
+
+            async with AsyncSessionLocal() as db:
+                result = await business_crud.get_courses(db)
+                course_ids = {
+                    cls._course_key(course.course_name): course.course_id
+                    for course in result.scalars().all() if not course.is_deleted
+                }
+                # 本次导入中已写入的订单：订单ID -> 是否退款（处理文件内重复的订单号）
+                imported = {}
+                for start in range(0, len(orders), ORDER_IMPORT_CHUNK_SIZE):
+                    chunk = orders[start:start + ORDER_IMPORT_CHUNK_SIZE]
+                    await cls._import_chunk(db, job, chunk, course_ids, imported)
+                    job["processed"] += len(chunk)
+                    await cls._save(job)
+
+            job["status"] = "completed"
+            job["message"] = f"成功导入 {job['success']} 条订单数据，更新 {job['update']} 条订单数据，失败 {job['error']} 条"
+            logger.info(f"订单导入任务完成: job_id={job['job_id']}, {job['message']}")
+        except Exception as e:
+            logger.error(f"订单导入任务失败: job_id={job['job_id']}, error={str(e)}")
+            job["status"] = "failed"
+            job["message"] = f"处理Excel文件失败: {str(e)}"
+        finally:
+            job["finished_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            await cls._save(job)
+
+    @classmethod
+    async def _import_chunk(cls, db, job: dict, chunk: list, course_ids: dict, imported: dict):
+        """校验并批量写入一批订单"""
+        existing = {
+            order.order_id: order.is_refund
+            for order in await business_crud.get_orders_by_ids(db, [order["order_id"] for order in chunk])
+        }
+        new_orders, refunded_order_ids, errors = [], [], []
+        # 本批次写入成功前暂存的订单状态
+        staged = {}
+
+        def add_error(order_id: str, error_message: str):
+            job["error"] += 1
+            if len(job["error_messages"]) < ORDER_IMPORT_MAX_ERROR_MESSAGES:
+                job["error_messages"].append(error_message)
+            errors.append({"order_id": order_id or "未知", "error_message": error_message[:255]})
+
+        for order in chunk:
+            order_id = order.get("order_id")
+            course_name = order.get("course_name")
+            is_refund = order.get("is_refund")
+            if not all([order_id, order.get("phone"), course_name, order.get("purchase_time")]):
+                add_error(order_id, f"订单 {order_id} 数据不完整")
+                continue
+
+            # 根据课程名称获取课程ID
+            course_id = course_ids.get(cls._course_key(course_name))
+            if not course_id:
+                add_error(order_id, f"订单 {order_id} 的课程 {course_name} 不存在")
+                continue
+
+            # 检查订单号是否已存在（包括本次导入中已写入的订单）
+            if order_id in staged:
+                existing_refund = staged[order_id]
+            elif order_id in imported:
+                existing_refund = imported[order_id]
+            else:
+                existing_refund = existing.get(order_id)
+
+            if existing_refund is False and is_refund:
+                # 更新订单状态为已退款
+                refunded_order_ids.append(order_id)
+                staged[order_id] = True
+                job["update"] += 1
+            elif existing_refund is not None:
+                add_error(order_id, f"订单 {order_id} 已存在")
+            elif is_refund:
+                add_error(order_id, f"订单 {order_id} 已退款")
+            else:
+                new_orders.append({
+                    "order_id": order_id,
+                    "phone": order["phone"],
+                    "course_id": course_id,
+                    "purchase_time": order["purchase_time"],
+                    "is_refund": False,
+                    "is_deleted": False
+                })
+                staged[order_id] = False
+
+        try:
+            await business_crud.apply_order_import_chunk(db, new_orders, refunded_order_ids, errors)
+            imported.update(staged)
+            job["success"] += len(new_orders) + len(refunded_order_ids)
+        except Exception as e:
+            # 整批回滚，该批订单均记为失败，错误记录单独写入
+            logger.error(f"批量写入订单失败: {str(e)}")
+            job["update"] -= len(refunded_order_ids)
+            for order_id in [order["order_id"] for order in new_orders] + refunded_order_ids:
+                add_error(order_id, f"订单 {order_id} 保存失败: {str(e)}")
+            try:
+                await business_crud.apply_order_import_chunk(db, errors=errors)
+            except Exception as e:
+                logger.error(f"写入上传错误订单记录失败: {str(e)}")
@@ -0,0 +1,212 @@
+"""
+订单 -> 用户权益 增量同步
+
+按 (created_at, order_id) 水位线分批读取新订单，每批一次查询权益规则和已有用户权益，
+用户权益、订单状态和水位线在同一事务内写入；整批写入失败时只对该批订单逐条重试，
+仍然失败的订单写入批量生成权益错误表（订单保持未生成状态，可通过批量生成权益补偿）
+"""
+import os
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta
+from core.database import AsyncSessionLocal
+from core.logger import setup_logger
+from apps.business import crud as business_crud
+from apps.business.services import load_entitlement_rules_by_course
+from apps.business.utils import generate_entitlement_id
+
+logger = setup_logger('order_sync')
+
+# 每批处理的订单数量
+ORDER_SYNC_CHUNK_SIZE = int(os.getenv('ORDER_SYNC_CHUNK_SIZE', 500))
+# 只同步创建时间早于当前时间该秒数的订单，避免跳过仍在提交中的订单
+ORDER_SYNC_LAG = int(os.getenv('ORDER_SYNC_LAG', 30))
+# 首次同步（没有水位线）时回溯的小时数
+ORDER_SYNC_INITIAL_LOOKBACK_HOURS = int(os.getenv('ORDER_SYNC_INITIAL_LOOKBACK_HOURS', 24))
+
+WATERMARK_NAME = "orders_to_entitlements"
+
+# 订单字段快照（回滚会使ORM实例过期，重试时不能再访问其属性）
+OrderRow = namedtuple("OrderRow", ["order_id", "phone", "course_id", "is_refund", "created_at"])
+
+
+class OrderSyncWorker:
+    """
+    订单同步到用户权益的增量同步任务
+    """
+    _lock = None
+
+    @classmethod
+    async def run_once(cls, max_retries: int = 3) -> dict:
+        """
+        从水位线开始同步所有新订单
+
+        参数:
+            max_retries: 单个订单的最大重试次数
+
+        返回:
+            dict: 同步统计
+        """
+        # 同一进程内不并发执行
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        async with cls._lock:
+            return await cls._run(max_retries)
+
+    @classmethod
+    async def _run(cls, max_retries: int) -> dict:
+        stats = {
+            "total_processed": 0,
+            "created_entitlements": 0,
+            "deleted_entitlements": 0,
+            "failed_records": []
+        }
+        until = datetime.utcnow() - timedelta(seconds=ORDER_SYNC_LAG)
+
+        async with AsyncSessionLocal() as db:
+            watermark = await business_crud.get_sync_watermark(db, WATERMARK_NAME)
+            if watermark and watermark.last_created_at:
+                last_created_at, last_id = watermark.last_created_at, watermark.last_id
+            else:
+                last_created_at = until - timedelta(hours=ORDER_SYNC_INITIAL_LOOKBACK_HOURS)
+                last_id = ""
+
+            while True:
+                orders = await business_crud.get_orders_after_watermark(
+                    db, last_created_at, last_id, until, ORDER_SYNC_CHUNK_SIZE
+                )
+                if not orders:
+                    break
+                orders = [
+                    OrderRow(order.order_id, order.phone, order.course_id, order.is_refund, order.created_at)
+                    for order in orders
+                ]
+                last_created_at, last_id = orders[-1].created_at, orders[-1].order_id
+                await cls._sync_chunk(db, orders, {
+                    "name": WATERMARK_NAME,
+                    "last_created_at": last_created_at,
+                    "last_id": last_id
+                }, stats, max_retries)
+                stats["total_processed"] += len(orders)
+                if len(orders) < ORDER_SYNC_CHUNK_SIZE:
+                    break
+
+        if stats["total_processed"]:
+            logger.info(
+                f"订单同步到用户权益完成: 处理 {stats['total_processed']} 条, 新建权益 {stats['created_entitlements']} 条, "
+                f"删除权益 {stats['deleted_entitlements']} 条, 失败 {len(stats['failed_records'])} 条, "
+                f"水位线 ({last_created_at}, {last_id})"
+            )
+        return stats
+
+    @staticmethod
+    def _plan(orders: list, rules_by_course: dict, duplicated_courses: set, entitlements_by_key: dict) -> dict:
+        """
+        根据预加载的权益规则和已有用户权益，计算一批订单需要写入的内容
+        """
+        plan = {
+            "entitlements": [],
+            "generated_order_ids": [],
+            "deleted_entitlement_ids": [],
+            "revoked_order_ids": [],
+            "errors": []
+        }
+        for order in orders:
+            rule = rules_by_course.get(order.course_id)
+            if not rule:
+                plan["errors"].append({"order_id": order.order_id, "error_message": "未找到对应的权益规则"})
+                continue
+            if order.course_id in duplicated_courses:
+                plan["errors"].append({"order_id": order.order_id, "error_message": "对应多条权益规则"})
+                continue
+
+            key = (order.phone, rule.rule_id)
+            if not order.is_refund:
+                # 未退款的订单：用户没有该规则的权益时创建
+                if key not in entitlements_by_key:
+                    start_date = datetime.utcnow()
+                    entitlement_id = generate_entitlement_id()
+                    plan["entitlements"].append({
+                        "entitlement_id": entitlement_id,
+                        "phone": order.phone,
+                        "order_id": order.order_id,
+                        "rule_id": rule.rule_id,
+                        "course_name": rule.course_name,
+                        "product_name": rule.product_name,
+                        "ai_product_id": rule.ai_product_id,
+                        "start_date": start_date,
+                        "end_date": start_date + timedelta(days=rule.validity_days),
+                        "is_active": False,
+                        "daily_remaining": rule.daily_limit,
+                        "created_at": start_date,
+                        "is_deleted": False
+                    })
+                    entitlements_by_key[key] = [entitlement_id]
+                plan["generated_order_ids"].append(order.order_id)
+            else:
+                # 已退款的订单：删除对应的用户权益（没有时视为已删除）
+                entitlement_ids = entitlements_by_key.pop(key, [])
+                if entitlement_ids:
+                    plan["deleted_entitlement_ids"].extend(entitlement_ids)
+                    plan["revoked_order_ids"].append(order.order_id)
+        return plan
+
+    @classmethod
+    async def _load(cls, db, orders: list):
+        """批量查询一批订单对应的权益规则和已有用户权益"""
+        rules_by_course, duplicated_courses = await load_entitlement_rules_by_course(
+            db, list({order.course_id for order in orders})
+        )
+        entitlements = await business_crud.get_user_entitlements_by_phones(
+            db, list({order.phone for order in orders}), [rule.rule_id for rule in rules_by_course.values()]
+        )
+        entitlements_by_key = {}
+        for entitlement in entitlements:
+            entitlements_by_key.setdefault((entitlement.phone, entitlement.rule_id), []).append(entitlement.entitlement_id)
+        return rules_by_course, duplicated_courses, entitlements_by_key
+
+    @classmethod
+    async def _apply(cls, db, orders: list, watermark: dict = None) -> dict:
+        rules_by_course, duplicated_courses, entitlements_by_key = await cls._load(db, orders)
+        plan = cls._plan(orders, rules_by_course, duplicated_courses, entitlements_by_key)
+        await business_crud.apply_entitlement_chunk(db, watermark=watermark, **plan)
+        return plan
+
+    @classmethod
+    def _record(cls, stats: dict, plan: dict):
+        stats["created_entitlements"] += len(plan["entitlements"])
+        stats["deleted_entitlements"] += len(plan["deleted_entitlement_ids"])
+        for error in plan["errors"]:
+            stats["failed_records"].append({"order_id": error["order_id"], "error": error["error_message"]})
+
+    @classmethod
+    async def _sync_chunk(cls, db, orders: list, watermark: dict, stats: dict, max_retries: int):
+        """同步一批订单，整批失败时只重试该批订单"""
+        try:
+            cls._record(stats, await cls._apply(db, orders, watermark))
+            return
+        except Exception as e:
+            logger.error(f"批量同步订单失败，逐条重试 {len(orders)} 条订单: {str(e)}")
+
+        errors = []
+        for order in orders:
+            for retry_count in range(1, max_retries + 1):
+                try:
+                    cls._record(stats, await cls._apply(db, [order]))
+                    break
+                except Exception as e:
+                    error_message = f"处理订单 {order.order_id} 时发生错误: {str(e)}"
+                    logger.error(error_message)
+                    if retry_count >= max_retries:
+                        errors.append({"order_id": order.order_id, "error_message": error_message[:255]})
+                        stats["failed_records"].append({
+                            "order_id": order.order_id,
+                            "error": error_message,
+                            "retry_count": retry_count
+                        })
+                    else:
+                        # 指数退避（会话已回滚，不持有事务）
+                        await asyncio.sleep(2 ** retry_count)
+
+        # 记录失败的订单并推进水位线
+        await business_crud.apply_entitlement_chunk(db, errors=errors, watermark=watermark)
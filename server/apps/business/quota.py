@@ -0,0 +1,258 @@
+"""
+用户权益每日次数（daily_remaining）管理
+
+每个权益的当日剩余次数保存在 Redis 计数器中，扣减通过 Lua 脚本原子执行（剩余次数足够才扣减），
+已使用的次数记录在待回写哈希中，由后台任务定期批量回写到 MySQL；
+每日0点先回写，再刷新数据库中的剩余次数，最后清空计数器（下次使用时从数据库重新加载）。
+Redis 不可用时退回到数据库条件更新；归还次数只在预扣的位置（Redis 或数据库）进行
+"""
+import os
+import asyncio
+from core.cache import Cache
+from core.database import AsyncSessionLocal
+from core.logger import setup_logger
+from apps.business import crud as business_crud
+
+logger = setup_logger('entitlement_quota')
+
+# 回写MySQL的间隔（秒）
+QUOTA_FLUSH_INTERVAL = float(os.getenv('QUOTA_FLUSH_INTERVAL', 5))
+# 计数器的过期时间（秒），每日重置时会主动清空
+QUOTA_COUNTER_TTL = int(os.getenv('QUOTA_COUNTER_TTL', 2 * 86400))
+# (手机号, AI产品) -> 权益ID 映射的缓存时间（秒）
+QUOTA_ENTITLEMENT_CACHE_TTL = int(os.getenv('QUOTA_ENTITLEMENT_CACHE_TTL', 300))
+
+QUOTA_PENDING_KEY = "quota:pending"
+
+# 预扣次数的来源，归还时按来源归还
+QUOTA_SOURCE_REDIS = "redis"
+QUOTA_SOURCE_DB = "db"
+
+# 剩余次数足够时扣减并记录待回写次数；计数器不存在返回-2，次数不足返回-1，否则返回扣减后的剩余次数
+_RESERVE_SCRIPT = """
+local remaining = redis.call('GET', KEYS[1])
+if not remaining then return -2 end
+if tonumber(remaining) < tonumber(ARGV[1]) then return -1 end
+remaining = redis.call('DECRBY', KEYS[1], ARGV[1])
+redis.call('HINCRBY', KEYS[2], ARGV[2], ARGV[1])
+return remaining
+"""
+
+# 归还次数（计数器不存在时说明已重置，不再归还）
+_RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return -2 end
+local remaining = redis.call('INCRBY', KEYS[1], ARGV[1])
+local pending = redis.call('HINCRBY', KEYS[2], ARGV[2], -tonumber(ARGV[1]))
+if pending == 0 then redis.call('HDEL', KEYS[2], ARGV[2]) end
+return remaining
+"""
+
+# 加载计数器（已存在时不覆盖）
+_SEED_SCRIPT = """
+return redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2])
+"""
+
+# 回写失败时放回待回写次数
+_REQUEUE_SCRIPT = """
+return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+"""
+
+# 取出并清空待回写次数
+_DRAIN_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return pending
+"""
+
+
+class EntitlementQuota:
+    """
+    用户权益每日次数服务
+    """
+    _flush_task = None
+
+    @staticmethod
+    def _counter_key(entitlement_id: str) -> str:
+        return f"quota:remaining:{entitlement_id}"
+
+    @staticmethod
+    def _entitlement_key(phone: str, ai_product_id: str) -> str:
+        return f"quota:entitlement:{phone}:{ai_product_id}"
+
+    @classmethod
+    async def resolve(cls, phone: str, ai_product_id: str):
+        """
+        获取用户在AI产品下最新的权益ID（带缓存）
+        :return: 权益ID，没有权益时返回None
+        """
+        key = cls._entitlement_key(phone, ai_product_id)
+        try:
+            cached = await Cache.get(key)
+            if cached is not None:
+                return cached.get("entitlement_id")
+        except Exception as e:
+            logger.error(f"查询权益映射缓存失败: {str(e)}")
+
+        async with AsyncSessionLocal() as db:
+            entitlement = await business_crud.get_latest_user_entitlement(db, phone, ai_product_id)
+        entitlement_id = entitlement.entitlement_id if entitlement else None
+        if entitlement_id:
+            try:
+                await Cache.set(key, {"entitlement_id": entitlement_id}, expire=QUOTA_ENTITLEMENT_CACHE_TTL)
+            except Exception as e:
+                logger.error(f"写入权益映射缓存失败: {str(e)}")
+        return entitlement_id
+
+    @classmethod
+    async def _seed(cls, entitlement_id: str) -> bool:
+        """从数据库加载剩余次数到计数器（已存在时不覆盖）"""
+        async with AsyncSessionLocal() as db:
+            remaining = await business_crud.get_user_entitlement_remaining(db, entitlement_id)
+        if remaining is None:
+            return False
+        await Cache.eval(_SEED_SCRIPT, [cls._counter_key(entitlement_id)], [remaining, QUOTA_COUNTER_TTL])
+        return True
+
+    @classmethod
+    async def reserve(cls, phone: str, ai_product_id: str, amount: int = 1):
+        """
+        预扣次数
+
+        参数:
+            phone: 手机号
+            ai_product_id: AI产品ID
+            amount: 扣减次数
+
+        返回:
+            tuple: (权益ID, 扣减后的剩余次数, 预扣来源)
+                没有权益时权益ID为None；剩余次数不足时剩余次数为None；
+                预扣来源为 QUOTA_SOURCE_REDIS 或 QUOTA_SOURCE_DB，归还时原样传给 release
+        """
+        entitlement_id = await cls.resolve(phone, ai_product_id)
+        if not entitlement_id:
+            return None, None, None
+
+        try:
+            keys = [cls._counter_key(entitlement_id), QUOTA_PENDING_KEY]
+            args = [amount, entitlement_id]
+            remaining = await Cache.eval(_RESERVE_SCRIPT, keys, args)
+            if remaining == -2:
+                if not await cls._seed(entitlement_id):
+                    return None, None, None
+                remaining = await Cache.eval(_RESERVE_SCRIPT, keys, args)
+            return entitlement_id, (remaining if remaining >= 0 else None), QUOTA_SOURCE_REDIS
+        except Exception as e:
+            # Redis不可用时退回到数据库条件更新
+            logger.error(f"Redis次数扣减失败，使用数据库扣减: {str(e)}")
+            async with AsyncSessionLocal() as db:
+                remaining = await business_crud.reserve_user_entitlement(db, entitlement_id, amount)
+            return entitlement_id, remaining, QUOTA_SOURCE_DB
+
+    @classmethod
+    async def release(cls, entitlement_id: str, source: str, amount: int = 1):
+        """
+        归还预扣的次数（业务处理失败时调用）
+        :param source: reserve 返回的预扣来源，只在预扣的位置归还
+        """
+        if not entitlement_id or amount <= 0:
+            return
+        if source == QUOTA_SOURCE_REDIS:
+            try:
+                # 计数器不存在时说明预扣后已重置（或被管理员清除），不再归还
+                await Cache.eval(_RELEASE_SCRIPT, [cls._counter_key(entitlement_id), QUOTA_PENDING_KEY], [amount, entitlement_id])
+            except Exception as e:
+                logger.error(f"Redis归还次数失败: entitlement_id={entitlement_id}, error={str(e)}")
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                await business_crud.release_user_entitlement(db, entitlement_id, amount)
+        except Exception as e:
+            logger.error(f"归还用户权益次数失败: entitlement_id={entitlement_id}, error={str(e)}")
+
+    @classmethod
+    async def flush(cls) -> int:
+        """
+        将待回写的已使用次数批量回写到MySQL
+        :return: 回写的权益数量
+        """
+        pending = await Cache.eval(_DRAIN_SCRIPT, [QUOTA_PENDING_KEY])
+        if not pending:
+            return 0
+        usage = {}
+        for entitlement_id, used in zip(pending[::2], pending[1::2]):
+            if int(used) > 0:
+                usage[entitlement_id] = int(used)
+        if not usage:
+            return 0
+        try:
+            async with AsyncSessionLocal() as db:
+                await business_crud.bulk_decrease_user_entitlement_remaining(db, usage)
+        except Exception as e:
+            # 回写失败时放回待回写哈希，下次重试
+            logger.error(f"回写用户权益次数失败，稍后重试: {str(e)}")
+            for entitlement_id, used in usage.items():
+                await Cache.eval(_REQUEUE_SCRIPT, [QUOTA_PENDING_KEY], [entitlement_id, used])
+            raise
+        logger.debug(f"回写用户权益次数: {len(usage)} 条")
+        return len(usage)
+
+    @classmethod
+    async def _flush_loop(cls):
+        while True:
+            await asyncio.sleep(QUOTA_FLUSH_INTERVAL)
+            try:
+                await cls.flush()
+            except Exception as e:
+                logger.error(f"定时回写用户权益次数失败: {str(e)}")
+
+    @classmethod
+    def start_flusher(cls):
+        """启动后台回写任务"""
+        if cls._flush_task is None or cls._flush_task.done():
+            cls._flush_task = asyncio.create_task(cls._flush_loop())
+            logger.info(f"用户权益次数回写任务已启动，间隔 {QUOTA_FLUSH_INTERVAL} 秒")
+
+    @classmethod
+    async def stop_flusher(cls):
+        """停止后台回写任务，并回写剩余的次数"""
+        if cls._flush_task is not None:
+            cls._flush_task.cancel()
+            cls._flush_task = None
+        await cls.flush()
+
+    @classmethod
+    async def invalidate(cls, entitlement_id: str):
+        """
+        删除单个权益的计数器，下次使用时从数据库重新加载
+        管理员修改剩余次数时：修改前调用 flush，修改后调用本方法
+        """
+        try:
+            await Cache.delete(cls._counter_key(entitlement_id))
+        except Exception as e:
+            logger.error(f"清除用户权益次数计数器失败: entitlement_id={entitlement_id}, error={str(e)}")
+
+    @classmethod
+    async def clear(cls):
+        """清空所有计数器、待回写次数和权益映射（数据库剩余次数刷新后调用）"""
+        try:
+            # 回写与刷新之间产生的使用记录属于刷新前，随计数器一起清除
+            await Cache.delete(QUOTA_PENDING_KEY)
+            count = await Cache.delete_pattern("quota:remaining:*")
+            await Cache.delete_pattern("quota:entitlement:*")
+            logger.info(f"用户权益次数计数器已重置: {count} 个")
+        except Exception as e:
+            logger.error(f"清空用户权益次数计数器失败: {str(e)}")
+
+    @classmethod
+    async def reset(cls, refresh):
+        """
+        每日重置：回写已使用次数 -> 刷新数据库中的剩余次数 -> 清空计数器和权益映射
+        :param refresh: 刷新数据库剩余次数的协程函数（无参数）
+        """
+        try:
+            await cls.flush()
+        except Exception as e:
+            logger.error(f"重置前回写用户权益次数失败: {str(e)}")
+        result = await refresh()
+        await cls.clear()
+        return result
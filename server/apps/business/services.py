@@ -1,6 +1,8 @@
+import os
 import json
 import re
 import random
+import time
 from datetime import datetime, timedelta
 from robyn import Headers, Request, Response, jsonify, status_codes
 from apps.users.models import User
@@ -22,7 +24,6 @@ from apps.business.utils import (
     generate_order_id,
     generate_entitlement_id
 )
-import asyncio
 from sqlalchemy import select, and_
 from core.database import async_sessionmaker
 
@@ -30,6 +31,13 @@ from core.database import async_sessionmaker
 # 设置日志记录器
 logger = setup_logger('business_services')
 
+# 每日刷新用户权益剩余次数时每批更新的数量
+DAILY_REMAINING_REFRESH_CHUNK_SIZE = int(os.getenv('DAILY_REMAINING_REFRESH_CHUNK_SIZE', 5000))
+# 批量生成用户权益时每批处理的订单数量
+BATCH_GENERATE_CHUNK_SIZE = int(os.getenv('BATCH_GENERATE_CHUNK_SIZE', 1000))
+# 批量生成用户权益返回的错误信息条数（完整错误记录见批量生成权益错误表）
+BATCH_GENERATE_MAX_ERROR_MESSAGES = int(os.getenv('BATCH_GENERATE_MAX_ERROR_MESSAGES', 200))
+
 """
     crud -> services -> api
     服务层:根据业务逻辑整合crud数据操作 封装业务方法 可以由上层函数直接调用
@@ -1454,7 +1462,13 @@ async def update_user_entitlement_service(request):
                 }
                 await business_crud.update_order(db, update_data["order_id"], update_order_data)
             try:
+                # 修改剩余次数时，先回写Redis中的已使用次数，修改后清除该权益的计数器
+                if "daily_remaining" in update_data:
+                    from apps.business.quota import EntitlementQuota
+                    await EntitlementQuota.flush()
                 updated_entitlement = await business_crud.update_user_entitlement(db, entitlement_id, update_data)
+                if "daily_remaining" in update_data:
+                    await EntitlementQuota.invalidate(entitlement_id)
                 return ApiResponse.success(
                     data=updated_entitlement.to_dict(),
                     message="用户权益更新成功"
@@ -1663,232 +1677,45 @@ async def get_user_entitlements_by_filter_service(request):
 
 async def sync_orders_to_entitlements_service(max_retries=3):
     """
-    每日同步订单到用户权益服务
-    在每日13:00执行，处理昨日13:00至今日13:00的新订单记录
+    同步订单到用户权益服务
+    从水位线 (created_at, order_id) 开始增量处理新订单，由调度器按 ORDER_SYNC_SCHEDULE 定时执行
     
     Args:
-        max_retries (int): 最大重试次数，默认为3次
+        max_retries (int): 单个订单的最大重试次数，默认为3次
     """
     try:
-        # 计算时间范围
-        now = datetime.utcnow()
-        today_13 = now.replace(hour=13, minute=0, second=0, microsecond=0)
-        yesterday_13 = today_13 - timedelta(days=1)
-        
-        # 初始化统计信息
-        stats = {
-            "total_processed": 0,
-            "created_entitlements": 0,
-            "deleted_entitlements": 0,
-            "failed_records": []
-        }
-        
-        async with AsyncSessionLocal() as db:
-            # 查询指定时间范围内的新订单
-            filters = {
-                "created_at": {
-                    "gte": yesterday_13,
-                    "lt": today_13
-                },
-                "is_deleted": False
-            }
-            new_orders = await business_crud.get_orders_by_filters(db, filters)
-            
-            if not new_orders:
-                logger.info("没有需要处理的新订单")
-                return stats
-            
-            for order in new_orders:
-                retry_count = 0
-                success = False
-                
-                while retry_count < max_retries and not success:
-                    try:
-                        # 记录订单信息
-                        order_info = {
-                            "order_id": order.order_id,
-                            "phone": order.phone,
-                            "course_id": order.course_id,
-                            "purchase_time": order.purchase_time,
-                            "is_refund": order.is_refund,
-                            "created_at": order.created_at,
-                            "is_deleted": order.is_deleted
-                        }
-                        logger.info(f"开始处理订单: {order_info}")
-                        
-                        if not order.is_refund:
-                            # 处理未退款的订单，创建用户权益
-                            # 查询对应的权益规则
-                            rule_filters = {
-                                "course_id": order.course_id,
-                                "is_deleted": False
-                            }
-                            rule = await business_crud.get_entitlement_rule_by_filter(db, rule_filters)
-                            
-                            if not rule:
-                                logger.warning(f"未找到课程ID {order.course_id} 对应的权益规则")
-                                stats["failed_records"].append({
-                                    "order": order_info,
-                                    "error": "未找到对应的权益规则"
-                                })
-                                break
-                            
-                            # 检查是否已存在相同的用户权益
-                            entitlement_filters = {
-                                "phone": order.phone,
-                                "rule_id": rule.rule_id,
-                                "is_deleted": False
-                            }
-                            existing_entitlement = await business_crud.get_user_entitlement_by_filter(db, entitlement_filters)
-                            
-                            if existing_entitlement:
-                                logger.info(f"用户 {order.phone} 已存在相同的权益记录")
-                                success = True
-                                break
-                            
-                            # 创建新的用户权益
-                            start_date = datetime.utcnow()
-                            end_date = start_date + timedelta(days=rule.validity_days)
-                            
-                            entitlement_data = {
-                                "entitlement_id": generate_entitlement_id(),
-                                "phone": order.phone,
-                                "rule_id": rule.rule_id,
-                                "course_name": rule.course_name,
-                                "product_name": rule.product_name,
-                                "ai_product_id": rule.ai_product_id,
-                                "start_date": start_date,
-                                "end_date": end_date,
-                                "is_active": False,
-                                "daily_remaining": rule.daily_limit,
-                                "is_deleted": False
-                            }
-                            
-                            await business_crud.create_user_entitlement(db, entitlement_data)
-                            logger.info(f"为用户 {order.phone} 创建权益记录成功")
-                            stats["created_entitlements"] += 1
-                            success = True
-                            
-                        else:
-                            # 处理已退款的订单，删除对应的用户权益
-                            # 查询对应的权益规则
-                            rule_filters = {
-                                "course_id": order.course_id,
-                                "is_deleted": False
-                            }
-                            rule = await business_crud.get_entitlement_rule_by_filter(db, rule_filters)
-                            
-                            if not rule:
-                                logger.warning(f"未找到课程ID {order.course_id} 对应的权益规则")
-                                stats["failed_records"].append({
-                                    "order": order_info,
-                                    "error": "未找到对应的权益规则"
-                                })
-                                break
-                            
-                            # 查询并删除对应的用户权益
-                            entitlement_filters = {
-                                "phone": order.phone,
-                                "rule_id": rule.rule_id,
-                                "is_deleted": False
-                            }
-                            entitlement = await business_crud.get_user_entitlement_by_filter(db, entitlement_filters)
-                            
-                            if entitlement:
-                                await business_crud.update_user_entitlement(db, entitlement.entitlement_id, {"is_deleted": True})
-                                logger.info(f"已删除用户 {order.phone} 的权益记录")
-                                stats["deleted_entitlements"] += 1
-                                success = True
-                            else:
-                                logger.warning(f"未找到用户 {order.phone} 对应的权益记录")
-                                success = True  # 视为成功，因为可能已经删除
-                                
-                    except Exception as e:
-                        retry_count += 1
-                        error_msg = f"处理订单 {order.order_id} 时发生错误: {str(e)}"
-                        logger.error(error_msg)
-                        
-                        if retry_count >= max_retries:
-                            stats["failed_records"].append({
-                                "order": order_info,
-                                "error": error_msg,
-                                "retry_count": retry_count
-                            })
-                            break
-                        
-                        # 等待一段时间后重试
-                        await asyncio.sleep(2 ** retry_count)  # 指数退避
-                        continue
-                
-                stats["total_processed"] += 1
-                
-            # 记录最终统计信息
-            logger.info(f"""
-            订单同步到用户权益处理完成:
-            总处理记录数: {stats["total_processed"]}
-            新创建权益记录数: {stats["created_entitlements"]}
-            删除权益记录数: {stats["deleted_entitlements"]}
-            处理失败记录数: {len(stats["failed_records"])}
-            """)
-            
-            if stats["failed_records"]:
-                logger.warning("处理失败的记录:")
-                for record in stats["failed_records"]:
-                    logger.warning(f"订单ID: {record['order']['order_id']}, 错误: {record['error']}")
-            
-            return stats
-            
+        from apps.business.order_sync import OrderSyncWorker
+        return await OrderSyncWorker.run_once(max_retries)
     except Exception as e:
         logger.error(f"同步订单到用户权益服务异常: {str(e)}")
         raise
 
+async def refresh_daily_remaining(trigger: str) -> dict:
+    """
+    将所有未删除且在有效期内的用户权益的daily_remaining刷新为对应权益规则的daily_limit
+    :param trigger: 触发方式（schedule/manual），用于日志
+    :return: 刷新统计 {"scanned", "updated", "chunks", "duration_ms"}
+    """
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        stats = await business_crud.refresh_user_entitlements_daily_remaining(
+            session, datetime.utcnow(), DAILY_REMAINING_REFRESH_CHUNK_SIZE
+        )
+    stats["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(
+        f"刷新用户权益剩余次数完成（{trigger}）: 扫描 {stats['scanned']} 条, 更新 {stats['updated']} 条, "
+        f"{stats['chunks']} 批, 耗时 {stats['duration_ms']}ms"
+    )
+    return stats
+
 async def update_daily_remaining_service():
     """
     更新用户权益每日剩余次数的服务
     每日0点自动将所有未删除且在有效期内的用户权益的daily_remaining更新为对应权益规则的daily_limit
+    :return: 刷新统计，失败时返回False
     """
     try:
-        from datetime import datetime
-        from sqlalchemy import select, and_
-        from core.database import AsyncSessionLocal
-        from apps.business.models import User_entitlements, Entitlement_rules
-        
-        async with AsyncSessionLocal() as session:
-            # 查询所有未删除且在有效期内的用户权益
-            now = datetime.utcnow()
-            active_entitlements = await session.execute(
-                select(User_entitlements).where(
-                    and_(
-                        User_entitlements.is_deleted == False,
-                        User_entitlements.start_date <= now,
-                        User_entitlements.end_date >= now
-                    )
-                )
-            )
-            active_entitlements = active_entitlements.scalars().all()
-            
-            # 更新每个用户权益的daily_remaining
-            for entitlement in active_entitlements:
-                # 获取对应的权益规则
-                rule = await session.execute(
-                    select(Entitlement_rules).where(
-                        and_(
-                            Entitlement_rules.rule_id == entitlement.rule_id,
-                            Entitlement_rules.is_deleted == False
-                        )
-                    )
-                )
-                rule = rule.scalar_one_or_none()
-                
-                if rule:
-                    # 更新daily_remaining为daily_limit
-                    entitlement.daily_remaining = rule.daily_limit
-            
-            # 提交更改
-            await session.commit()
-            
-            logger.info(f"Successfully updated daily remaining for {len(active_entitlements)} user entitlements")
-            return True
+        return await refresh_daily_remaining("schedule")
     except Exception as e:
         logger.error(f"Error updating daily remaining: {str(e)}")
         return False
@@ -1987,90 +1814,83 @@ async def generate_user_entitlement_from_order_service(request):
             status_code=status_codes.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+async def load_entitlement_rules_by_course(db: AsyncSession, course_ids: list = None):
+    """
+    预加载未删除的权益规则
+    :param course_ids: 只加载这些课程的权益规则，为None时加载全部
+    :return: (课程ID -> 权益规则, 对应多条权益规则的课程ID集合)
+    """
+    if course_ids is None:
+        rules = await business_crud.get_entitlement_rules_by_filters(db, filters={"is_deleted": False})
+    else:
+        rules = await business_crud.get_entitlement_rules_by_course_ids(db, course_ids)
+    rules_by_course = {}
+    duplicated_courses = set()
+    for rule in rules:
+        if rule.course_id in rules_by_course:
+            duplicated_courses.add(rule.course_id)
+        rules_by_course[rule.course_id] = rule
+    return rules_by_course, duplicated_courses
+
 async def batch_generate_user_entitlements_service(request):
     """
     批量根据订单生成用户权益服务
+    按订单ID游标分批遍历订单（不限制总数），权益规则一次性预加载，
+    每批的用户权益、订单状态和错误记录在一个事务内批量写入；
+    返回失败总数和前 BATCH_GENERATE_MAX_ERROR_MESSAGES 条错误信息
     """
     try:
+        stats = {"total": 0, "success": 0, "update": 0, "error": 0, "error_messages": []}
+
+        def add_error(errors: list, order_id: str, error_message: str):
+            stats["error"] += 1
+            if len(stats["error_messages"]) < BATCH_GENERATE_MAX_ERROR_MESSAGES:
+                stats["error_messages"].append(error_message)
+            errors.append({"order_id": order_id, "error_message": error_message[:255]})
+
+        async def fail_chunk(db, order_ids: list, errors: list, reason: str):
+            # 一批写入失败时整批回滚，该批订单均记为失败，错误记录单独写入
+            for order_id in order_ids:
+                add_error(errors, order_id, f"订单 {order_id} 生成权益失败: {reason}")
+            try:
+                await business_crud.apply_entitlement_chunk(db, errors=errors)
+            except Exception as e:
+                logger.error(f"写入批量生成权益错误记录失败: {str(e)}")
+
         async with AsyncSessionLocal() as db:
-            # 获取所有未生成权益的订单，不使用分页
-            filters1 = {
-                "is_generate": False,
-                "is_deleted": False
-            }
-            # 使用 get_orders_by_filters 函数，但设置 page_size 为一个大数以确保获取所有记录
-            orders, total_count = await business_crud.get_orders_by_filters(
-                db, 
-                filters=filters1,
-                page=1,
-                page_size=10000  # 设置一个足够大的数来获取所有记录
-            )
-            # 更新退款订单的用户权益
-            filters2 = {
-                "is_generate": True,
-                "is_refund": True,
-                "is_deleted": False
-            }
-            # 使用 get_orders_by_filters 函数，但设置 page_size 为一个大数以确保获取所有记录
-            orders2, total_count2 = await business_crud.get_orders_by_filters(
-                db, 
-                filters=filters2,
-                page=1,
-                page_size=10000  # 设置一个足够大的数来获取所有记录
-            )
-            
-            if not orders and not orders2:
-                return ApiResponse.success(
-                    message="没有需要生成权益的订单",
-                    data={
-                        "total": 0,
-                        "success": 0,
-                        "error": 0,
-                        "error_messages": []
-                    }
-                )
-            
-            success_count = 0
-            error_count = 0
-            update_count = 0
-            error_messages = []
-            
-            for order in orders:
-                try:
+            rules_by_course, duplicated_courses = await load_entitlement_rules_by_course(db)
+
+            # 未生成权益的订单：生成用户权益
+            last_order_id = None
+            while True:
+                orders = await business_crud.get_orders_after(
+                    db,
+                    filters={"is_generate": False, "is_deleted": False},
+                    after_order_id=last_order_id,
+                    limit=BATCH_GENERATE_CHUNK_SIZE
+                )
+                if not orders:
+                    break
+                last_order_id = orders[-1].order_id
+                stats["total"] += len(orders)
+
+                entitlements, generated_order_ids, errors = [], [], []
+                start_date = datetime.utcnow()
+                for order in orders:
                     # 检查订单是否已退款
                     if order.is_refund:
-                        error_message = f"订单 {order.order_id} 已退款，无法生成权益"
-                        error_messages.append(error_message)
-                        error_count += 1
-                        # 记录错误
-                        await business_crud.create_batch_generate_error(db, {
-                            "order_id": order.order_id,
-                            "error_message": error_message
-                        })
+                        add_error(errors, order.order_id, f"订单 {order.order_id} 已退款，无法生成权益")
                         continue
-                    
                     # 根据course_id查询权益规则
-                    rule = await business_crud.get_entitlement_rule_by_filter(
-                        db, 
-                        {"course_id": order.course_id, "is_deleted": False}
-                    )
+                    rule = rules_by_course.get(order.course_id)
                     if not rule:
-                        error_message = f"订单 {order.order_id} 未找到对应的权益规则"
-                        error_messages.append(error_message)
-                        error_count += 1
-                        # 记录错误
-                        await business_crud.create_batch_generate_error(db, {
-                            "order_id": order.order_id,
-                            "error_message": error_message
-                        })
+                        add_error(errors, order.order_id, f"订单 {order.order_id} 未找到对应的权益规则")
                         continue
-                    
-                    # 计算权益有效期
-                    start_date = datetime.utcnow()
-                    end_date = start_date + timedelta(days=rule.validity_days)
-                    
-                    # 准备用户权益数据
-                    entitlement_data = {
+                    if order.course_id in duplicated_courses:
+                        add_error(errors, order.order_id, f"订单 {order.order_id} 对应多条权益规则")
+                        continue
+
+                    entitlements.append({
                         "entitlement_id": generate_entitlement_id(),
                         "phone": order.phone,
                         "order_id": order.order_id,
@@ -2079,64 +1899,80 @@ async def batch_generate_user_entitlements_service(request):
                         "product_name": rule.product_name,
                         "ai_product_id": rule.ai_product_id,
                         "start_date": start_date,
-                        "end_date": end_date,
+                        "end_date": start_date + timedelta(days=rule.validity_days),
                         "is_active": True,
                         "daily_remaining": rule.daily_limit,
+                        "created_at": start_date,
                         "is_deleted": False
-                    }
-                    
-                    # 创建用户权益
-                    await business_crud.create_user_entitlement(db, entitlement_data)
-                    
-                    # 更新订单的is_generate状态
-                    await business_crud.update_order(db, order.order_id, {"is_generate": True})
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"生成订单 {order.order_id} 的权益失败: {str(e)}")
-                    error_message = f"订单 {order.order_id} 生成权益失败: {str(e)}"
-                    error_messages.append(error_message)
-                    error_count += 1
-                    # 记录错误
-                    await business_crud.create_batch_generate_error(db, {
-                        "order_id": order.order_id,
-                        "error_message": error_message
                     })
-                    continue
+                    generated_order_ids.append(order.order_id)
 
-            # 更新退款订单的用户权益
-            for order in orders2:
-                entitlement = await business_crud.get_user_entitlement_by_filter(db, {"order_id": order.order_id, "is_deleted": False})
-                if entitlement:
-                    await business_crud.update_user_entitlement(db, entitlement.entitlement_id, {"is_active": False, "is_deleted": True})
-                    await business_crud.update_order(db, order.order_id, {"is_generate": False})
-                    success_count += 1
-                    update_count += 1   
-                else:
-                    error_message = f"订单 {order.order_id} 未找到对应的权益"
-                    error_messages.append(error_message)
-                    error_count += 1
-                    # 记录错误
-                    await business_crud.create_batch_generate_error(db, {
-                        "order_id": order.order_id,
-                        "error_message": error_message
-                    })
+                try:
+                    await business_crud.apply_entitlement_chunk(
+                        db, entitlements=entitlements, generated_order_ids=generated_order_ids, errors=errors
+                    )
+                    stats["success"] += len(entitlements)
+                except Exception as e:
+                    logger.error(f"批量写入用户权益失败: {str(e)}")
+                    await fail_chunk(db, generated_order_ids, errors, str(e))
 
-            
-            # 返回处理结果
+                if len(orders) < BATCH_GENERATE_CHUNK_SIZE:
+                    break
+
+            # 已生成权益但已退款的订单：删除对应的用户权益
+            last_order_id = None
+            while True:
+                orders = await business_crud.get_orders_after(
+                    db,
+                    filters={"is_generate": True, "is_refund": True, "is_deleted": False},
+                    after_order_id=last_order_id,
+                    limit=BATCH_GENERATE_CHUNK_SIZE
+                )
+                if not orders:
+                    break
+                last_order_id = orders[-1].order_id
+                stats["total"] += len(orders)
+
+                order_ids = [order.order_id for order in orders]
+                found = await business_crud.get_active_entitlement_order_ids(db, order_ids)
+                revoked_order_ids, errors = [], []
+                for order_id in order_ids:
+                    if order_id in found:
+                        revoked_order_ids.append(order_id)
+                    else:
+                        add_error(errors, order_id, f"订单 {order_id} 未找到对应的权益")
+
+                try:
+                    await business_crud.apply_entitlement_chunk(
+                        db, revoked_order_ids=revoked_order_ids, errors=errors
+                    )
+                    stats["success"] += len(revoked_order_ids)
+                    stats["update"] += len(revoked_order_ids)
+                except Exception as e:
+                    logger.error(f"批量更新退款订单权益失败: {str(e)}")
+                    await fail_chunk(db, revoked_order_ids, errors, str(e))
+
+                if len(orders) < BATCH_GENERATE_CHUNK_SIZE:
+                    break
+
+        if stats["total"] == 0:
             return ApiResponse.success(
+                message="没有需要生成权益的订单",
                 data={
-                    "total": total_count + total_count2,
-                    "success": success_count,
-                    "update": update_count,
-                    "error": error_count,
-                    "error_messages": error_messages
-                },
-                message=f"成功生成 {success_count} 条用户权益，更新 {update_count} 条用户权益，失败 {error_count} 条"
+                    "total": 0,
+                    "success": 0,
+                    "error": 0,
+                    "error_messages": []
+                }
             )
-        
-        
+
+        logger.info(f"批量生成用户权益完成: 订单 {stats['total']} 条, 成功 {stats['success']} 条, "
+                    f"更新 {stats['update']} 条, 失败 {stats['error']} 条")
+        return ApiResponse.success(
+            data=stats,
+            message=f"成功生成 {stats['success']} 条用户权益，更新 {stats['update']} 条用户权益，失败 {stats['error']} 条"
+        )
+
     except Exception as e:
         logger.error(f"批量生成用户权益服务异常: {str(e)}")
         return ApiResponse.error(
@@ -2853,44 +2689,20 @@ async def manual_refresh_daily_remaining_service(request):
     手动刷新所有生效中用户权益的剩余额度
     """
     try:
-        from datetime import datetime
-        from sqlalchemy import select, and_
-        from core.database import AsyncSessionLocal
-        from apps.business.models import User_entitlements, Entitlement_rules
-
-        async with AsyncSessionLocal() as session:
-            now = datetime.utcnow()
-            # 查询所有未删除且在有效期内的用户权益
-            active_entitlements = await session.execute(
-                select(User_entitlements).where(
-                    and_(
-                        User_entitlements.is_deleted == False,
-                        User_entitlements.start_date <= now,
-                        User_entitlements.end_date >= now
-                    )
-                )
-            )
-            active_entitlements = active_entitlements.scalars().all()
-
-            # 更新每个用户权益的daily_remaining
-            for entitlement in active_entitlements:
-                rule = await session.execute(
-                    select(Entitlement_rules).where(
-                        and_(
-                            Entitlement_rules.rule_id == entitlement.rule_id,
-                            Entitlement_rules.is_deleted == False
-                        )
-                    )
-                )
-                rule = rule.scalar_one_or_none()
-                if rule:
-                    entitlement.daily_remaining = rule.daily_limit
+        from apps.business.quota import EntitlementQuota
 
-            await session.commit()
-            logger.info(f"手动刷新成功，共刷新 {len(active_entitlements)} 条用户权益")
-            return ApiResponse.success(
-                message=f"手动刷新成功，共刷新 {len(active_entitlements)} 条用户权益"
-            )
+        # 刷新前先回写Redis中的已使用次数
+        try:
+            await EntitlementQuota.flush()
+        except Exception as e:
+            logger.error(f"刷新前回写用户权益次数失败: {str(e)}")
+
+        stats = await refresh_daily_remaining("manual")
+        await EntitlementQuota.clear()
+        return ApiResponse.success(
+            data=stats,
+            message=f"手动刷新成功，共刷新 {stats['updated']} 条用户权益"
+        )
     except Exception as e:
         logger.error(f"手动刷新用户权益额度异常: {str(e)}")
         return ApiResponse.error(
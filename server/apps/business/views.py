@@ -2,11 +2,8 @@ from robyn import Request, Response, status_codes
 from core.response import ApiResponse
 from core.middleware import error_handler, request_logger, auth_required, admin_required
 from core.logger import setup_logger
-from common.utils.r_excel import ExcelReader
-from apps.business import crud as business_crud
-from core.database import AsyncSessionLocal
-import json
-from datetime import datetime
+from apps.business.order_import import OrderImportJob
+from core.scheduler import Scheduler
 
 logger = setup_logger('business_views')
 
@@ -16,7 +13,8 @@ logger = setup_logger('business_views')
 # @admin_required
 async def upload_orders_excel(request: Request) -> Response:
     """
-    上传Excel文件并处理订单数据
+    上传Excel文件并在后台导入订单数据
+    返回导入任务，通过 /orders/upload/:job_id 查询导入进度
     """
     try:
         # 记录请求信息
@@ -46,167 +44,63 @@ async def upload_orders_excel(request: Request) -> Response:
             logger.error(f"文件类型不正确: {file_name}")
             return ApiResponse.validation_error("请上传Excel格式的文件(.xlsx或.xls)")
             
-        # 处理Excel文件
-        try:
-            # 确保文件内容是字节类型
-            if not isinstance(file_content, bytes):
-                file_content = file_content.encode('utf-8')
-                
-            orders = ExcelReader.process_uploaded_excel(file_content)
-            
-            if not orders:
-                logger.error("Excel文件中没有有效的订单数据")
-                return ApiResponse.error(
-                    message="Excel文件中没有有效的订单数据",
-                    status_code=400
-                )
-                
-            # 保存订单数据
-            async with AsyncSessionLocal() as db:
-                success_count = 0
-                error_count = 0
-                update_count = 0
-                error_messages = []
-                
-                for order in orders:
-                    try:
-                        order_id = order.get("order_id")
-                        phone = order.get("phone")
-                        course_name = order.get("course_name")
-                        purchase_time = order.get("purchase_time")
-                        is_refund = order.get("is_refund")
-                        if is_refund is False:
-                            order["is_refund"] = "无"
-                            is_refund = "无"
-                        if is_refund is True:
-                            order["is_refund"] = "已退款"
-                            is_refund = "已退款"
-                        
-                        if not all([order_id, phone, course_name, purchase_time, is_refund]):
-                            error_message = f"订单 {order_id} 数据不完整"
-                            error_messages.append(error_message)
-                            error_count += 1
-                            # 记录错误订单
-                            await business_crud.create_upload_error_order(db, {
-                                "order_id": order_id or "未知",
-                                "error_message": error_message
-                            })
-                            continue
-                            
-                        # 标准化课程名称（移除多余空格）
-                        course_name = ' '.join(course_name.split())
-                        
-                        # 转换is_refund为布尔值
-                        is_refund_bool = True if is_refund == "已退款" else False
-                            
-                        
-                        # 转换purchase_time为datetime对象
-                        try:
-                            purchase_time_dt = datetime.strptime(purchase_time, "%Y-%m-%d %H:%M:%S")
-                        except ValueError as e:
-                            error_message = f"订单 {order_id} 购买时间格式错误"
-                            error_messages.append(error_message)
-                            error_count += 1
-                            # 记录错误订单
-                            await business_crud.create_upload_error_order(db, {
-                                "order_id": order_id,
-                                "error_message": error_message
-                            })
-                            continue
-                            
-                        # 根据课程名称获取课程ID
-                        course = await business_crud.get_course_by_filter(db, {"course_name": course_name})
-                        if not course:
-                            error_message = f"订单 {order_id} 的课程 {course_name} 不存在"
-                            error_messages.append(error_message)
-                            error_count += 1
-                            # 记录错误订单
-                            await business_crud.create_upload_error_order(db, {
-                                "order_id": order_id,
-                                "error_message": error_message
-                            })
-                            continue
-                        
-                        # 检查订单号是否已存在
-                        existing_order = await business_crud.get_order(db, order_id)
-                        if existing_order and existing_order.is_refund is False and is_refund_bool is True:
-                            # 更新订单状态
-                            update_order_data = {
-                                "is_refund": is_refund_bool
-                            }
-                            await business_crud.update_order(db, existing_order.order_id, update_order_data)
-                            update_count += 1
-                            success_count += 1
-                            continue
-                        elif existing_order and existing_order.is_refund is False and is_refund_bool is False:
-                            error_message = f"订单 {order_id} 已存在"
-                            error_messages.append(error_message)
-                            error_count += 1
-                            # 记录错误订单
-                            await business_crud.create_upload_error_order(db, {
-                                "order_id": order_id,
-                                "error_message": error_message
-                            })
-                            continue
-                        
-                        if is_refund_bool is True:
-                            error_message = f"订单 {order_id} 已退款"
-                            error_messages.append(error_message)
-                            error_count += 1
-                            # 记录错误订单
-                            await business_crud.create_upload_error_order(db, {
-                                "order_id": order_id,
-                                "error_message": error_message
-                            })
-                            continue
+        # 确保文件内容是字节类型
+        if not isinstance(file_content, bytes):
+            file_content = file_content.encode('utf-8')
 
-                        # 准备订单数据
-                        order_data = {
-                            "order_id": order_id,
-                            "phone": phone,
-                            "course_id": course.course_id,
-                            "purchase_time": purchase_time_dt,
-                            "is_refund": is_refund_bool,
-                            "is_deleted": False
-                        }
-                        
-                        # 创建订单
-                        await business_crud.create_order(db, order_data)
-                        success_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"保存订单失败: {str(e)}")
-                        error_message = f"订单 {order.get('order_id', '未知')} 保存失败: {str(e)}"
-                        error_messages.append(error_message)
-                        error_count += 1
-                        # 记录错误订单
-                        await business_crud.create_upload_error_order(db, {
-                            "order_id": order.get('order_id', '未知'),
-                            "error_message": error_message
-                        })
-                        
-                # 返回处理结果
-                return ApiResponse.success(
-                    data={
-                        "total": len(orders),
-                        "success": success_count,
-                        "update": update_count,
-                        "error": error_count,
-                        "error_messages": error_messages
-                    },
-                    message=f"成功导入 {success_count} 条订单数据，更新 {update_count} 条订单数据，失败 {error_count} 条"
-                )
-                
-        except Exception as e:
-            logger.error(f"处理Excel文件失败: {str(e)}")
-            return ApiResponse.error(
-                message="处理Excel文件失败",
-                status_code=500
-            )
+        # 创建后台导入任务，通过任务ID查询进度
+        job = await OrderImportJob.create(file_name, file_content)
+        return ApiResponse.success(
+            data=job,
+            message="订单导入任务已创建"
+        )
             
     except Exception as e:
         logger.error(f"上传订单Excel文件失败: {str(e)}")
         return ApiResponse.error(
             message="上传订单Excel文件失败",
             status_code=500
-        ) 
\ No newline at end of file
+        )
+
+@error_handler
+@request_logger
+# @auth_required
+# @admin_required
+async def get_order_import_job(request: Request) -> Response:
+    """
+    查询订单导入任务进度
+    """
+    job_id = request.path_params.get("job_id")
+    if not job_id:
+        return ApiResponse.validation_error("任务ID不能为空")
+    try:
+        job = await OrderImportJob.get(job_id)
+    except Exception as e:
+        logger.error(f"查询订单导入任务失败: {str(e)}")
+        return ApiResponse.error(message="查询订单导入任务失败", status_code=500)
+    if not job:
+        return ApiResponse.not_found("订单导入任务不存在或已过期")
+    return ApiResponse.success(data=job)
+
+@error_handler
+@request_logger
+# @auth_required
+# @admin_required
+async def get_scheduler_job_runs(request: Request) -> Response:
+    """
+    查询定时任务执行记录（按计划时间倒序）
+    查询参数: job_name（可选，任务名称）, limit（默认50，最大200）
+    """
+    job_name = request.query_params.get("job_name", None)
+    try:
+        limit = int(request.query_params.get("limit", "50"))
+    except ValueError:
+        limit = 50
+    if limit < 1 or limit > 200:
+        limit = 50
+    try:
+        runs = await Scheduler.get_runs(job_name, limit)
+    except Exception as e:
+        logger.error(f"查询定时任务执行记录失败: {str(e)}")
+        return ApiResponse.error(message="查询定时任务执行记录失败", status_code=500)
+    return ApiResponse.success(data=runs)
@@ -0,0 +1,82 @@
+"""
+kalodata 指标数值列回填任务
+
+按主键分批把历史数据的字符串指标解析到数值列，在后台运行
+"""
+import asyncio
+from datetime import datetime
+from core.database import AsyncSessionLocal
+from core.logger import setup_logger
+from apps.search_video import crud as video_search_crud
+from apps.search_video.top_index import TopVideoIndex
+
+logger = setup_logger('kalodata_backfill')
+
+
+class NumericBackfillJob:
+    """
+    指标数值列回填任务（进程内单例）
+    """
+    _task = None
+    _state = {
+        "status": "idle",
+        "processed": 0,
+        "last_id": 0,
+        "error": None,
+        "started_at": None,
+        "finished_at": None
+    }
+
+    @classmethod
+    def is_running(cls) -> bool:
+        return cls._task is not None and not cls._task.done()
+
+    @classmethod
+    def start(cls, batch_size: int = 500, start_id: int = 0) -> bool:
+        """
+        在后台启动回填任务
+        :return: 是否启动成功（任务已在运行时返回False）
+        """
+        if cls.is_running():
+            return False
+        cls._state.update({
+            "status": "running",
+            "processed": 0,
+            "last_id": start_id,
+            "error": None,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None
+        })
+        cls._task = asyncio.create_task(cls._run(batch_size))
+        return True
+
+    @classmethod
+    def status(cls) -> dict:
+        return dict(cls._state)
+
+    @classmethod
+    async def _run(cls, batch_size: int):
+        try:
+            while True:
+                async with AsyncSessionLocal() as db:
+                    count, last_id = await video_search_crud.backfill_kalodata_numeric_columns(
+                        db, cls._state["last_id"], batch_size
+                    )
+                if count == 0:
+                    break
+                cls._state["processed"] += count
+                cls._state["last_id"] = last_id
+                logger.info(f"kalodata数值列回填进度: 已处理 {cls._state['processed']} 条，last_id={last_id}")
+                # 让出事件循环，避免长时间占用数据库连接
+                await asyncio.sleep(0)
+
+            # 数值列变化后top视频索引的排序随之变化
+            await TopVideoIndex.invalidate_all()
+            cls._state["status"] = "completed"
+            logger.info(f"kalodata数值列回填完成: 共处理 {cls._state['processed']} 条")
+        except Exception as e:
+            cls._state["status"] = "failed"
+            cls._state["error"] = str(e)
+            logger.error(f"kalodata数值列回填失败: {str(e)}")
+        finally:
+            cls._state["finished_at"] = datetime.now().isoformat()
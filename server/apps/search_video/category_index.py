@@ -0,0 +1,178 @@
+"""
+类目树内存索引
+
+类目树几乎不变，启动时一次性加载到进程内的不可变索引中：
+label/value 映射、父子邻接表以及类目接口的响应JSON都预先构建好，
+类目接口、对标视频搜索和入库/爬取流程都从这里读取，不再查询数据库。
+管理员修改类目后通过 reload 接口重新加载
+"""
+import os
+import json
+import asyncio
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+from core.database import AsyncSessionLocal
+from core.logger import setup_logger
+
+logger = setup_logger('category_index')
+
+# 数据库中没有类目数据时使用的类目文件
+CATEGORY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "cates.txt")
+
+
+class CategoryNode(NamedTuple):
+    """类目节点"""
+    id: Optional[int]
+    label: str
+    value: str
+    parent_value: Optional[str] = None
+
+    def to_dict(self):
+        """转换为字典（与类目模型的to_dict一致）"""
+        data = {"id": self.id, "label": self.label, "value": self.value}
+        if self.parent_value is not None:
+            data["parent_value"] = self.parent_value
+        return data
+
+
+def _success_body(data, message: str) -> str:
+    """构建与ApiResponse.success一致的响应JSON"""
+    return json.dumps({"code": 200, "message": message, "data": data}, ensure_ascii=False)
+
+
+class CategoryIndex:
+    """
+    不可变的类目树索引
+    """
+
+    def __init__(self, level1: list, level2: list, level3: list):
+        self.level1 = tuple(level1)
+        self.level2 = tuple(level2)
+        self.level3 = tuple(level3)
+
+        self.level1_by_value = MappingProxyType({node.value: node for node in self.level1})
+        self.level2_by_value = MappingProxyType({node.value: node for node in self.level2})
+        self.level3_by_value = MappingProxyType({node.value: node for node in self.level3})
+
+        # 三级类目 label -> value（重名时以后出现的为准）
+        self.level3_label_to_value = MappingProxyType({node.label: node.value for node in self.level3})
+
+        # 父子邻接表
+        children2, children3 = {}, {}
+        for node in self.level2:
+            children2.setdefault(node.parent_value, []).append(node)
+        for node in self.level3:
+            children3.setdefault(node.parent_value, []).append(node)
+        self.level2_children = MappingProxyType({key: tuple(value) for key, value in children2.items()})
+        self.level3_children = MappingProxyType({key: tuple(value) for key, value in children3.items()})
+
+        # 预先构建的类目接口响应
+        self.level1_body = _success_body([node.to_dict() for node in self.level1], "获取所有一级类目成功")
+        self.level2_body = _success_body([node.to_dict() for node in self.level2], "获取所有二级类目成功")
+        self.level3_body = _success_body([node.to_dict() for node in self.level3], "获取所有三级类目成功")
+        self.level2_by_level1_body = MappingProxyType({
+            value: _success_body([node.to_dict() for node in nodes], "获取指定一级类目下的所有二级类目成功")
+            for value, nodes in self.level2_children.items()
+        })
+        self.level3_by_level2_body = MappingProxyType({
+            value: _success_body([node.to_dict() for node in nodes], "获取指定二级类目下的所有三级类目成功")
+            for value, nodes in self.level3_children.items()
+        })
+        self.empty_level2_body = _success_body([], "获取指定一级类目下的所有二级类目成功")
+        self.empty_level3_body = _success_body([], "获取指定二级类目下的所有三级类目成功")
+
+    def lookup_leaf(self, label: str) -> Optional[CategoryNode]:
+        """
+        校验label是否为有效的三级（叶子）类目
+        :return: 对应的类目节点，无效时返回None
+        """
+        value = self.level3_label_to_value.get(label)
+        return self.level3_by_value.get(value) if value is not None else None
+
+    def get_label(self, value: str) -> Optional[str]:
+        """根据类目value获取label（任意层级）"""
+        node = self.level3_by_value.get(value) or self.level2_by_value.get(value) or self.level1_by_value.get(value)
+        return node.label if node else None
+
+    def get_level2_children(self, level1_value: str) -> tuple:
+        """获取一级类目下的所有二级类目"""
+        return self.level2_children.get(level1_value, ())
+
+    def get_level3_children(self, level2_value: str) -> tuple:
+        """获取二级类目下的所有三级类目"""
+        return self.level3_children.get(level2_value, ())
+
+    @classmethod
+    def from_tree(cls, tree: list) -> "CategoryIndex":
+        """从cates.txt格式的类目树构建索引"""
+        level1, level2, level3 = [], [], []
+        for level1_data in tree:
+            level1.append(CategoryNode(None, level1_data['label'], level1_data['value']))
+            for level2_data in level1_data.get('children', []):
+                level2.append(CategoryNode(None, level2_data['label'], level2_data['value'], level1_data['value']))
+                for level3_data in level2_data.get('children', []):
+                    level3.append(CategoryNode(None, level3_data['label'], level3_data['value'], level2_data['value']))
+        return cls(level1, level2, level3)
+
+
+class CategoryRegistry:
+    """
+    进程内类目索引注册表
+    """
+    _index = None
+    _lock = None
+
+    @classmethod
+    def _get_lock(cls) -> asyncio.Lock:
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        return cls._lock
+
+    @classmethod
+    async def get(cls) -> CategoryIndex:
+        """获取类目索引，未加载时先加载"""
+        if cls._index is None:
+            async with cls._get_lock():
+                if cls._index is None:
+                    cls._index = await cls._load()
+        return cls._index
+
+    @classmethod
+    async def lookup_leaf(cls, label: str) -> Optional[CategoryNode]:
+        """校验label是否为有效的三级（叶子）类目，返回对应的类目节点"""
+        index = await cls.get()
+        return index.lookup_leaf(label)
+
+    @classmethod
+    async def reload(cls) -> CategoryIndex:
+        """重新加载类目索引，加载完成后整体替换"""
+        async with cls._get_lock():
+            cls._index = await cls._load()
+        return cls._index
+
+    @classmethod
+    async def _load(cls) -> CategoryIndex:
+        """从数据库加载类目，数据库中没有数据时从类目文件加载"""
+        from apps.search_video import crud as video_search_crud
+
+        try:
+            async with AsyncSessionLocal() as db:
+                level1 = await video_search_crud.get_category_level1(db)
+                level2 = await video_search_crud.get_category_level2(db)
+                level3 = await video_search_crud.get_category_level3(db)
+            if level1 or level2 or level3:
+                index = CategoryIndex(
+                    [CategoryNode(item.id, item.label, item.value) for item in level1],
+                    [CategoryNode(item.id, item.label, item.value, item.parent_value) for item in level2],
+                    [CategoryNode(item.id, item.label, item.value, item.parent_value) for item in level3]
+                )
+                logger.info(f"从数据库加载类目索引: 一级 {len(index.level1)} 个，二级 {len(index.level2)} 个，三级 {len(index.level3)} 个")
+                return index
+            logger.warning("数据库中没有类目数据，从类目文件加载")
+        except Exception as e:
+            logger.error(f"从数据库加载类目失败，从类目文件加载: {str(e)}")
+
+        with open(CATEGORY_FILE, 'r', encoding='utf-8') as f:
+            index = CategoryIndex.from_tree(json.load(f))
+        logger.info(f"从类目文件加载类目索引: 一级 {len(index.level1)} 个，二级 {len(index.level2)} 个，三级 {len(index.level3)} 个")
+        return index
@@ -1,30 +1,13 @@
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser
 import json
 import os
 from typing import Dict, Any
 import asyncio
-# 初始化模型
-async def init_model():
-    try:
-        model = ChatOpenAI(
-            openai_api_key="4a9c6c92-91fa-4087-beb3-4a894d0ce586",
-            openai_api_base="https://ark.cn-beijing.volces.com/api/v3",
-            model_name="doubao-1.5-pro-32k-250115",
-            temperature=0.7,
-            streaming=True
-        )
-        return model
-    except Exception as e:
-        raise Exception(f"模型初始化失败: {str(e)}")
+from core.llm import LLMRegistry
 
-async def shooting_suggestions(product_name, category, country):
-    try:
-         # 定义系统提示词
-        system_prompt_1 = """# 角色
+# 拍摄建议系统提示词
+SYSTEM_PROMPT_SHOOTING = """# 角色
     你是一位在跨境电商领域经验丰富的专业大师，擅长根据电商商品给出拍摄建议及方案。当用户输入商品名称、商品类目和销售国家后，你能够依据这些信息，结合目标国家当地国情及民俗，尊重当地风俗避免文化禁忌，为用户提供精准且具有针对性的拍摄建议。
 
     ## 技能
@@ -45,17 +28,16 @@ async def shooting_suggestions(product_name, category, country):
     - 需充分考虑目标国家当地国情及民俗，尊重当地风俗避免文化禁忌。
     """
 
-        # 定义提示词模板
-        prompt_template1 = ChatPromptTemplate.from_messages([
-            ('system', system_prompt_1),
-            ('user', '商品名称：{product_name}，商品类目：{category}，销售国家：{country}')
-        ])
+# 预先构建的拍摄建议链（导入时构建一次，所有请求复用）
+SHOOTING_SUGGESTIONS_CHAIN = LLMRegistry.build_chain(
+    SYSTEM_PROMPT_SHOOTING,
+    '商品名称：{product_name}，商品类目：{category}，销售国家：{country}',
+    model="doubao-1.5-pro"
+)
 
-        model = await init_model()
-        parser = JsonOutputParser()
-        chain1 = prompt_template1 | model | parser
-
-        Video_suggestions = await chain1.ainvoke({"product_name": product_name, "category": category, "country": country})
+async def shooting_suggestions(product_name, category, country):
+    try:
+        Video_suggestions = await SHOOTING_SUGGESTIONS_CHAIN.ainvoke({"product_name": product_name, "category": category, "country": country})
 
         scenes = Video_suggestions["scenes"]
         style = Video_suggestions["style"]
@@ -0,0 +1,307 @@
+"""
+kalodata 类目批量爬取任务
+
+任务在后台以 asyncio 任务运行：
+- 每个国家一个 worker 池，同一国家的并发数在所有任务间共享
+- 每个 cookie 一个令牌桶，限制对 kalodata 的请求速率
+- 每个(国家, 三级类目)一条检查点记录在数据库中，任务中断后可从检查点继续
+- 任务执行前通过 Redis 锁（SET NX）认领，多个服务进程中同一任务只会有一个在执行，执行期间定时续期
+"""
+import os
+import time
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from core.cache import Cache
+from core.database import AsyncSessionLocal
+from core.logger import setup_logger
+from apps.search_video import crud as video_search_crud
+from apps.search_video.top_index import TopVideoIndex
+from apps.search_video.category_index import CategoryRegistry
+
+logger = setup_logger('kalodata_crawler')
+
+# 每个国家的并发worker数
+CRAWL_WORKERS_PER_COUNTRY = int(os.getenv('KALODATA_CRAWL_WORKERS_PER_COUNTRY', 3))
+# 每个cookie每秒允许开始的类目爬取数
+CRAWL_COOKIE_RATE = float(os.getenv('KALODATA_CRAWL_COOKIE_RATE', 0.25))
+# 每个cookie令牌桶容量（允许的突发数）
+CRAWL_COOKIE_BURST = int(os.getenv('KALODATA_CRAWL_COOKIE_BURST', 2))
+# 任务认领锁的过期时间（秒），执行期间每 1/3 过期时间续期一次；进程退出后锁过期，其他进程可重新认领
+CRAWL_JOB_LOCK_TTL = int(os.getenv('KALODATA_CRAWL_JOB_LOCK_TTL', 120))
+
+# 锁仍由本进程持有时续期
+_RENEW_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+# 锁仍由本进程持有时释放
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class TokenBucket:
+    """
+    异步令牌桶
+    以 rate 个/秒 的速度补充令牌，最多积累 capacity 个
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时等待"""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class CrawlJobManager:
+    """
+    kalodata爬取任务管理器（进程内单例）
+    """
+    _country_semaphores = {}
+    _cookie_buckets = {}
+    _running_jobs = {}
+    _host = f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def _lock_key(job_id: int) -> str:
+        return f"crawl:job:{job_id}"
+
+    @classmethod
+    async def _claim(cls, job_id: int) -> bool:
+        """认领任务，其他进程正在执行时返回False（Redis不可用时直接执行）"""
+        try:
+            return await Cache.set_nx(cls._lock_key(job_id), cls._host, CRAWL_JOB_LOCK_TTL)
+        except Exception as e:
+            logger.error(f"认领kalodata爬取任务失败，直接执行: job_id={job_id}, error={str(e)}")
+            return True
+
+    @classmethod
+    async def _renew_claim(cls, job_id: int):
+        """任务执行期间定时续期认领锁"""
+        while True:
+            await asyncio.sleep(CRAWL_JOB_LOCK_TTL / 3)
+            try:
+                if not await Cache.eval(_RENEW_LOCK_SCRIPT, [cls._lock_key(job_id)], [cls._host, CRAWL_JOB_LOCK_TTL]):
+                    logger.warning(f"kalodata爬取任务认领锁已失效: job_id={job_id}")
+            except Exception as e:
+                logger.error(f"续期kalodata爬取任务认领锁失败: job_id={job_id}, error={str(e)}")
+
+    @classmethod
+    async def _release_claim(cls, job_id: int):
+        try:
+            await Cache.eval(_RELEASE_LOCK_SCRIPT, [cls._lock_key(job_id)], [cls._host])
+        except Exception as e:
+            logger.error(f"释放kalodata爬取任务认领锁失败: job_id={job_id}, error={str(e)}")
+
+    @classmethod
+    def _get_country_semaphore(cls, country: str) -> asyncio.Semaphore:
+        """获取国家对应的并发信号量"""
+        if country not in cls._country_semaphores:
+            cls._country_semaphores[country] = asyncio.Semaphore(CRAWL_WORKERS_PER_COUNTRY)
+        return cls._country_semaphores[country]
+
+    @classmethod
+    def _get_cookie_bucket(cls, cookie: str) -> TokenBucket:
+        """获取cookie对应的令牌桶"""
+        if cookie not in cls._cookie_buckets:
+            cls._cookie_buckets[cookie] = TokenBucket(CRAWL_COOKIE_RATE, CRAWL_COOKIE_BURST)
+        return cls._cookie_buckets[cookie]
+
+    @classmethod
+    def is_running(cls, job_id: int) -> bool:
+        """任务是否正在本进程中运行"""
+        task = cls._running_jobs.get(job_id)
+        return task is not None and not task.done()
+
+    @classmethod
+    async def create_job(cls, cookie: str, countries: list, start_date: str = None, end_date: str = None, category_values: list = None):
+        """
+        创建爬取任务并在后台启动
+        
+        参数:
+            cookie: kalodata cookie
+            countries: 国家代码列表
+            start_date: 开始日期，默认7天前
+            end_date: 结束日期，默认今天
+            category_values: 指定的三级类目value列表，默认全部三级类目
+        
+        返回:
+            Kalodata_crawl_job: 创建的任务
+        """
+        end_date = end_date or datetime.now().strftime("%Y-%m-%d")
+        start_date = start_date or (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+
+        async with AsyncSessionLocal() as db:
+            if not category_values:
+                category_index = await CategoryRegistry.get()
+                category_values = [category.value for category in category_index.level3]
+            if not category_values:
+                raise ValueError("未找到任何三级类目数据")
+
+            tasks = [(country, category_value) for country in countries for category_value in category_values]
+            job = await video_search_crud.create_crawl_job(db, {
+                "countries": ",".join(countries),
+                "cookie": cookie,
+                "start_date": start_date,
+                "end_date": end_date
+            }, tasks)
+
+        logger.info(f"创建kalodata爬取任务: job_id={job.id}, countries={countries}, 类目任务数={len(tasks)}")
+        cls.start(job.id)
+        return job
+
+    @classmethod
+    def start(cls, job_id: int, retry_failed: bool = False):
+        """
+        在后台启动（或继续）任务
+        :param retry_failed: 是否重试失败的类目
+        :return: 是否启动成功（任务已在运行时返回False）
+        """
+        if cls.is_running(job_id):
+            return False
+        cls._running_jobs[job_id] = asyncio.create_task(cls._run_job(job_id, retry_failed))
+        return True
+
+    @classmethod
+    async def resume_unfinished(cls):
+        """继续所有未结束的任务（用于服务重启后恢复）"""
+        async with AsyncSessionLocal() as db:
+            jobs = []
+            for status in ("pending", "running"):
+                jobs.extend(await video_search_crud.get_crawl_jobs_by_status(db, status))
+        for job in jobs:
+            if cls.start(job.id):
+                logger.info(f"从检查点继续kalodata爬取任务: job_id={job.id}")
+
+    @classmethod
+    async def _run_job(cls, job_id: int, retry_failed: bool):
+        """执行任务：认领后按国家分组，每个国家一个worker池"""
+        if not await cls._claim(job_id):
+            logger.info(f"kalodata爬取任务已由其他进程执行，跳过: job_id={job_id}")
+            cls._running_jobs.pop(job_id, None)
+            return
+        renew_task = asyncio.create_task(cls._renew_claim(job_id))
+        try:
+            async with AsyncSessionLocal() as db:
+                job = await video_search_crud.get_crawl_job(db, job_id)
+                if not job:
+                    logger.error(f"kalodata爬取任务不存在: job_id={job_id}")
+                    return
+                checkpoints = await video_search_crud.get_unfinished_crawl_checkpoints(db, job_id, include_failed=retry_failed)
+                await video_search_crud.update_crawl_job(db, job_id, {
+                    "status": "running",
+                    "started_at": job.started_at or datetime.now(),
+                    "finished_at": None,
+                    "error": None
+                })
+                cookie, start_date, end_date = job.cookie, job.start_date, job.end_date
+
+            # 按国家分组
+            queues = {}
+            for checkpoint in checkpoints:
+                queues.setdefault(checkpoint.country, asyncio.Queue()).put_nowait((checkpoint.id, checkpoint.category_value))
+
+            logger.info(f"开始执行kalodata爬取任务: job_id={job_id}, 待处理类目数={len(checkpoints)}, 国家={list(queues.keys())}")
+
+            workers = [
+                asyncio.create_task(cls._country_worker(job_id, country, queue, cookie, start_date, end_date))
+                for country, queue in queues.items()
+                for _ in range(CRAWL_WORKERS_PER_COUNTRY)
+            ]
+            await asyncio.gather(*workers)
+
+            async with AsyncSessionLocal() as db:
+                await video_search_crud.update_crawl_job(db, job_id, {
+                    "status": "completed",
+                    "finished_at": datetime.now()
+                })
+            logger.info(f"kalodata爬取任务完成: job_id={job_id}")
+        except asyncio.CancelledError:
+            logger.warning(f"kalodata爬取任务被取消: job_id={job_id}")
+            raise
+        except Exception as e:
+            logger.error(f"kalodata爬取任务执行失败: job_id={job_id}, error={str(e)}")
+            try:
+                async with AsyncSessionLocal() as db:
+                    await video_search_crud.update_crawl_job(db, job_id, {
+                        "status": "failed",
+                        "error": str(e)[:1000],
+                        "finished_at": datetime.now()
+                    })
+            except Exception as db_error:
+                logger.error(f"更新kalodata爬取任务状态失败: job_id={job_id}, error={str(db_error)}")
+        finally:
+            renew_task.cancel()
+            await cls._release_claim(job_id)
+            cls._running_jobs.pop(job_id, None)
+
+    @classmethod
+    async def _country_worker(cls, job_id: int, country: str, queue: asyncio.Queue, cookie: str, start_date: str, end_date: str):
+        """国家worker：依次处理队列中的类目，直到队列为空"""
+        semaphore = cls._get_country_semaphore(country)
+        bucket = cls._get_cookie_bucket(cookie)
+        while True:
+            try:
+                checkpoint_id, category_value = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            async with semaphore:
+                await bucket.acquire()
+                try:
+                    success_count, skip_count = await crawl_category(cookie, country, start_date, end_date, category_value)
+                    update_data = {
+                        "status": "done",
+                        "success_count": success_count,
+                        "skip_count": skip_count,
+                        "error": None
+                    }
+                    logger.info(f"类目 {category_value}({country}) 数据处理完成: 新增 {success_count} 条，跳过 {skip_count} 条")
+                except Exception as e:
+                    update_data = {"status": "failed", "error": str(e)[:1000]}
+                    logger.error(f"处理类目 {category_value}({country}) 时发生错误: {str(e)}")
+
+            async with AsyncSessionLocal() as db:
+                await video_search_crud.update_crawl_checkpoint(db, checkpoint_id, update_data)
+
+
+async def crawl_category(cookie: str, country: str, start_date: str, end_date: str, category_value: str) -> tuple:
+    """
+    获取并存储单个三级类目的kalodata数据
+    
+    返回:
+        tuple: (新增条数, 跳过条数)
+    """
+    from apps.search_video.utils import get_complete_video_data, get_category3_label
+    from apps.search_video.services import build_kalodata_rows
+
+    cate_ids = [category_value]
+    video_data = await get_complete_video_data(cookie, country, start_date, end_date, cate_ids)
+    if not video_data:
+        raise RuntimeError("从kalodata获取数据失败，返回数据为空")
+
+    async with AsyncSessionLocal() as db:
+        category3_label = await get_category3_label(db, category_value)
+        rows = await build_kalodata_rows(db, video_data, start_date, end_date, cate_ids, category3_label)
+        success_count, skip_count = await video_search_crud.bulk_upsert_kalodata_data(db, rows)
+        if success_count > 0:
+            await TopVideoIndex.refresh_for_rows(db, rows)
+        return success_count, skip_count
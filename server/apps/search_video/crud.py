@@ -1,11 +1,14 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, func, desc, asc
+from sqlalchemy import select, update, insert, func, desc, asc, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.sql import func
 from core.database import AsyncSessionLocal
 from core.logger import setup_logger
-from apps.search_video.models import Video_search_history, Kalodata_data, CategoryLevel1, CategoryLevel2, CategoryLevel3
+from apps.search_video.models import Video_search_history, Kalodata_data, CategoryLevel1, CategoryLevel2, CategoryLevel3, Kalodata_crawl_job, Kalodata_crawl_checkpoint
 from common.utils.dynamic_query import dynamic_query
+from apps.search_video.utils import parse_metric_number
 import logging
+from datetime import datetime
 
 # 设置日志记录器
 logger = logging.getLogger(__name__)
@@ -105,60 +108,116 @@ async def delete_video_search_history(db: AsyncSession, id: int):
     
 
 
+# kalodata数据字段长度限制
+KALODATA_FIELD_LENGTH_LIMITS = {
+    "country": 20,
+    "video_name": 255,
+    "gpm": 255,
+    "cpm": 255,
+    "ad_view_ratio": 255,
+    "duration": 255,
+    "revenue": 255,
+    "sales": 255,
+    "roas": 255,
+    "ad2Cost": 255,
+    "views": 255,
+    "product_title": 255,
+    "category1": 40,
+    "category2": 40,
+    "category3": 40,
+    "product_price": 255,
+    "video_url": 255,
+    "tiktok_url": 255,
+    "product_url": 255,
+    "product_image": 255,
+    "username": 255,
+    "follower_count": 255,
+    "hashtags": 255
+}
+
+# 字符串指标字段 -> 数值列
+KALODATA_NUMERIC_COLUMNS = {
+    "gpm": "gpm_num",
+    "revenue": "revenue_num",
+    "sales": "sales_num",
+    "views": "views_num",
+    "roas": "roas_num",
+    "ad2Cost": "ad2cost_num",
+    "follower_count": "follower_count_num"
+}
+
+# 整数类型的数值列
+KALODATA_INTEGER_COLUMNS = {"sales_num", "views_num", "follower_count_num"}
+
+# kalodata数据去重键(与唯一键 uq_kalodata_dedup 一致)
+KALODATA_DEDUP_FIELDS = ("country", "video_name", "product_title", "start_date", "end_date")
+
+def _normalize_kalodata_data(data: dict) -> dict:
+    """
+    规范化kalodata数据：截断超长字段并解析日期字段
+    """
+    # 截断超长字段
+    for field, limit in KALODATA_FIELD_LENGTH_LIMITS.items():
+        if field in data and isinstance(data[field], str) and len(data[field]) > limit:
+            logger.warning(f"字段 {field} 超出长度限制 {limit}，进行截断处理")
+            data[field] = data[field][:limit]
+            
+    # 确保日期字段格式正确
+    date_fields = ["start_date", "end_date"]
+    for field in date_fields:
+        if field in data and data[field] is not None:
+            if isinstance(data[field], str):
+                try:
+                    # 尝试解析日期字符串，这有助于确保格式一致
+                    data[field] = datetime.strptime(data[field], "%Y-%m-%d %H:%M:%S")
+                except ValueError:
+                    try:
+                        # 尝试不同的日期格式
+                        data[field] = datetime.strptime(data[field], "%Y-%m-%d")
+                    except ValueError as e:
+                        logger.error(f"无法解析日期字段 {field}: {data[field]}, 错误: {str(e)}")
+                        raise e
+
+    # 根据字符串指标填充数值列
+    data.update(parse_kalodata_numeric_columns(data))
+    return data
+
+def parse_kalodata_numeric_columns(data) -> dict:
+    """
+    将字符串指标解析为数值列
+    :param data: kalodata数据字典或Kalodata_data对象
+    :return: {数值列名: 数值}，只包含data中存在的指标
+    """
+    values = {}
+    for field, column in KALODATA_NUMERIC_COLUMNS.items():
+        if isinstance(data, dict):
+            if field not in data:
+                continue
+            raw = data[field]
+        else:
+            raw = getattr(data, field, None)
+        number = parse_metric_number(raw)
+        if number is not None and column in KALODATA_INTEGER_COLUMNS:
+            number = int(round(number))
+        values[column] = number
+    return values
+
+def _kalodata_dedup_key(data: dict) -> tuple:
+    """
+    生成kalodata数据去重键
+    字符串按MySQL默认排序规则的近似方式处理(忽略大小写和尾部空格)
+    """
+    return tuple(
+        value.rstrip().lower() if isinstance(value, str) else value
+        for value in (data.get(field) for field in KALODATA_DEDUP_FIELDS)
+    )
+
 async def create_kalodata_data(db: AsyncSession, data: dict):
     """
     创建kalodata数据记录
     """
     try:
-        # 字段长度限制检查
-        field_length_limits = {
-            "country": 20,
-            "video_name": 255,
-            "gpm": 255,
-            "cpm": 255,
-            "ad_view_ratio": 255,
-            "duration": 255,
-            "revenue": 255,
-            "sales": 255,
-            "roas": 255,
-            "ad2Cost": 255,
-            "views": 255,
-            "product_title": 255,
-            "category1": 40,
-            "category2": 40,
-            "category3": 40,
-            "product_price": 255,
-            "video_url": 255,
-            "tiktok_url": 255,
-            "product_url": 255,
-            "product_image": 255,
-            "username": 255,
-            "follower_count": 255,
-            "hashtags": 255
-        }
-        
-        # 截断超长字段
-        for field, limit in field_length_limits.items():
-            if field in data and isinstance(data[field], str) and len(data[field]) > limit:
-                logger.warning(f"字段 {field} 超出长度限制 {limit}，进行截断处理")
-                data[field] = data[field][:limit]
-                
-        # 确保日期字段格式正确
-        date_fields = ["start_date", "end_date"]
-        for field in date_fields:
-            if field in data and data[field] is not None:
-                if isinstance(data[field], str):
-                    try:
-                        from datetime import datetime
-                        # 尝试解析日期字符串，这有助于确保格式一致
-                        data[field] = datetime.strptime(data[field], "%Y-%m-%d %H:%M:%S")
-                    except ValueError:
-                        try:
-                            # 尝试不同的日期格式
-                            data[field] = datetime.strptime(data[field], "%Y-%m-%d")
-                        except ValueError as e:
-                            logger.error(f"无法解析日期字段 {field}: {data[field]}, 错误: {str(e)}")
-                            raise e
+        data = _normalize_kalodata_data(data)
         
         # 创建记录
         kalodata_data = Kalodata_data(**data)
@@ -171,6 +230,67 @@ async def create_kalodata_data(db: AsyncSession, data: dict):
         logger.error(f"创建kalodata数据记录失败: {str(e)}")
         raise e
 
+async def bulk_upsert_kalodata_data(db: AsyncSession, rows: list) -> tuple:
+    """
+    批量写入kalodata数据
+    先在内存中去重，再用一次查询找出已存在的记录，
+    最后用一条多行 INSERT ... ON DUPLICATE KEY UPDATE 写入整批数据
+    
+    参数:
+        db: 数据库会话
+        rows: kalodata数据字典列表
+    
+    返回:
+        tuple: (新增条数, 跳过条数)
+    """
+    if not rows:
+        return 0, 0
+
+    try:
+        # 1. 规范化并在内存中去重
+        unique_rows = {}
+        skip_count = 0
+        for row in rows:
+            row = _normalize_kalodata_data(dict(row))
+            row.setdefault("is_deleted", False)
+            key = _kalodata_dedup_key(row)
+            if key in unique_rows:
+                skip_count += 1
+                continue
+            unique_rows[key] = row
+
+        # 2. 一次查询找出本批次中已存在且未删除的记录
+        query = select(*[getattr(Kalodata_data, field) for field in KALODATA_DEDUP_FIELDS]).where(
+            tuple_(*[getattr(Kalodata_data, field) for field in KALODATA_DEDUP_FIELDS]).in_(
+                [tuple(row[field] for field in KALODATA_DEDUP_FIELDS) for row in unique_rows.values()]
+            ),
+            Kalodata_data.is_deleted == False
+        )
+        result = await db.execute(query)
+        existing_keys = {_kalodata_dedup_key(dict(zip(KALODATA_DEDUP_FIELDS, record))) for record in result.all()}
+
+        new_rows = [row for key, row in unique_rows.items() if key not in existing_keys]
+        skip_count += len(unique_rows) - len(new_rows)
+
+        if not new_rows:
+            return 0, skip_count
+
+        # 3. 单条多行写入，命中唯一键的已删除记录会被恢复并更新为最新数据
+        insert_stmt = mysql_insert(Kalodata_data).values(new_rows)
+        update_columns = {
+            column: insert_stmt.inserted[column]
+            for column in new_rows[0].keys()
+            if column not in KALODATA_DEDUP_FIELDS
+        }
+        await db.execute(insert_stmt.on_duplicate_key_update(**update_columns))
+        await db.commit()
+
+        return len(new_rows), skip_count
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"批量写入kalodata数据失败: {str(e)}")
+        raise e
+
 async def get_kalodata_data(db: AsyncSession, id: int):
     """获取单个kalodata数据"""
     return await db.get(Kalodata_data, id)
@@ -193,13 +313,22 @@ async def get_kalodata_data_by_filters(db: AsyncSession, filters: dict, order_by
         
         # 添加过滤条件
         for key, value in filters.items():
+            if value is None:  # 只添加非空值的过滤条件
+                continue
+            # 指标范围过滤，如 revenue_min / views_max，使用数值列
+            if key.endswith("_min") or key.endswith("_max"):
+                column = KALODATA_NUMERIC_COLUMNS.get(key[:-4])
+                if column:
+                    column = getattr(Kalodata_data, column)
+                    query = query.where(column >= value if key.endswith("_min") else column <= value)
+                    continue
             if hasattr(Kalodata_data, key):
-                if value is not None:  # 只添加非空值的过滤条件
-                    query = query.where(getattr(Kalodata_data, key) == value)
+                query = query.where(getattr(Kalodata_data, key) == value)
                 
-        # 添加排序条件
+        # 添加排序条件，指标字段按数值列排序
         if order_by:
             for key, direction in order_by.items():
+                key = KALODATA_NUMERIC_COLUMNS.get(key, key)
                 if hasattr(Kalodata_data, key):
                     if direction.lower() == "desc":
                         query = query.order_by(desc(getattr(Kalodata_data, key)))
@@ -222,6 +351,59 @@ async def get_kalodata_data_by_filters(db: AsyncSession, filters: dict, order_by
         logger.error(f"根据条件查询kalodata数据失败: {str(e)}")
         raise
 
+async def get_top_kalodata_data(db: AsyncSession, country: str, category3: str, limit: int = 20):
+    """
+    获取指定国家和三级类目下最新日期窗口中收益最高的kalodata数据（不统计总数）
+    使用索引 ix_kalodata_country_cat3_end
+    """
+    try:
+        query = select(Kalodata_data).where(
+            Kalodata_data.country == country,
+            Kalodata_data.category3 == category3,
+            Kalodata_data.is_deleted == False
+        ).order_by(
+            desc(Kalodata_data.end_date),
+            desc(Kalodata_data.revenue_num),
+            desc(Kalodata_data.id)
+        ).limit(limit)
+        result = await db.execute(query)
+        return result.scalars().all()
+    except Exception as e:
+        logger.error(f"获取最新kalodata数据失败: {str(e)}")
+        raise
+
+async def backfill_kalodata_numeric_columns(db: AsyncSession, last_id: int = 0, batch_size: int = 500) -> tuple:
+    """
+    按主键分批回填指标数值列
+    
+    参数:
+        db: 数据库会话
+        last_id: 上一批处理到的最大ID
+        batch_size: 每批条数
+    
+    返回:
+        tuple: (本批处理条数, 本批最大ID)
+    """
+    try:
+        query = select(Kalodata_data).where(
+            Kalodata_data.id > last_id
+        ).order_by(Kalodata_data.id).limit(batch_size)
+        result = await db.execute(query)
+        items = result.scalars().all()
+        if not items:
+            return 0, last_id
+
+        await db.execute(
+            update(Kalodata_data),
+            [{"id": item.id, **parse_kalodata_numeric_columns(item)} for item in items]
+        )
+        await db.commit()
+        return len(items), items[-1].id
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"回填kalodata数值列失败: {str(e)}")
+        raise
+
 async def update_kalodata_data(db: AsyncSession, id: int, update_data: dict):
     """更新kalodata数据"""
     try:
@@ -229,6 +411,9 @@ async def update_kalodata_data(db: AsyncSession, id: int, update_data: dict):
         if kalodata_data:
             for key, value in update_data.items():
                 setattr(kalodata_data, key, value)
+            # 同步更新指标数值列
+            for column, number in parse_kalodata_numeric_columns(update_data).items():
+                setattr(kalodata_data, column, number)
             await db.commit()
             await db.refresh(kalodata_data)
         return kalodata_data
@@ -330,3 +515,139 @@ async def check_kalodata_exists(db: AsyncSession, data: dict) -> bool:
 
 
 
+
+
+async def create_crawl_job(db: AsyncSession, job_data: dict, tasks: list):
+    """
+    创建kalodata爬取任务，并一次性写入所有类目检查点
+    
+    参数:
+        db: 数据库会话
+        job_data: 任务数据
+        tasks: (country, category_value) 列表
+    """
+    try:
+        job = Kalodata_crawl_job(**job_data, total_count=len(tasks), status="pending")
+        db.add(job)
+        await db.flush()
+        if tasks:
+            await db.execute(
+                insert(Kalodata_crawl_checkpoint),
+                [
+                    {"job_id": job.id, "country": country, "category_value": category_value, "status": "pending"}
+                    for country, category_value in tasks
+                ]
+            )
+        await db.commit()
+        await db.refresh(job)
+        return job
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"创建kalodata爬取任务失败: {str(e)}")
+        raise e
+
+async def get_crawl_job(db: AsyncSession, job_id: int):
+    """获取单个kalodata爬取任务"""
+    return await db.get(Kalodata_crawl_job, job_id)
+
+async def get_crawl_jobs_by_status(db: AsyncSession, status: str):
+    """获取指定状态的kalodata爬取任务"""
+    try:
+        query = select(Kalodata_crawl_job).where(Kalodata_crawl_job.status == status)
+        result = await db.execute(query)
+        return result.scalars().all()
+    except Exception as e:
+        logger.error(f"获取kalodata爬取任务失败: {str(e)}")
+        raise
+
+async def update_crawl_job(db: AsyncSession, job_id: int, update_data: dict):
+    """更新kalodata爬取任务"""
+    try:
+        job = await db.get(Kalodata_crawl_job, job_id)
+        if job:
+            for key, value in update_data.items():
+                setattr(job, key, value)
+            await db.commit()
+            await db.refresh(job)
+        return job
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def get_unfinished_crawl_checkpoints(db: AsyncSession, job_id: int, include_failed: bool = False):
+    """
+    获取任务中尚未完成的类目检查点
+    :param include_failed: 是否包含失败的检查点（用于重试）
+    """
+    try:
+        statuses = ["pending", "failed"] if include_failed else ["pending"]
+        query = select(Kalodata_crawl_checkpoint).where(
+            Kalodata_crawl_checkpoint.job_id == job_id,
+            Kalodata_crawl_checkpoint.status.in_(statuses)
+        ).order_by(Kalodata_crawl_checkpoint.id)
+        result = await db.execute(query)
+        return result.scalars().all()
+    except Exception as e:
+        logger.error(f"获取kalodata爬取检查点失败: {str(e)}")
+        raise
+
+async def update_crawl_checkpoint(db: AsyncSession, checkpoint_id: int, update_data: dict):
+    """更新kalodata爬取检查点"""
+    try:
+        await db.execute(
+            update(Kalodata_crawl_checkpoint)
+            .where(Kalodata_crawl_checkpoint.id == checkpoint_id)
+            .values(**update_data)
+        )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+async def get_crawl_job_progress(db: AsyncSession, job_id: int) -> dict:
+    """
+    按国家和状态汇总任务进度
+    
+    返回:
+        dict: {country: {"pending": n, "done": n, "failed": n, "success_count": n, "skip_count": n}}
+    """
+    try:
+        query = select(
+            Kalodata_crawl_checkpoint.country,
+            Kalodata_crawl_checkpoint.status,
+            func.count(),
+            func.coalesce(func.sum(Kalodata_crawl_checkpoint.success_count), 0),
+            func.coalesce(func.sum(Kalodata_crawl_checkpoint.skip_count), 0)
+        ).where(
+            Kalodata_crawl_checkpoint.job_id == job_id
+        ).group_by(
+            Kalodata_crawl_checkpoint.country,
+            Kalodata_crawl_checkpoint.status
+        )
+        result = await db.execute(query)
+
+        progress = {}
+        for country, status, count, success_count, skip_count in result.all():
+            country_progress = progress.setdefault(country, {
+                "pending": 0, "done": 0, "failed": 0, "success_count": 0, "skip_count": 0
+            })
+            country_progress[status] = count
+            country_progress["success_count"] += int(success_count)
+            country_progress["skip_count"] += int(skip_count)
+        return progress
+    except Exception as e:
+        logger.error(f"获取kalodata爬取任务进度失败: {str(e)}")
+        raise
+
+async def get_crawl_failed_checkpoints(db: AsyncSession, job_id: int, limit: int = 100):
+    """获取任务中失败的类目检查点"""
+    try:
+        query = select(Kalodata_crawl_checkpoint).where(
+            Kalodata_crawl_checkpoint.job_id == job_id,
+            Kalodata_crawl_checkpoint.status == "failed"
+        ).order_by(Kalodata_crawl_checkpoint.id).limit(limit)
+        result = await db.execute(query)
+        return result.scalars().all()
+    except Exception as e:
+        logger.error(f"获取kalodata爬取失败检查点失败: {str(e)}")
+        raise
@@ -0,0 +1,98 @@
+"""
+kalodata 视频/产品详情缓存
+
+同一个视频或产品在相邻的日期窗口和兄弟类目中会被反复请求，
+详情响应按 (类型, 国家, ID, 日期窗口) 缓存在本地LRU + Redis 两级缓存中，
+命中缓存时不再消耗 kalodata 的每日详情次数
+"""
+import os
+from core.cache import Cache
+from core.local_cache import LocalLRUCache
+from core.logger import setup_logger
+
+logger = setup_logger('kalodata_detail_cache')
+
+# Redis中详情缓存的过期时间（秒）
+KALODATA_DETAIL_CACHE_TTL = int(os.getenv('KALODATA_DETAIL_CACHE_TTL', 86400))
+# 本地LRU缓存的条数和过期时间（秒）
+KALODATA_DETAIL_LOCAL_CACHE_SIZE = int(os.getenv('KALODATA_DETAIL_LOCAL_CACHE_SIZE', 2048))
+KALODATA_DETAIL_LOCAL_CACHE_TTL = int(os.getenv('KALODATA_DETAIL_LOCAL_CACHE_TTL', 600))
+
+
+class DetailCache:
+    """
+    kalodata详情两级缓存
+    """
+    _local = LocalLRUCache(KALODATA_DETAIL_LOCAL_CACHE_SIZE, KALODATA_DETAIL_LOCAL_CACHE_TTL)
+    _stats = {}
+
+    @staticmethod
+    def _key(kind: str, country: str, item_id: str, start_date: str, end_date: str) -> str:
+        return f"kalodata:detail:{kind}:{country}:{item_id}:{start_date}:{end_date}"
+
+    @classmethod
+    def _record(cls, kind: str, result: str):
+        """记录命中/未命中次数"""
+        stats = cls._stats.setdefault(kind, {"local_hit": 0, "redis_hit": 0, "miss": 0})
+        stats[result] += 1
+
+    @classmethod
+    async def get_or_fetch(cls, kind: str, country: str, item_id: str, start_date: str, end_date: str, fetch_detail):
+        """
+        优先从缓存获取详情，未命中时调用接口并缓存成功的响应
+
+        参数:
+            kind: 详情类型，video 或 product
+            country: 国家代码
+            item_id: 视频ID或产品ID
+            start_date: 开始日期
+            end_date: 结束日期
+            fetch_detail: 未命中时调用的协程函数（无参数）
+
+        返回:
+            dict: 详情响应
+        """
+        key = cls._key(kind, country, item_id, start_date, end_date)
+
+        detail = cls._local.get(key)
+        if detail is not None:
+            cls._record(kind, "local_hit")
+            return detail
+
+        detail = await Cache.get(key)
+        if detail is not None:
+            cls._record(kind, "redis_hit")
+            cls._local.set(key, detail)
+            return detail
+
+        cls._record(kind, "miss")
+        detail = await fetch_detail()
+
+        # 只缓存成功的响应，次数限制和失败的响应不缓存
+        if detail and detail.get('success') and detail.get('data') is not None:
+            cls._local.set(key, detail)
+            try:
+                await Cache.set(key, detail, expire=KALODATA_DETAIL_CACHE_TTL)
+            except Exception as e:
+                logger.error(f"写入kalodata详情缓存失败: key={key}, error={str(e)}")
+        return detail
+
+    @classmethod
+    def stats(cls) -> dict:
+        """
+        获取本进程的缓存命中统计
+        saved_calls 即命中缓存而节省的详情接口调用次数
+        """
+        result = {}
+        for kind, stats in cls._stats.items():
+            hits = stats["local_hit"] + stats["redis_hit"]
+            total = hits + stats["miss"]
+            result[kind] = {
+                **stats,
+                "saved_calls": hits,
+                "hit_rate": round(hits / total, 4) if total else 0
+            }
+        return {
+            "local_cache_size": len(cls._local),
+            "details": result
+        }
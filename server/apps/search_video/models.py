@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, VARCHAR, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, VARCHAR, Float, ForeignKey, UniqueConstraint, Index, Text, BigInteger
 from core.database import Base
 import logging
 from sqlalchemy.orm import relationship
@@ -76,6 +76,13 @@ class Kalodata_data(Base):
     从kalodata获取的爆款视频数据模型，用于定义爆款视频数据表
     """
     __tablename__ = 'kalodata_data'
+    __table_args__ = (
+        # 同一国家、同一时间段内的视频+商品只保存一条
+        UniqueConstraint('country', 'video_name', 'product_title', 'start_date', 'end_date', name='uq_kalodata_dedup'),
+        # 按国家+三级类目过滤，按数据日期/收益排序
+        Index('ix_kalodata_country_cat3_end', 'country', 'category3', 'is_deleted', 'end_date'),
+        Index('ix_kalodata_country_cat3_revenue', 'country', 'category3', 'is_deleted', 'revenue_num'),
+    )
     
     id = Column(Integer, primary_key=True, index=True) # 主键
     country = Column(VARCHAR(20), nullable=False) # 国家
@@ -104,6 +111,14 @@ class Kalodata_data(Base):
     hashtags = Column(VARCHAR(255), nullable=False) # 标签
     start_date = Column(DateTime, nullable=False) # 开始日期
     end_date = Column(DateTime, nullable=False) # 结束日期
+    # 指标的数值列，用于按数值过滤和排序（由字符串指标解析得到）
+    gpm_num = Column(Float, nullable=True) # 每千次播放收入
+    revenue_num = Column(Float, nullable=True) # 视频收益
+    sales_num = Column(BigInteger, nullable=True) # 视频销量
+    views_num = Column(BigInteger, nullable=True) # 视频播放量
+    roas_num = Column(Float, nullable=True) # 广告投资回报率
+    ad2cost_num = Column(Float, nullable=True) # 视频广告成本
+    follower_count_num = Column(BigInteger, nullable=True) # 粉丝数
     created_at = Column(DateTime, default=func.now()) # 创建时间
     is_deleted = Column(Boolean, default=False) # 是否删除(逻辑删除)
     
@@ -282,3 +297,94 @@ class CategoryLevel3(Base):
         except Exception as e:
             logger.error(f"Error converting CategoryLevel2 to dict: {str(e)}")
             return {}
+
+
+class Kalodata_crawl_job(Base):
+    """
+    kalodata类目爬取任务模型，用于记录后台批量爬取任务
+    """
+    __tablename__ = 'kalodata_crawl_job'
+
+    id = Column(Integer, primary_key=True, autoincrement=True) # 主键
+    countries = Column(VARCHAR(255), nullable=False) # 爬取国家，逗号分隔
+    cookie = Column(Text, nullable=False) # 爬取使用的kalodata cookie
+    start_date = Column(VARCHAR(20), nullable=False) # 数据开始日期
+    end_date = Column(VARCHAR(20), nullable=False) # 数据结束日期
+    status = Column(VARCHAR(20), nullable=False, default="pending") # 任务状态: pending/running/completed/failed
+    total_count = Column(Integer, nullable=False, default=0) # 类目任务总数
+    error = Column(VARCHAR(1000), nullable=True) # 任务失败原因
+    created_at = Column(DateTime, default=func.now()) # 创建时间
+    started_at = Column(DateTime, nullable=True) # 开始执行时间
+    finished_at = Column(DateTime, nullable=True) # 结束时间
+
+    def __repr__(self):
+        return (f"Kalodata_crawl_job(id={self.id}, "
+                f"countries={self.countries}, "
+                f"start_date={self.start_date}, "
+                f"end_date={self.end_date}, "
+                f"status={self.status}, "
+                f"total_count={self.total_count})")
+
+    def to_dict(self):
+        """转换为字典（不包含cookie）"""
+        try:
+            return {
+                "id": self.id,
+                "countries": self.countries.split(",") if self.countries else [],
+                "start_date": self.start_date,
+                "end_date": self.end_date,
+                "status": self.status,
+                "total_count": self.total_count,
+                "error": self.error,
+                "created_at": self.created_at.isoformat() if self.created_at else None,
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None
+            }
+        except Exception as e:
+            logger.error(f"Error converting kalodata_crawl_job to dict: {str(e)}")
+            return {}
+
+
+class Kalodata_crawl_checkpoint(Base):
+    """
+    kalodata类目爬取检查点模型，每个(任务, 国家, 三级类目)一条，用于断点续爬
+    """
+    __tablename__ = 'kalodata_crawl_checkpoint'
+    __table_args__ = (
+        UniqueConstraint('job_id', 'country', 'category_value', name='uq_crawl_checkpoint'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True) # 主键
+    job_id = Column(Integer, ForeignKey('kalodata_crawl_job.id'), nullable=False, index=True) # 所属任务
+    country = Column(VARCHAR(20), nullable=False) # 国家
+    category_value = Column(VARCHAR(50), nullable=False) # 三级类目value
+    status = Column(VARCHAR(20), nullable=False, default="pending") # 状态: pending/done/failed
+    success_count = Column(Integer, nullable=False, default=0) # 新增条数
+    skip_count = Column(Integer, nullable=False, default=0) # 跳过条数
+    error = Column(VARCHAR(1000), nullable=True) # 失败原因
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now()) # 更新时间
+
+    def __repr__(self):
+        return (f"Kalodata_crawl_checkpoint(id={self.id}, "
+                f"job_id={self.job_id}, "
+                f"country={self.country}, "
+                f"category_value={self.category_value}, "
+                f"status={self.status})")
+
+    def to_dict(self):
+        """转换为字典"""
+        try:
+            return {
+                "id": self.id,
+                "job_id": self.job_id,
+                "country": self.country,
+                "category_value": self.category_value,
+                "status": self.status,
+                "success_count": self.success_count,
+                "skip_count": self.skip_count,
+                "error": self.error,
+                "updated_at": self.updated_at.isoformat() if self.updated_at else None
+            }
+        except Exception as e:
+            logger.error(f"Error converting kalodata_crawl_checkpoint to dict: {str(e)}")
+            return {}
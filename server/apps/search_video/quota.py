@@ -0,0 +1,133 @@
+"""
+kalodata 详情接口次数管理
+
+按 cookie 记录每天已使用的详情调用次数（Redis），在多个 cookie 之间轮换，
+次数用尽的 cookie 在每日重置前不再被使用
+"""
+import os
+import hashlib
+from datetime import datetime, timedelta
+from core.cache import Cache
+from core.logger import setup_logger
+
+logger = setup_logger('kalodata_quota')
+
+# 额外的kalodata cookie池，多个cookie用 || 分隔
+KALODATA_COOKIES = os.getenv('KALODATA_COOKIES', '')
+# 每个cookie每天可调用的详情次数，0表示不预先限制（仅在kalodata返回次数用尽时停用）
+KALODATA_DETAIL_DAILY_LIMIT = int(os.getenv('KALODATA_DETAIL_DAILY_LIMIT', 0))
+# kalodata每日重置次数的时间（小时，本地时间）
+KALODATA_QUOTA_RESET_HOUR = int(os.getenv('KALODATA_QUOTA_RESET_HOUR', 0))
+
+
+class KalodataQuota:
+    """
+    kalodata cookie 详情次数管理器
+    """
+    _cursor = 0
+
+    @staticmethod
+    def cookie_id(cookie: str) -> str:
+        """cookie的短标识，避免在Redis键和日志中暴露cookie"""
+        return hashlib.sha1(cookie.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def build_pool(cookie: str = None) -> list:
+        """
+        构建cookie池：请求携带的cookie优先，其次是环境变量中配置的cookie
+        """
+        pool = []
+        for item in [cookie] + KALODATA_COOKIES.split('||'):
+            item = item.strip() if item else ''
+            if item and item not in pool:
+                pool.append(item)
+        return pool
+
+    @staticmethod
+    def _quota_day(now: datetime) -> str:
+        """当前所属的额度日（以重置时间为界）"""
+        return (now - timedelta(hours=KALODATA_QUOTA_RESET_HOUR)).strftime("%Y%m%d")
+
+    @staticmethod
+    def seconds_until_reset(now: datetime = None) -> int:
+        """距离下一次每日重置的秒数"""
+        now = now or datetime.now()
+        reset_at = now.replace(hour=KALODATA_QUOTA_RESET_HOUR, minute=0, second=0, microsecond=0)
+        if reset_at <= now:
+            reset_at += timedelta(days=1)
+        return max(int((reset_at - now).total_seconds()), 1)
+
+    @classmethod
+    def _used_key(cls, cookie: str) -> str:
+        return f"kalodata:quota:used:{cls.cookie_id(cookie)}:{cls._quota_day(datetime.now())}"
+
+    @classmethod
+    def _exhausted_key(cls, cookie: str) -> str:
+        return f"kalodata:quota:exhausted:{cls.cookie_id(cookie)}"
+
+    @classmethod
+    async def _is_available(cls, cookie: str) -> bool:
+        """cookie今天是否还有剩余次数"""
+        if await Cache.exists(cls._exhausted_key(cookie)):
+            return False
+        if KALODATA_DETAIL_DAILY_LIMIT > 0:
+            used = await Cache.get_counter(cls._used_key(cookie))
+            return used < KALODATA_DETAIL_DAILY_LIMIT
+        return True
+
+    @classmethod
+    async def acquire(cls, pool: list, exclude: set = None):
+        """
+        从cookie池中轮换选取一个有剩余次数的cookie，并记录一次使用
+
+        参数:
+            pool: cookie池
+            exclude: 本次不再尝试的cookie
+
+        返回:
+            str: 可用的cookie，全部用尽时返回None
+        """
+        candidates = [cookie for cookie in pool if not exclude or cookie not in exclude]
+        if not candidates:
+            return None
+
+        start = cls._cursor
+        cls._cursor += 1
+        for offset in range(len(candidates)):
+            cookie = candidates[(start + offset) % len(candidates)]
+            try:
+                if not await cls._is_available(cookie):
+                    continue
+                await Cache.incr(cls._used_key(cookie), expire=cls.seconds_until_reset() + 3600)
+                return cookie
+            except Exception as e:
+                # Redis不可用时不做次数管理，直接使用该cookie
+                logger.error(f"kalodata次数管理不可用，直接使用cookie: {str(e)}")
+                return cookie
+        return None
+
+    @classmethod
+    async def mark_exhausted(cls, cookie: str):
+        """将cookie标记为今日次数已用尽，直到下一次每日重置"""
+        try:
+            ttl = cls.seconds_until_reset()
+            await Cache.set(cls._exhausted_key(cookie), {"exhausted_at": datetime.now().isoformat()}, expire=ttl)
+            logger.warning(f"kalodata cookie {cls.cookie_id(cookie)} 今日详情次数已用尽，{ttl} 秒后重置")
+        except Exception as e:
+            logger.error(f"标记kalodata cookie次数用尽失败: {str(e)}")
+
+    @classmethod
+    async def status(cls, pool: list) -> list:
+        """获取cookie池中每个cookie的次数使用情况"""
+        result = []
+        for cookie in pool:
+            used = await Cache.get_counter(cls._used_key(cookie))
+            exhausted_ttl = await Cache.ttl(cls._exhausted_key(cookie))
+            result.append({
+                "cookie_id": cls.cookie_id(cookie),
+                "used": used,
+                "remaining": max(KALODATA_DETAIL_DAILY_LIMIT - used, 0) if KALODATA_DETAIL_DAILY_LIMIT > 0 else None,
+                "exhausted": exhausted_ttl > 0,
+                "reset_in": exhausted_ttl if exhausted_ttl > 0 else cls.seconds_until_reset()
+            })
+        return result
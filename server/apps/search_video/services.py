@@ -13,6 +13,173 @@ import json
 logger = setup_logger('video_search_services')
     
 
+# 国家名称到代码的映射
+COUNTRY_CODES = {
+    "美国": "US",
+    "印度尼西亚": "ID",
+    "马来西亚": "MY",
+    "泰国": "TH",
+    "越南": "VN",
+    "菲律宾": "PH",
+    "英国": "GB",
+    "新加坡": "SG",
+    "墨西哥": "MX"
+}
+
+# 搜索记录中各文本字段的长度限制（与列定义一致）
+VIDEO_SEARCH_FIELD_LIMITS = {
+    "phone": 20,
+    "product_name": 60,
+    "category": 60,
+    "country": 20,
+    "scenes": 255,
+    "style": 255,
+    "lens_usage": 255,
+    "actor_selection": 255,
+    "prop_matching": 255
+}
+
+async def search_video_service(request: Request) -> Response:
+    """
+    对标视频搜索与推荐服务
+    预扣权益次数后，拍摄建议（优先读缓存，未命中时调用大模型）与对标视频查询并发执行，任一步失败时归还次数；
+    每个请求记录各阶段耗时
+    """
+    import time
+    from apps.business.quota import EntitlementQuota
+    from apps.search_video.category_index import CategoryRegistry
+    from apps.search_video.top_index import TopVideoIndex
+    from apps.search_video.core import shooting_suggestions
+    from apps.search_video.suggestion_cache import SuggestionCache
+
+    timings = {}
+    started = stage_started = time.perf_counter()
+
+    def mark(stage: str):
+        nonlocal stage_started
+        now = time.perf_counter()
+        timings[stage] = round((now - stage_started) * 1000, 1)
+        stage_started = now
+
+    request_data = request.json()
+    product_name = request_data.get("product_name")
+    category = request_data.get("category")
+    country = request_data.get("country")
+    phone = request_data.get("phone")
+    ai_product_id = request_data.get("ai_product_id")
+
+    # 判断必要参数是否存在
+    if not all([product_name, category, country, phone, ai_product_id]):
+        return ApiResponse.validation_error("缺少必要参数")
+
+    # 判断输入字符长度
+    if len(product_name) > 60:
+        return ApiResponse.validation_error("输入的商品名称长度不要超过60哦")
+
+    # 查询category是否在三级类目中
+    leaf_category = await CategoryRegistry.lookup_leaf(category)
+    if leaf_category is None:
+        return ApiResponse.validation_error("输入的商品类目不支持哦")
+
+    # 查询country是否在国家字典中
+    if country not in COUNTRY_CODES:
+        return ApiResponse.validation_error("输入的国家不支持哦")
+    country_code = COUNTRY_CODES[country]
+    mark("validate")
+
+    # 预扣次数（Redis原子扣减），任一步失败时归还
+    try:
+        entitlement_id, daily_remaining, quota_source = await EntitlementQuota.reserve(phone, ai_product_id)
+    except Exception as e:
+        logger.error(f"查询用户权益失败: {str(e)}")
+        return ApiResponse.error(message="查询用户权益失败", status_code=500)
+    if entitlement_id is None:
+        return ApiResponse.error(message="暂无权益", status_code=403)
+    if daily_remaining is None:
+        return ApiResponse.error(message="使用额度不足", status_code=403)
+    mark("entitlement")
+
+    async def release(reason: str):
+        await EntitlementQuota.release(entitlement_id, quota_source)
+        logger.info(f"search_video 失败（{reason}），已归还次数，耗时(ms): {timings}")
+
+    async with AsyncSessionLocal() as db:
+        # 拍摄建议（大模型）与对标视频查询互不依赖，并发执行
+        async def timed(stage: str, coro):
+            stage_start = time.perf_counter()
+            try:
+                return await coro
+            finally:
+                timings[stage] = round((time.perf_counter() - stage_start) * 1000, 1)
+
+        result, kalodata_items_list = await asyncio.gather(
+            timed("suggestions", SuggestionCache.get_or_generate(
+                product_name, category, country,
+                lambda: shooting_suggestions(product_name, category, country)
+            )),
+            timed("kalodata", TopVideoIndex.get_top(db, country_code, category, limit=5)),
+            return_exceptions=True
+        )
+        mark("parallel")
+
+        if not result or isinstance(result, Exception):
+            await release("获取拍摄建议失败")
+            return ApiResponse.error(message="获取拍摄建议失败", status_code=500)
+        if isinstance(kalodata_items_list, Exception):
+            logger.error(f"查询kalodata数据失败: {str(kalodata_items_list)}")
+            await release("查询kalodata数据失败")
+            return ApiResponse.error(message="查询kalodata数据失败", status_code=500)
+
+        # 保存搜索记录
+        try:
+            kalodata_items_json = json.dumps(kalodata_items_list)
+            # 如果json字符串长度超过10000（数据库字段定义的长度），则进行截断处理
+            if len(kalodata_items_json) > 10000:
+                logger.warning(f"kalodata_items_json长度超过限制: {len(kalodata_items_json)}，将进行截断")
+                kalodata_items_json = json.dumps([])
+
+            video_search_data = {
+                "phone": phone,
+                "product_name": product_name,
+                "category": category,
+                "country": country,
+                "scenes": result.get("scenes", ""),
+                "style": result.get("style", ""),
+                "lens_usage": result.get("lens_usage", ""),
+                "actor_selection": result.get("actor_selection", ""),
+                "prop_matching": result.get("prop_matching", ""),
+                "items": kalodata_items_json,
+                "created_at": datetime.now(),
+                "is_deleted": False
+            }
+
+            # 确保所有文本字段不超过其列定义的长度限制
+            for field, limit in VIDEO_SEARCH_FIELD_LIMITS.items():
+                if isinstance(video_search_data.get(field), str) and len(video_search_data[field]) > limit:
+                    logger.warning(f"字段 {field} 长度超过限制: {len(video_search_data[field])}，将进行截断")
+                    video_search_data[field] = video_search_data[field][:limit]
+
+            await video_search_crud.create_video_search_history(db, video_search_data)
+        except Exception as e:
+            logger.error(f"保存对标视频搜索与推荐记录失败: {str(e)}")
+            await release("保存记录失败")
+            return ApiResponse.error(message="保存记录失败", status_code=500)
+        mark("history")
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"search_video 完成: phone={phone}, category={category}, country={country_code}, 耗时(ms): {timings}")
+
+    # 转换datetime为字符串用于返回
+    response_data = video_search_data.copy()
+    response_data["created_at"] = response_data["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+    return ApiResponse.success(
+        data={
+            "result": response_data,
+            "daily_remaining": daily_remaining
+        },
+        message="获取视频搜索结果成功"
+    )
+
 async def get_video_search_histories_service(request: Request) -> Response:
     """
     获取对标视频搜索与推荐记录服务
@@ -195,21 +362,11 @@ async def get_category_level1_service(request: Request) -> Response:
     获取所有一级类目    
     """
     try:
-        async with AsyncSessionLocal() as db:
-            try:
-                category_level1 = await video_search_crud.get_category_level1(db)
-                return ApiResponse.success(
-                    data=[category.to_dict() for category in category_level1],
-                    message="获取所有一级类目成功"
-                )
-            except Exception as e:
-                logger.error(f"获取所有一级类目失败: {str(e)}")
-                return ApiResponse.error(
-                    message="获取所有一级类目失败",
-                    status_code=500
-                )
+        from apps.search_video.category_index import CategoryRegistry
+        index = await CategoryRegistry.get()
+        return ApiResponse.raw(index.level1_body)
     except Exception as e:
-        logger.error(f"获取所有一级类目服务异常: {str(e)}")
+        logger.error(f"获取所有一级类目失败: {str(e)}")
         return ApiResponse.error(
             message="获取所有一级类目失败",
             status_code=500
@@ -220,21 +377,11 @@ async def get_category_level2_service(request: Request) -> Response:
     获取所有二级类目
     """
     try:
-        async with AsyncSessionLocal() as db:
-            try:
-                category_level2 = await video_search_crud.get_category_level2(db)
-                return ApiResponse.success(
-                    data=[category.to_dict() for category in category_level2],
-                    message="获取所有二级类目成功"
-                )
-            except Exception as e:
-                logger.error(f"获取所有二级类目失败: {str(e)}")
-                return ApiResponse.error(
-                    message="获取所有二级类目失败",
-                    status_code=500
-                )
+        from apps.search_video.category_index import CategoryRegistry
+        index = await CategoryRegistry.get()
+        return ApiResponse.raw(index.level2_body)
     except Exception as e:
-        logger.error(f"获取所有二级类目服务异常: {str(e)}")
+        logger.error(f"获取所有二级类目失败: {str(e)}")
         return ApiResponse.error(
             message="获取所有二级类目失败",
             status_code=500
@@ -245,21 +392,11 @@ async def get_category_level3_service(request: Request) -> Response:
     获取所有三级类目
     """
     try:
-        async with AsyncSessionLocal() as db:
-            try:
-                category_level3 = await video_search_crud.get_category_level3(db)
-                return ApiResponse.success(
-                    data=[category.to_dict() for category in category_level3],
-                    message="获取所有三级类目成功"
-                )
-            except Exception as e:
-                logger.error(f"获取所有三级类目失败: {str(e)}")
-                return ApiResponse.error(
-                    message="获取所有三级类目失败",
-                    status_code=500
-                )
+        from apps.search_video.category_index import CategoryRegistry
+        index = await CategoryRegistry.get()
+        return ApiResponse.raw(index.level3_body)
     except Exception as e:
-        logger.error(f"获取所有三级类目服务异常: {str(e)}")
+        logger.error(f"获取所有三级类目失败: {str(e)}")
         return ApiResponse.error(
             message="获取所有三级类目失败",
             status_code=500
@@ -276,26 +413,11 @@ async def get_category_level2_by_level1_service(request: Request) -> Response:
         if not level1_id:
             return ApiResponse.validation_error("一级类目ID不能为空")
 
-        # 获取二级类目
-        filters = {
-            "parent_value": level1_id
-        }
-        
-        async with AsyncSessionLocal() as db:
-            try:
-                category_level2 = await video_search_crud.get_category_level2_by_filters(db, filters)
-                return ApiResponse.success(
-                    data=[category.to_dict() for category in category_level2],
-                    message="获取指定一级类目下的所有二级类目成功"
-                )
-            except Exception as e:
-                logger.error(f"获取指定一级类目下的所有二级类目失败: {str(e)}")
-                return ApiResponse.error(
-                    message="获取指定一级类目下的所有二级类目失败",
-                    status_code=500
-                )
+        from apps.search_video.category_index import CategoryRegistry
+        index = await CategoryRegistry.get()
+        return ApiResponse.raw(index.level2_by_level1_body.get(level1_id, index.empty_level2_body))
     except Exception as e:
-        logger.error(f"获取指定一级类目下的所有二级类目服务异常: {str(e)}")
+        logger.error(f"获取指定一级类目下的所有二级类目失败: {str(e)}")
         return ApiResponse.error(
             message="获取指定一级类目下的所有二级类目失败",
             status_code=500
@@ -312,32 +434,146 @@ async def get_category_level3_by_level2_service(request: Request) -> Response:
         if not level2_id:
             return ApiResponse.validation_error("二级类目ID不能为空")
 
-        # 获取三级类目
-        filters = {
-            "parent_value": level2_id
-        }
-        
-        async with AsyncSessionLocal() as db:
-            try:
-                category_level3 = await video_search_crud.get_category_level3_by_filters(db, filters)
-                return ApiResponse.success(
-                    data=[category.to_dict() for category in category_level3],
-                    message="获取指定二级类目下的所有三级类目成功"
-                )
-            except Exception as e:
-                logger.error(f"获取指定二级类目下的所有三级类目失败: {str(e)}")
-                return ApiResponse.error(
-                    message="获取指定二级类目下的所有三级类目失败",
-                    status_code=500
-                )
+        from apps.search_video.category_index import CategoryRegistry
+        index = await CategoryRegistry.get()
+        return ApiResponse.raw(index.level3_by_level2_body.get(level2_id, index.empty_level3_body))
     except Exception as e:
-        logger.error(f"获取指定二级类目下的所有三级类目服务异常: {str(e)}")
+        logger.error(f"获取指定二级类目下的所有三级类目失败: {str(e)}")
         return ApiResponse.error(
             message="获取指定二级类目下的所有三级类目失败",
             status_code=500
         )
+
+async def reload_category_index_service(request: Request) -> Response:
+    """
+    重新加载类目索引服务（修改类目数据后调用）
+    """
+    try:
+        from apps.search_video.category_index import CategoryRegistry
+        index = await CategoryRegistry.reload()
+        return ApiResponse.success(
+            message="类目索引重新加载成功",
+            data={
+                "level1_count": len(index.level1),
+                "level2_count": len(index.level2),
+                "level3_count": len(index.level3)
+            }
+        )
+    except Exception as e:
+        logger.error(f"重新加载类目索引失败: {str(e)}")
+        return ApiResponse.error(
+            message="重新加载类目索引失败",
+            status_code=500
+        )
     
 
+async def purge_shooting_suggestion_cache_service(request: Request) -> Response:
+    """
+    清除拍摄建议缓存服务
+    可按 product_name / category / country 任意组合清除，都不传时清除全部
+    """
+    try:
+        from apps.search_video.suggestion_cache import SuggestionCache
+        request_data = request.json() if request.body else {}
+        count = await SuggestionCache.purge(
+            product_name=request_data.get("product_name"),
+            category=request_data.get("category"),
+            country=request_data.get("country")
+        )
+        return ApiResponse.success(
+            message="清除拍摄建议缓存成功",
+            data={"deleted": count}
+        )
+    except Exception as e:
+        logger.error(f"清除拍摄建议缓存失败: {str(e)}")
+        return ApiResponse.error(
+            message="清除拍摄建议缓存失败",
+            status_code=500
+        )
+
+
+async def build_kalodata_rows(db, video_data: list, start_date: str, end_date: str, cate_ids: list, category3_label: str = "") -> list:
+    """
+    将kalodata返回的视频数据转换为kalodata_data表的数据字典列表
+    """
+    from apps.search_video.utils import get_category3_label
+
+    # 同一批次内的三级类目名称只查询一次
+    category3_labels = {}
+    rows = []
+    for video in video_data:
+        try:
+            # 构建数据模型
+            kalodata_data = {
+                "country": video.get("region", ""),
+                "has_ad": video.get("ad") == 1,
+                "video_name": video.get("description", ""),
+                "gpm": str(video.get("gpm", "")),
+                "cpm": str(video.get("ad_cpa", "")),
+                "ad_view_ratio": str(video.get("ad_view_ratio", "")),
+                "duration": str(video.get("duration", "")),
+                "revenue": str(video.get("revenue", "")),
+                "sales": str(video.get("sale", "")),
+                "roas": str(video.get("ad2Roas", "")),
+                "ad2Cost": str(video.get("ad2Cost", "")),
+                "views": str(video.get("views", "")),
+                "product_title": video.get("product_title", ""),
+                "product_price": str(video.get("product_price", "")),
+                "video_url": video.get("video_url", ""),
+                "tiktok_url": video.get("tiktok_url", ""),
+                "product_url": video.get("product_url", ""),
+                "product_image": "",  # 暂时为空，因为原始数据中没有这个字段
+                "username": video.get("username", video.get("handle", "")),
+                "follower_count": str(video.get("follower_count", "")),
+                "hashtags": ",".join(video.get("hashtags", [])),
+                "start_date": start_date,
+                "end_date": end_date,
+                "is_deleted": False
+            }
+            
+            # 处理API限制情况下的默认值
+            # 判断是否是API受限的情况 - 检查是否有关键字段为'unknown'
+            is_api_limited = (
+                video.get("product_title") == "unknown" or 
+                video.get("product_price") == "unknown" or 
+                video.get("follower_count") == "unknown" or
+                video.get("username") == "unknown"
+            )
+            
+            # 如果是API受限情况，确保所有必要字段都设置为'unknown'
+            if is_api_limited:
+                for field in ("product_title", "product_price", "username", "follower_count"):
+                    if kalodata_data[field] == "":
+                        kalodata_data[field] = "unknown"
+            
+            # 处理类目字段
+            # 1. 获取原始类目ID
+            kalodata_data["category1"] = video.get("product_pri_cate_id", "")
+            kalodata_data["category2"] = video.get("product_sec_cate_id", "")
+            
+            # 2. 处理三级类目
+            ter_cate_id = video.get("product_ter_cate_id", "")
+            
+            # 如果三级类目ID不为空，但是API受限（无法获取产品详情）
+            if ter_cate_id and is_api_limited:
+                # 使用类目ID匹配到的名称
+                if category3_label and cate_ids and ter_cate_id == cate_ids[0]:
+                    kalodata_data["category3"] = category3_label
+                else:
+                    # 如果没有匹配到，尝试查询数据库获取类目名称
+                    if ter_cate_id not in category3_labels:
+                        category3_labels[ter_cate_id] = await get_category3_label(db, ter_cate_id)
+                    kalodata_data["category3"] = category3_labels[ter_cate_id]
+            else:
+                # 正常情况下，保留原始三级类目ID
+                kalodata_data["category3"] = ter_cate_id
+
+            rows.append(kalodata_data)
+        except Exception as e:
+            logger.error(f"构建单条kalodata数据失败: {str(e)}, 数据: {video}")
+            continue
+    return rows
+
 async def fetch_and_store_kalodata_service(request: Request) -> Response:
     """
     获取并存储kalodata视频数据服务
@@ -388,7 +624,7 @@ async def fetch_and_store_kalodata_service(request: Request) -> Response:
         try:
             from apps.search_video.utils import get_complete_video_data
             logger.info(f"开始从kalodata获取数据，参数：country={country}, start_date={start_date}, end_date={end_date}, cate_ids={cate_ids}")
-            video_data = get_complete_video_data(cookie, country, start_date, end_date, cate_ids)
+            video_data = await get_complete_video_data(cookie, country, start_date, end_date, cate_ids)
             logger.info(f"从kalodata获取到 {len(video_data) if video_data else 0} 条数据")
         except Exception as e:
             logger.error(f"从kalodata获取数据失败: {str(e)}")
@@ -415,98 +651,12 @@ async def fetch_and_store_kalodata_service(request: Request) -> Response:
                     category3_label = await get_category3_label(db, category_id)
                     logger.info(f"三级类目ID {category_id} 对应的名称: {category3_label}")
                 
-                success_count = 0
-                skip_count = 0
-                for video in video_data:
-                    try:
-                        # 构建数据模型
-                        kalodata_data = {
-                            "country": video.get("region", ""),
-                            "has_ad": video.get("ad") == 1,
-                            "video_name": video.get("description", ""),
-                            "gpm": str(video.get("gpm", "")),
-                            "cpm": str(video.get("ad_cpa", "")),
-                            "ad_view_ratio": str(video.get("ad_view_ratio", "")),
-                            "duration": str(video.get("duration", "")),
-                            "revenue": str(video.get("revenue", "")),
-                            "sales": str(video.get("sale", "")),
-                            "roas": str(video.get("ad2Roas", "")),
-                            "ad2Cost": str(video.get("ad2Cost", "")),
-                            "views": str(video.get("views", "")),
-                            "product_title": video.get("product_title", ""),
-                            "product_price": str(video.get("product_price", "")),
-                            "video_url": video.get("video_url", ""),
-                            "tiktok_url": video.get("tiktok_url", ""),
-                            "product_url": video.get("product_url", ""),
-                            "product_image": "",  # 暂时为空，因为原始数据中没有这个字段
-                            "username": video.get("username", video.get("handle", "")),
-                            "follower_count": str(video.get("follower_count", "")),
-                            "hashtags": ",".join(video.get("hashtags", [])),
-                            "start_date": start_date,
-                            "end_date": end_date,
-                            "is_deleted": False
-                        }
-                        
-                        # 处理API限制情况下的默认值
-                        # 判断是否是API受限的情况 - 检查是否有关键字段为'unknown'
-                        is_api_limited = (
-                            video.get("product_title") == "unknown" or 
-                            video.get("product_price") == "unknown" or 
-                            video.get("follower_count") == "unknown" or
-                            video.get("username") == "unknown"
-                        )
-                        
-                        # 如果是API受限情况，确保所有必要字段都设置为'unknown'
-                        if is_api_limited:
-                            if kalodata_data["product_title"] == "":
-                                kalodata_data["product_title"] = "unknown"
-                            if kalodata_data["product_price"] == "":
-                                kalodata_data["product_price"] = "unknown"
-                            if kalodata_data["username"] == "":
-                                kalodata_data["username"] = "unknown"
-                            if kalodata_data["follower_count"] == "":
-                                kalodata_data["follower_count"] = "unknown"
-                        
-                        # 处理类目字段
-                        # 1. 获取原始类目ID
-                        kalodata_data["category1"] = video.get("product_pri_cate_id", "")
-                        kalodata_data["category2"] = video.get("product_sec_cate_id", "")
-                        
-                        # 2. 处理三级类目
-                        ter_cate_id = video.get("product_ter_cate_id", "")
-                        
-                        # 如果三级类目ID不为空，但是API受限（无法获取产品详情）
-                        if ter_cate_id and is_api_limited:
-                            # 使用类目ID匹配到的名称
-                            if category3_label and ter_cate_id == cate_ids[0]:
-                                kalodata_data["category3"] = category3_label
-                            else:
-                                # 如果没有匹配到，尝试查询数据库获取类目名称
-                                ter_category_label = await get_category3_label(db, ter_cate_id)
-                                kalodata_data["category3"] = ter_category_label
-                        else:
-                            # 正常情况下，保留原始三级类目ID
-                            kalodata_data["category3"] = ter_cate_id
-
-                        # 检查数据是否已存在
-                        exists = await video_search_crud.check_kalodata_exists(db, {
-                            "country": kalodata_data["country"],
-                            "video_name": kalodata_data["video_name"],
-                            "product_title": kalodata_data["product_title"],
-                            "start_date": kalodata_data["start_date"],
-                            "end_date": kalodata_data["end_date"]
-                        })
-
-                        if exists:
-                            logger.info(f"数据已存在，跳过: country={kalodata_data['country']}, video_name={kalodata_data['video_name']}, product_title={kalodata_data['product_title']}")
-                            skip_count += 1
-                            continue
-                        
-                        await video_search_crud.create_kalodata_data(db, kalodata_data)
-                        success_count += 1
-                    except Exception as e:
-                        logger.error(f"存储单条kalodata数据失败: {str(e)}, 数据: {video}")
-                        continue
+                rows = await build_kalodata_rows(db, video_data, start_date, end_date, cate_ids, category3_label)
+                success_count, skip_count = await video_search_crud.bulk_upsert_kalodata_data(db, rows)
+                if success_count > 0:
+                    from apps.search_video.top_index import TopVideoIndex
+                    await TopVideoIndex.refresh_for_rows(db, rows)
+                logger.info(f"kalodata数据批量写入完成: 新增 {success_count} 条，跳过 {skip_count} 条")
 
                 if success_count > 0 or skip_count > 0:
                     return ApiResponse.success(
@@ -624,9 +774,16 @@ async def get_kalodata_data_by_filters_service(request: Request) -> Response:
             filters["start_date"] = json_data.get("start_date")
         if "end_date" in json_data:
             filters["end_date"] = json_data.get("end_date")
-
-        # 获取排序条件
-        order_by = {"created_at": "desc"}  # 默认按创建时间倒序排序
+        # 指标范围过滤，如 revenue_min / views_max
+        for key in ("gpm", "revenue", "sales", "views", "roas", "ad2Cost", "follower_count"):
+            for suffix in ("_min", "_max"):
+                if json_data.get(key + suffix) is not None:
+                    filters[key + suffix] = json_data.get(key + suffix)
+
+        # 获取排序条件，可通过order_by指定，如 {"revenue": "desc"}
+        order_by = json_data.get("order_by")
+        if not isinstance(order_by, dict) or not order_by:
+            order_by = {"created_at": "desc"}  # 默认按创建时间倒序排序
         
         # 获取分页参数
         try:
@@ -800,6 +957,8 @@ async def update_kalodata_data_service(request: Request) -> Response:
                 # 更新数据
                 kalodata_data.update(request_data)
                 await video_search_crud.update_kalodata_data(db, kalodata_data)
+                from apps.search_video.top_index import TopVideoIndex
+                await TopVideoIndex.invalidate(kalodata_data.country, kalodata_data.category3)
                 
                 return ApiResponse.success(
                     message="kalodata数据更新成功",
@@ -844,7 +1003,10 @@ async def delete_kalodata_data_service(request: Request) -> Response:
         
         async with AsyncSessionLocal() as db:
             try:
-                await video_search_crud.delete_kalodata_data(db, id)
+                kalodata_data = await video_search_crud.delete_kalodata_data(db, id)
+                if kalodata_data:
+                    from apps.search_video.top_index import TopVideoIndex
+                    await TopVideoIndex.invalidate(kalodata_data.country, kalodata_data.category3)
                 
                 return ApiResponse.success(
                     message="kalodata数据删除成功"
@@ -866,6 +1028,7 @@ async def delete_kalodata_data_service(request: Request) -> Response:
 async def fetch_and_store_kalodata_by_categories_service(request: Request) -> Response:
     """
     根据所有三级类目批量获取并存储kalodata数据服务
+    创建后台爬取任务后立即返回，进度通过任务状态接口查询
     """
     try:
         # 获取请求参数
@@ -881,131 +1044,209 @@ async def fetch_and_store_kalodata_by_categories_service(request: Request) -> Re
 
         # 获取必要参数
         cookie = request_data.get("cookie")
-        country = request_data.get("country")
-        
-        # 设置日期范围（默认为最近7天）
-        end_date = datetime.now().strftime("%Y-%m-%d")
-        start_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+        countries = request_data.get("countries") or request_data.get("country")
+        if isinstance(countries, str):
+            countries = [country.strip() for country in countries.split(",") if country.strip()]
 
         # 参数验证
-        if not all([cookie, country]):
+        if not all([cookie, countries]):
             missing_params = []
             if not cookie: missing_params.append("cookie")
-            if not country: missing_params.append("country")
+            if not countries: missing_params.append("country")
             return ApiResponse.validation_error(f"以下参数不能为空: {', '.join(missing_params)}")
 
-        # 获取所有三级类目
-        async with AsyncSessionLocal() as db:
-            try:
-                category_level3 = await video_search_crud.get_category_level3(db)
-                if not category_level3:
-                    return ApiResponse.error(
-                        message="未找到任何三级类目数据",
-                        status_code=404
-                    )
-                
-                # 提取所有value值
-                category_values = [category.value for category in category_level3]
-                logger.info(f"获取到 {len(category_values)} 个三级类目")
-
-                # 统计结果
-                total_success = 0
-                total_skip = 0
-                total_fail = 0
-                failed_categories = []
-                processed_categories = []
-
-                # 遍历每个类目值进行数据获取和存储
-                for category_value in category_values:
-                    try:
-                        logger.info(f"开始处理类目 {category_value}")
-                        
-                        # 构造请求数据
-                        fetch_data = {
-                            "cookie": cookie,
-                            "country": country,
-                            "start_date": start_date,
-                            "end_date": end_date,
-                            "cate_ids": [category_value]
-                        }
-                        
-                        # 调用现有的获取存储函数
-                        mock_request = type('MockRequest', (), {'json': lambda: fetch_data})()
-                        result = await fetch_and_store_kalodata_service(mock_request)
-                        
-                        # 检查结果
-                        if result.status_code == 200:
-                            result_data = json.loads(result.description)
-                            if result_data.get("code") == 200:
-                                success_count = result_data.get("data", {}).get("success_count", 0)
-                                skip_count = result_data.get("data", {}).get("skip_count", 0)
-                                total_success += success_count
-                                total_skip += skip_count
-                                
-                                processed_categories.append({
-                                    "category": category_value,
-                                    "success_count": success_count,
-                                    "skip_count": skip_count
-                                })
-                                
-                                logger.info(f"类目 {category_value} 数据处理完成: 新增 {success_count} 条，跳过 {skip_count} 条")
-                            else:
-                                total_fail += 1
-                                failed_categories.append({
-                                    "category": category_value,
-                                    "error": result_data.get("message", "未知错误")
-                                })
-                                logger.error(f"类目 {category_value} 数据获取存储失败: {result_data.get('message')}")
-                        else:
-                            total_fail += 1
-                            failed_categories.append({
-                                "category": category_value,
-                                "error": "请求返回非200状态码",
-                                "status_code": result.status_code
-                            })
-                            logger.error(f"类目 {category_value} 数据获取存储失败: 状态码 {result.status_code}")
-                        
-                        # 随机等待3-5秒
-                        await asyncio.sleep(random.uniform(3, 5))
-                        
-                    except Exception as e:
-                        total_fail += 1
-                        failed_categories.append({
-                            "category": category_value,
-                            "error": str(e)
-                        })
-                        logger.error(f"处理类目 {category_value} 时发生错误: {str(e)}")
-                        await asyncio.sleep(random.uniform(3, 5))  # 即使失败也等待，避免请求过快
-                        continue
+        # 可选参数：日期范围（默认为最近7天）和指定类目
+        category_values = request_data.get("category_values")
+        if category_values is not None and not isinstance(category_values, list):
+            return ApiResponse.validation_error("category_values必须是列表格式")
 
-                # 返回处理结果
-                return ApiResponse.success(
-                    message=f"批量获取存储完成。新增: {total_success} 条，跳过: {total_skip} 条，失败类目: {total_fail} 个",
-                    data={
-                        "total_categories": len(category_values),
-                        "success_count": total_success,
-                        "skip_count": total_skip,
-                        "failed_categories_count": total_fail,
-                        "failed_categories": failed_categories,
-                        "processed_categories": processed_categories
-                    }
-                )
+        from apps.search_video.crawler import CrawlJobManager
+        try:
+            job = await CrawlJobManager.create_job(
+                cookie,
+                countries,
+                start_date=request_data.get("start_date"),
+                end_date=request_data.get("end_date"),
+                category_values=category_values
+            )
+        except ValueError as e:
+            return ApiResponse.error(
+                message=str(e),
+                status_code=404
+            )
 
-            except Exception as e:
-                logger.error(f"获取三级类目数据失败: {str(e)}")
-                return ApiResponse.error(
-                    message="获取三级类目数据失败",
-                    status_code=500
-                )
-                
+        return ApiResponse.success(
+            message=f"kalodata爬取任务已创建，共 {job.total_count} 个类目任务",
+            data=job.to_dict()
+        )
     except Exception as e:
         logger.error(f"批量获取并存储kalodata数据服务发生未知异常: {str(e)}")
         return ApiResponse.error(
             message=f"批量获取并存储kalodata数据失败: {str(e)}",
             status_code=500
         )
+
+async def get_kalodata_crawl_job_service(request: Request) -> Response:
+    """
+    获取kalodata爬取任务状态及进度服务
+    """
+    try:
+        job_id = request.path_params.get("job_id")
+        if not job_id or not str(job_id).isdigit():
+            return ApiResponse.validation_error("job_id格式错误")
+        job_id = int(job_id)
+
+        from apps.search_video.crawler import CrawlJobManager
+        async with AsyncSessionLocal() as db:
+            job = await video_search_crud.get_crawl_job(db, job_id)
+            if not job:
+                return ApiResponse.not_found("kalodata爬取任务不存在")
+
+            progress = await video_search_crud.get_crawl_job_progress(db, job_id)
+            failed_checkpoints = await video_search_crud.get_crawl_failed_checkpoints(db, job_id)
+
+        done_count = sum(item["done"] for item in progress.values())
+        failed_count = sum(item["failed"] for item in progress.values())
+        data = job.to_dict()
+        data.update({
+            "is_running": CrawlJobManager.is_running(job_id),
+            "done_count": done_count,
+            "failed_count": failed_count,
+            "pending_count": sum(item["pending"] for item in progress.values()),
+            "success_count": sum(item["success_count"] for item in progress.values()),
+            "skip_count": sum(item["skip_count"] for item in progress.values()),
+            "progress": round((done_count + failed_count) / job.total_count * 100, 2) if job.total_count else 100,
+            "countries_progress": progress,
+            "failed_categories": [checkpoint.to_dict() for checkpoint in failed_checkpoints]
+        })
+        return ApiResponse.success(data=data)
+    except Exception as e:
+        logger.error(f"获取kalodata爬取任务状态失败: {str(e)}")
+        return ApiResponse.error(
+            message="获取kalodata爬取任务状态失败",
+            status_code=500
+        )
+
+async def resume_kalodata_crawl_job_service(request: Request) -> Response:
+    """
+    从检查点继续kalodata爬取任务服务
+    可选参数 retry_failed: 是否重试失败的类目
+    """
+    try:
+        job_id = request.path_params.get("job_id")
+        if not job_id or not str(job_id).isdigit():
+            return ApiResponse.validation_error("job_id格式错误")
+        job_id = int(job_id)
+
+        try:
+            request_data = request.json() or {}
+        except Exception:
+            request_data = {}
+        retry_failed = bool(request_data.get("retry_failed", False))
+
+        async with AsyncSessionLocal() as db:
+            job = await video_search_crud.get_crawl_job(db, job_id)
+            if not job:
+                return ApiResponse.not_found("kalodata爬取任务不存在")
+
+        from apps.search_video.crawler import CrawlJobManager
+        if not CrawlJobManager.start(job_id, retry_failed=retry_failed):
+            return ApiResponse.error(
+                message="kalodata爬取任务正在运行中",
+                status_code=409
+            )
+
+        return ApiResponse.success(
+            message="kalodata爬取任务已继续执行",
+            data=job.to_dict()
+        )
+    except Exception as e:
+        logger.error(f"继续kalodata爬取任务失败: {str(e)}")
+        return ApiResponse.error(
+            message="继续kalodata爬取任务失败",
+            status_code=500
+        )
     
 
+async def get_kalodata_quota_service(request: Request) -> Response:
+    """
+    获取kalodata cookie池详情次数使用情况服务
+    """
+    try:
+        from apps.search_video.quota import KalodataQuota
+        pool = KalodataQuota.build_pool()
+        quota_status = await KalodataQuota.status(pool)
+        return ApiResponse.success(
+            data={
+                "total_cookies": len(pool),
+                "available_cookies": len([item for item in quota_status if not item["exhausted"]]),
+                "cookies": quota_status
+            }
+        )
+    except Exception as e:
+        logger.error(f"获取kalodata次数使用情况失败: {str(e)}")
+        return ApiResponse.error(
+            message="获取kalodata次数使用情况失败",
+            status_code=500
+        )
+
+async def get_kalodata_detail_cache_stats_service(request: Request) -> Response:
+    """
+    获取kalodata详情缓存命中统计服务
+    """
+    try:
+        from apps.search_video.detail_cache import DetailCache
+        return ApiResponse.success(data=DetailCache.stats())
+    except Exception as e:
+        logger.error(f"获取kalodata详情缓存统计失败: {str(e)}")
+        return ApiResponse.error(
+            message="获取kalodata详情缓存统计失败",
+            status_code=500
+        )
+
+async def backfill_kalodata_numeric_service(request: Request) -> Response:
+    """
+    启动kalodata指标数值列回填任务服务
+    可选参数 batch_size: 每批条数，start_id: 从该ID之后开始回填
+    """
+    try:
+        try:
+            request_data = request.json() or {}
+        except Exception:
+            request_data = {}
+
+        try:
+            batch_size = int(request_data.get("batch_size", 500))
+            start_id = int(request_data.get("start_id", 0))
+        except ValueError:
+            return ApiResponse.validation_error("batch_size和start_id必须是整数")
+        if batch_size < 1 or batch_size > 5000:
+            return ApiResponse.validation_error("batch_size必须在1到5000之间")
+
+        from apps.search_video.backfill import NumericBackfillJob
+        if not NumericBackfillJob.start(batch_size=batch_size, start_id=start_id):
+            return ApiResponse.error(
+                message="回填任务正在运行中",
+                status_code=409
+            )
+        return ApiResponse.success(
+            message="kalodata指标数值列回填任务已启动",
+            data=NumericBackfillJob.status()
+        )
+    except Exception as e:
+        logger.error(f"启动kalodata指标数值列回填任务失败: {str(e)}")
+        return ApiResponse.error(
+            message="启动回填任务失败",
+            status_code=500
+        )
+
+async def get_kalodata_numeric_backfill_status_service(request: Request) -> Response:
+    """
+    获取kalodata指标数值列回填任务进度服务
+    """
+    from apps.search_video.backfill import NumericBackfillJob
+    return ApiResponse.success(data=NumericBackfillJob.status())
+
 async def get_kalodata_data_statistics_service(request: Request) -> Response:
     """
     获取kalodata数据统计信息服务 - 返回指定country和category3的记录总数和最新end_date
@@ -1208,7 +1449,7 @@ async def fetch_and_store_kalodata_service2(request: Request) -> Response:
         try:
             from apps.search_video.utils import get_complete_video_data
             logger.info(f"开始从kalodata获取数据，参数：country={country}, start_date={start_date}, end_date={end_date}, cate_ids={cate_ids}")
-            video_data = get_complete_video_data(cookie, country, start_date, end_date, cate_ids)
+            video_data = await get_complete_video_data(cookie, country, start_date, end_date, cate_ids)
             logger.info(f"从kalodata获取到 {len(video_data) if video_data else 0} 条数据")
         except Exception as e:
             logger.error(f"从kalodata获取数据失败: {str(e)}")
@@ -1235,98 +1476,12 @@ async def fetch_and_store_kalodata_service2(request: Request) -> Response:
                     category3_label = await get_category3_label(db, category_id)
                     logger.info(f"三级类目ID {category_id} 对应的名称: {category3_label}")
                 
-                success_count = 0
-                skip_count = 0
-                for video in video_data:
-                    try:
-                        # 构建数据模型
-                        kalodata_data = {
-                            "country": video.get("region", ""),
-                            "has_ad": video.get("ad") == 1,
-                            "video_name": video.get("description", ""),
-                            "gpm": str(video.get("gpm", "")),
-                            "cpm": str(video.get("ad_cpa", "")),
-                            "ad_view_ratio": str(video.get("ad_view_ratio", "")),
-                            "duration": str(video.get("duration", "")),
-                            "revenue": str(video.get("revenue", "")),
-                            "sales": str(video.get("sale", "")),
-                            "roas": str(video.get("ad2Roas", "")),
-                            "ad2Cost": str(video.get("ad2Cost", "")),
-                            "views": str(video.get("views", "")),
-                            "product_title": video.get("product_title", ""),
-                            "product_price": str(video.get("product_price", "")),
-                            "video_url": video.get("video_url", ""),
-                            "tiktok_url": video.get("tiktok_url", ""),
-                            "product_url": video.get("product_url", ""),
-                            "product_image": "",  # 暂时为空，因为原始数据中没有这个字段
-                            "username": video.get("username", video.get("handle", "")),
-                            "follower_count": str(video.get("follower_count", "")),
-                            "hashtags": ",".join(video.get("hashtags", [])),
-                            "start_date": start_date,
-                            "end_date": end_date,
-                            "is_deleted": False
-                        }
-                        
-                        # 处理API限制情况下的默认值
-                        # 判断是否是API受限的情况 - 检查是否有关键字段为'unknown'
-                        is_api_limited = (
-                            video.get("product_title") == "unknown" or 
-                            video.get("product_price") == "unknown" or 
-                            video.get("follower_count") == "unknown" or
-                            video.get("username") == "unknown"
-                        )
-                        
-                        # 如果是API受限情况，确保所有必要字段都设置为'unknown'
-                        if is_api_limited:
-                            if kalodata_data["product_title"] == "":
-                                kalodata_data["product_title"] = "unknown"
-                            if kalodata_data["product_price"] == "":
-                                kalodata_data["product_price"] = "unknown"
-                            if kalodata_data["username"] == "":
-                                kalodata_data["username"] = "unknown"
-                            if kalodata_data["follower_count"] == "":
-                                kalodata_data["follower_count"] = "unknown"
-                        
-                        # 处理类目字段
-                        # 1. 获取原始类目ID
-                        kalodata_data["category1"] = video.get("product_pri_cate_id", "")
-                        kalodata_data["category2"] = video.get("product_sec_cate_id", "")
-                        
-                        # 2. 处理三级类目
-                        ter_cate_id = video.get("product_ter_cate_id", "")
-                        
-                        # 如果三级类目ID不为空，但是API受限（无法获取产品详情）
-                        if ter_cate_id and is_api_limited:
-                            # 使用类目ID匹配到的名称
-                            if category3_label and ter_cate_id == cate_ids[0]:
-                                kalodata_data["category3"] = category3_label
-                            else:
-                                # 如果没有匹配到，尝试查询数据库获取类目名称
-                                ter_category_label = await get_category3_label(db, ter_cate_id)
-                                kalodata_data["category3"] = ter_category_label
-                        else:
-                            # 正常情况下，保留原始三级类目ID
-                            kalodata_data["category3"] = ter_cate_id
-
-                        # 检查数据是否已存在
-                        exists = await video_search_crud.check_kalodata_exists(db, {
-                            "country": kalodata_data["country"],
-                            "video_name": kalodata_data["video_name"],
-                            "product_title": kalodata_data["product_title"],
-                            "start_date": kalodata_data["start_date"],
-                            "end_date": kalodata_data["end_date"]
-                        })
-
-                        if exists:
-                            logger.info(f"数据已存在，跳过: country={kalodata_data['country']}, video_name={kalodata_data['video_name']}, product_title={kalodata_data['product_title']}")
-                            skip_count += 1
-                            continue
-                        
-                        await video_search_crud.create_kalodata_data(db, kalodata_data)
-                        success_count += 1
-                    except Exception as e:
-                        logger.error(f"存储单条kalodata数据失败: {str(e)}, 数据: {video}")
-                        continue
+                rows = await build_kalodata_rows(db, video_data, start_date, end_date, cate_ids, category3_label)
+                success_count, skip_count = await video_search_crud.bulk_upsert_kalodata_data(db, rows)
+                if success_count > 0:
+                    from apps.search_video.top_index import TopVideoIndex
+                    await TopVideoIndex.refresh_for_rows(db, rows)
+                logger.info(f"kalodata数据批量写入完成: 新增 {success_count} 条，跳过 {skip_count} 条")
 
                 if success_count > 0 or skip_count > 0:
                     return ApiResponse.success(
@@ -1378,7 +1533,6 @@ async def fetch_and_store_kalodata_by_category1_service(request: Request) -> Res
         category1_value = request_data.get("category1")  # 一级类目的value值
         
         # 设置日期范围（默认为前一天和前7天）
-        from datetime import datetime, timedelta
         end_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
         start_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
 
@@ -1399,197 +1553,198 @@ async def fetch_and_store_kalodata_by_category1_service(request: Request) -> Res
         category2_info = []
         category3_info = []
 
-        async with AsyncSessionLocal() as db:
-            try:
-                # 1. 获取指定一级类目下的所有二级类目
-                logger.info(f"开始获取一级类目 {category1_value} 下的所有二级类目")
-                category2_list = await video_search_crud.get_category_level2_by_filters(db, {"parent_value": category1_value})
-                if not category2_list:
-                    return ApiResponse.error(
-                        message=f"未找到一级类目 {category1_value} 下的任何二级类目数据",
-                        status_code=404
-                    )
+        try:
+            # 1. 获取指定一级类目下的所有二级类目
+            logger.info(f"开始获取一级类目 {category1_value} 下的所有二级类目")
+            from apps.search_video.category_index import CategoryRegistry
+            category_index = await CategoryRegistry.get()
+            category2_list = category_index.get_level2_children(category1_value)
+            if not category2_list:
+                return ApiResponse.error(
+                    message=f"未找到一级类目 {category1_value} 下的任何二级类目数据",
+                    status_code=404
+                )
                 
-                logger.info(f"获取到 {len(category2_list)} 个二级类目")
+            logger.info(f"获取到 {len(category2_list)} 个二级类目")
                 
-                # 2. 遍历每个二级类目，获取其下的所有三级类目
-                all_category3 = []
-                for category2 in category2_list:
-                    category2_value = category2.value
-                    category2_info.append({
-                        "value": category2_value,
-                        "label": category2.label
-                    })
+            # 2. 遍历每个二级类目，获取其下的所有三级类目
+            all_category3 = []
+            for category2 in category2_list:
+                category2_value = category2.value
+                category2_info.append({
+                    "value": category2_value,
+                    "label": category2.label
+                })
                     
-                    logger.info(f"获取二级类目 {category2_value} 下的所有三级类目")
-                    category3_list = await video_search_crud.get_category_level3_by_filters(db, {"parent_value": category2_value})
+                logger.info(f"获取二级类目 {category2_value} 下的所有三级类目")
+                category3_list = category_index.get_level3_children(category2_value)
                     
-                    if category3_list:
-                        # 记录二级类目下有多少三级类目
-                        current_category3_info = []
-                        for category3 in category3_list:
-                            all_category3.append(category3)
-                            current_category3_info.append({
-                                "value": category3.value,
-                                "label": category3.label
-                            })
-                        
-                        category3_info.append({
-                            "category2_value": category2_value,
-                            "category2_label": category2.label,
-                            "category3_list": current_category3_info,
-                            "count": len(current_category3_info)
+                if category3_list:
+                    # 记录二级类目下有多少三级类目
+                    current_category3_info = []
+                    for category3 in category3_list:
+                        all_category3.append(category3)
+                        current_category3_info.append({
+                            "value": category3.value,
+                            "label": category3.label
                         })
+                        
+                    category3_info.append({
+                        "category2_value": category2_value,
+                        "category2_label": category2.label,
+                        "category3_list": current_category3_info,
+                        "count": len(current_category3_info)
+                    })
                 
-                if not all_category3:
-                    return ApiResponse.error(
-                        message=f"未找到一级类目 {category1_value} 下的任何三级类目数据",
-                        status_code=404
-                    )
+            if not all_category3:
+                return ApiResponse.error(
+                    message=f"未找到一级类目 {category1_value} 下的任何三级类目数据",
+                    status_code=404
+                )
                 
-                logger.info(f"共找到 {len(all_category3)} 个三级类目")
+            logger.info(f"共找到 {len(all_category3)} 个三级类目")
                 
-                # 3. 遍历每个三级类目，获取并存储数据
-                for category3 in all_category3:
-                    # 随机等待3-5秒，避免请求过快
-                    await asyncio.sleep(random.uniform(1, 3))
-                    try:
-                        category3_value = category3.value
-                        category3_label = category3.label
+            # 3. 遍历每个三级类目，获取并存储数据
+            for category3 in all_category3:
+                # 随机等待3-5秒，避免请求过快
+                await asyncio.sleep(random.uniform(1, 3))
+                try:
+                    category3_value = category3.value
+                    category3_label = category3.label
                         
-                        logger.info(f"开始处理三级类目 {category3_label}({category3_value})")
+                    logger.info(f"开始处理三级类目 {category3_label}({category3_value})")
                         
-                        # 构造请求数据
-                        fetch_data = {
-                            "cookie": cookie,
-                            "country": country,
-                            "start_date": start_date,
-                            "end_date": end_date,
-                            "cate_ids": [category3_value]
-                        }
+                    # 构造请求数据
+                    fetch_data = {
+                        "cookie": cookie,
+                        "country": country,
+                        "start_date": start_date,
+                        "end_date": end_date,
+                        "cate_ids": [category3_value]
+                    }
                         
-                        # 调用现有的获取存储函数
-                        try:
-                            # 直接将数据字典传递给服务函数
-                            logger.info(f"调用fetch_and_store_kalodata_service2获取数据，参数: {fetch_data}")
-                            result = await fetch_and_store_kalodata_service2(fetch_data)
+                    # 调用现有的获取存储函数
+                    try:
+                        # 直接将数据字典传递给服务函数
+                        logger.info(f"调用fetch_and_store_kalodata_service2获取数据，参数: {fetch_data}")
+                        result = await fetch_and_store_kalodata_service2(fetch_data)
                             
-                            # 检查结果
-                            if result.status_code == 200:
-                                try:
-                                    # 检查结果类型
-                                    if hasattr(result, 'description') and isinstance(result.description, str):
-                                        # ApiResponse类型
-                                        try:
-                                            result_data = json.loads(result.description)
-                                        except json.JSONDecodeError:
-                                            # 如果不是JSON字符串，直接使用
-                                            result_data = {"code": 200, "message": result.description}
-                                    elif isinstance(result, dict):
-                                        # 已经是字典格式
-                                        result_data = result
-                                    else:
-                                        # 其他格式，尝试获取数据
-                                        result_data = {"code": 200, "message": "数据处理成功但无法解析结果"}
+                        # 检查结果
+                        if result.status_code == 200:
+                            try:
+                                # 检查结果类型
+                                if hasattr(result, 'description') and isinstance(result.description, str):
+                                    # ApiResponse类型
+                                    try:
+                                        result_data = json.loads(result.description)
+                                    except json.JSONDecodeError:
+                                        # 如果不是JSON字符串，直接使用
+                                        result_data = {"code": 200, "message": result.description}
+                                elif isinstance(result, dict):
+                                    # 已经是字典格式
+                                    result_data = result
+                                else:
+                                    # 其他格式，尝试获取数据
+                                    result_data = {"code": 200, "message": "数据处理成功但无法解析结果"}
                                     
-                                    logger.info(f"服务返回的处理结果: {result_data}")
+                                logger.info(f"服务返回的处理结果: {result_data}")
                                     
-                                    if result_data.get("code") == 200:
-                                        # 提取成功和跳过计数，兼容不同数据结构
-                                        if "data" in result_data and isinstance(result_data["data"], dict):
-                                            success_count = result_data.get("data", {}).get("success_count", 0)
-                                            skip_count = result_data.get("data", {}).get("skip_count", 0)
-                                        else:
-                                            # 数据不符合预期结构，尝试其他位置
-                                            success_count = result_data.get("success_count", 0)
-                                            skip_count = result_data.get("skip_count", 0)
+                                if result_data.get("code") == 200:
+                                    # 提取成功和跳过计数，兼容不同数据结构
+                                    if "data" in result_data and isinstance(result_data["data"], dict):
+                                        success_count = result_data.get("data", {}).get("success_count", 0)
+                                        skip_count = result_data.get("data", {}).get("skip_count", 0)
+                                    else:
+                                        # 数据不符合预期结构，尝试其他位置
+                                        success_count = result_data.get("success_count", 0)
+                                        skip_count = result_data.get("skip_count", 0)
                                         
-                                        total_success += success_count
-                                        total_skip += skip_count
+                                    total_success += success_count
+                                    total_skip += skip_count
                                         
-                                        processed_categories.append({
-                                            "category3_value": category3_value,
-                                            "category3_label": category3_label,
-                                            "success_count": success_count,
-                                            "skip_count": skip_count
-                                        })
+                                    processed_categories.append({
+                                        "category3_value": category3_value,
+                                        "category3_label": category3_label,
+                                        "success_count": success_count,
+                                        "skip_count": skip_count
+                                    })
                                         
-                                        # 添加到category3_info
-                                        category3_info.append({
-                                            "value": category3_value,
-                                            "label": category3_label,
-                                            "success_count": success_count,
-                                            "skip_count": skip_count
-                                        })
+                                    # 添加到category3_info
+                                    category3_info.append({
+                                        "value": category3_value,
+                                        "label": category3_label,
+                                        "success_count": success_count,
+                                        "skip_count": skip_count
+                                    })
                                         
-                                        logger.info(f"三级类目 {category3_label}({category3_value}) 数据处理完成: 新增 {success_count} 条，跳过 {skip_count} 条")
-                                    else:
-                                        # 结果返回非成功状态码
-                                        raise Exception(f"返回码不为200: {result_data.get('message', '未知错误')}")
-                                except Exception as parse_error:
-                                    logger.error(f"解析结果数据失败: {str(parse_error)}")
-                                    raise
-                            else:
-                                # 处理非200状态码
-                                error_message = f"请求返回非200状态码: {result.status_code}"
-                                if hasattr(result, 'description'):
-                                    try:
-                                        error_data = json.loads(result.description)
-                                        if 'message' in error_data:
-                                            error_message = error_data['message']
-                                    except:
-                                        pass
-                                raise Exception(error_message)
+                                    logger.info(f"三级类目 {category3_label}({category3_value}) 数据处理完成: 新增 {success_count} 条，跳过 {skip_count} 条")
+                                else:
+                                    # 结果返回非成功状态码
+                                    raise Exception(f"返回码不为200: {result_data.get('message', '未知错误')}")
+                            except Exception as parse_error:
+                                logger.error(f"解析结果数据失败: {str(parse_error)}")
+                                raise
+                        else:
+                            # 处理非200状态码
+                            error_message = f"请求返回非200状态码: {result.status_code}"
+                            if hasattr(result, 'description'):
+                                try:
+                                    error_data = json.loads(result.description)
+                                    if 'message' in error_data:
+                                        error_message = error_data['message']
+                                except:
+                                    pass
+                            raise Exception(error_message)
                                 
-                        except Exception as service_error:
-                            logger.error(f"调用fetch_and_store_kalodata_service失败: {str(service_error)}")
-                            total_fail += 1
-                            failed_categories.append({
-                                "category3_value": category3_value,
-                                "category3_label": category3_label,
-                                "error": str(service_error)
-                            })
-                            logger.error(f"三级类目 {category3_label}({category3_value}) 数据获取存储失败: {str(service_error)}")
-                            
-                        # 随机等待3-5秒，避免请求过快
-                        await asyncio.sleep(random.uniform(3, 5))
-                        
-                    except Exception as e:
+                    except Exception as service_error:
+                        logger.error(f"调用fetch_and_store_kalodata_service失败: {str(service_error)}")
                         total_fail += 1
                         failed_categories.append({
                             "category3_value": category3_value,
                             "category3_label": category3_label,
-                            "error": str(e)
+                            "error": str(service_error)
                         })
-                        logger.error(f"处理三级类目 {category3_label}({category3_value}) 时发生错误: {str(e)}")
-                        await asyncio.sleep(random.uniform(3, 5))  # 即使失败也等待，避免请求过快
-                        continue
-
-                # 返回处理结果
-                return ApiResponse.success(
-                    message=f"根据一级类目和国家批量获取存储完成。新增: {total_success} 条，跳过: {total_skip} 条，失败类目: {total_fail} 个",
-                    data={
-                        "category1_value": category1_value,
-                        "country": country,
-                        "total_category2": len(category2_list),
-                        "total_category3": len(all_category3),
-                        "start_date": start_date,
-                        "end_date": end_date,
-                        "success_count": total_success,
-                        "skip_count": total_skip,
-                        "failed_categories_count": total_fail,
-                        "category2_info": category2_info,
-                        "category3_info": category3_info,
-                        "failed_categories": failed_categories,
-                        "processed_categories": processed_categories
-                    }
-                )
-            except Exception as e:
-                logger.error(f"获取类目数据失败: {str(e)}")
-                return ApiResponse.error(
-                    message=f"获取类目数据失败: {str(e)}",
-                    status_code=500
-                )
+                        logger.error(f"三级类目 {category3_label}({category3_value}) 数据获取存储失败: {str(service_error)}")
+                            
+                    # 随机等待3-5秒，避免请求过快
+                    await asyncio.sleep(random.uniform(3, 5))
+                        
+                except Exception as e:
+                    total_fail += 1
+                    failed_categories.append({
+                        "category3_value": category3_value,
+                        "category3_label": category3_label,
+                        "error": str(e)
+                    })
+                    logger.error(f"处理三级类目 {category3_label}({category3_value}) 时发生错误: {str(e)}")
+                    await asyncio.sleep(random.uniform(3, 5))  # 即使失败也等待，避免请求过快
+                    continue
+
+            # 返回处理结果
+            return ApiResponse.success(
+                message=f"根据一级类目和国家批量获取存储完成。新增: {total_success} 条，跳过: {total_skip} 条，失败类目: {total_fail} 个",
+                data={
+                    "category1_value": category1_value,
+                    "country": country,
+                    "total_category2": len(category2_list),
+                    "total_category3": len(all_category3),
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "success_count": total_success,
+                    "skip_count": total_skip,
+                    "failed_categories_count": total_fail,
+                    "category2_info": category2_info,
+                    "category3_info": category3_info,
+                    "failed_categories": failed_categories,
+                    "processed_categories": processed_categories
+                }
+            )
+        except Exception as e:
+            logger.error(f"获取类目数据失败: {str(e)}")
+            return ApiResponse.error(
+                message=f"获取类目数据失败: {str(e)}",
+                status_code=500
+            )
     except Exception as e:
         logger.error(f"根据一级类目和国家批量获取并存储kalodata数据服务发生未知异常: {str(e)}")
         return ApiResponse.error(
@@ -1620,7 +1775,6 @@ async def fetch_and_store_kalodata_by_category2_service(request: Request) -> Res
         category2_value = request_data.get("category2")  # 二级类目的value值
         
         # 设置日期范围（默认为前一天和前7天）
-        from datetime import datetime, timedelta
         end_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
         start_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
 
@@ -1646,171 +1800,172 @@ async def fetch_and_store_kalodata_by_category2_service(request: Request) -> Res
         processed_categories = []
         category3_info = []
 
-        async with AsyncSessionLocal() as db:
-            try:
-                # 1. 获取指定二级类目信息
-                logger.info(f"开始获取二级类目 {category2_value} 信息")
-                category2_query = await video_search_crud.get_category_level2_by_value(db, category2_value)
-                if not category2_query:
-                    return ApiResponse.error(
-                        message=f"未找到二级类目 {category2_value}",
-                        status_code=404
-                    )
+        try:
+            # 1. 获取指定二级类目信息
+            logger.info(f"开始获取二级类目 {category2_value} 信息")
+            from apps.search_video.category_index import CategoryRegistry
+            category_index = await CategoryRegistry.get()
+            category2_query = category_index.level2_by_value.get(category2_value)
+            if not category2_query:
+                return ApiResponse.error(
+                    message=f"未找到二级类目 {category2_value}",
+                    status_code=404
+                )
                 
-                category2_label = category2_query.label
+            category2_label = category2_query.label
                 
-                # 2. 获取指定二级类目下的所有三级类目
-                logger.info(f"获取二级类目 {category2_value} 下的所有三级类目")
-                category3_list = await video_search_crud.get_category_level3_by_filters(db, {"parent_value": category2_value})
+            # 2. 获取指定二级类目下的所有三级类目
+            logger.info(f"获取二级类目 {category2_value} 下的所有三级类目")
+            category3_list = category_index.get_level3_children(category2_value)
                 
-                if not category3_list:
-                    return ApiResponse.error(
-                        message=f"未找到二级类目 {category2_value} 下的任何三级类目数据",
-                        status_code=404
-                    )
+            if not category3_list:
+                return ApiResponse.error(
+                    message=f"未找到二级类目 {category2_value} 下的任何三级类目数据",
+                    status_code=404
+                )
                 
-                logger.info(f"获取到 {len(category3_list)} 个三级类目")
+            logger.info(f"获取到 {len(category3_list)} 个三级类目")
                 
-                # 3. 遍历每个三级类目，获取并存储数据
-                for category3 in category3_list:
-                    # 随机等待1-3秒，避免请求过快
-                    await asyncio.sleep(random.uniform(1, 3))
-                    try:
-                        category3_value = category3.value
-                        category3_label = category3.label
+            # 3. 遍历每个三级类目，获取并存储数据
+            for category3 in category3_list:
+                # 随机等待1-3秒，避免请求过快
+                await asyncio.sleep(random.uniform(1, 3))
+                try:
+                    category3_value = category3.value
+                    category3_label = category3.label
                         
-                        logger.info(f"开始处理三级类目 {category3_label}({category3_value})")
+                    logger.info(f"开始处理三级类目 {category3_label}({category3_value})")
                         
-                        # 构造请求数据
-                        fetch_data = {
-                            "cookie": cookie,
-                            "country": country,
-                            "start_date": start_date,
-                            "end_date": end_date,
-                            "cate_ids": [category3_value]
-                        }
+                    # 构造请求数据
+                    fetch_data = {
+                        "cookie": cookie,
+                        "country": country,
+                        "start_date": start_date,
+                        "end_date": end_date,
+                        "cate_ids": [category3_value]
+                    }
                         
-                        # 调用现有的获取存储函数
-                        try:
-                            # 直接将数据字典传递给服务函数
-                            logger.info(f"调用fetch_and_store_kalodata_service2获取数据，参数: {fetch_data}")
-                            result = await fetch_and_store_kalodata_service2(fetch_data)
+                    # 调用现有的获取存储函数
+                    try:
+                        # 直接将数据字典传递给服务函数
+                        logger.info(f"调用fetch_and_store_kalodata_service2获取数据，参数: {fetch_data}")
+                        result = await fetch_and_store_kalodata_service2(fetch_data)
                             
-                            # 检查结果
-                            if result.status_code == 200:
-                                try:
-                                    # 检查结果类型
-                                    if hasattr(result, 'description') and isinstance(result.description, str):
-                                        # ApiResponse类型
-                                        try:
-                                            result_data = json.loads(result.description)
-                                        except json.JSONDecodeError:
-                                            # 如果不是JSON字符串，直接使用
-                                            result_data = {"code": 200, "message": result.description}
-                                    elif isinstance(result, dict):
-                                        # 已经是字典格式
-                                        result_data = result
-                                    else:
-                                        # 其他格式，尝试获取数据
-                                        result_data = {"code": 200, "message": "数据处理成功但无法解析结果"}
+                        # 检查结果
+                        if result.status_code == 200:
+                            try:
+                                # 检查结果类型
+                                if hasattr(result, 'description') and isinstance(result.description, str):
+                                    # ApiResponse类型
+                                    try:
+                                        result_data = json.loads(result.description)
+                                    except json.JSONDecodeError:
+                                        # 如果不是JSON字符串，直接使用
+                                        result_data = {"code": 200, "message": result.description}
+                                elif isinstance(result, dict):
+                                    # 已经是字典格式
+                                    result_data = result
+                                else:
+                                    # 其他格式，尝试获取数据
+                                    result_data = {"code": 200, "message": "数据处理成功但无法解析结果"}
                                     
-                                    logger.info(f"服务返回的处理结果: {result_data}")
+                                logger.info(f"服务返回的处理结果: {result_data}")
                                     
-                                    if result_data.get("code") == 200:
-                                        # 提取成功和跳过计数，兼容不同数据结构
-                                        if "data" in result_data and isinstance(result_data["data"], dict):
-                                            success_count = result_data.get("data", {}).get("success_count", 0)
-                                            skip_count = result_data.get("data", {}).get("skip_count", 0)
-                                        else:
-                                            # 数据不符合预期结构，尝试其他位置
-                                            success_count = result_data.get("success_count", 0)
-                                            skip_count = result_data.get("skip_count", 0)
+                                if result_data.get("code") == 200:
+                                    # 提取成功和跳过计数，兼容不同数据结构
+                                    if "data" in result_data and isinstance(result_data["data"], dict):
+                                        success_count = result_data.get("data", {}).get("success_count", 0)
+                                        skip_count = result_data.get("data", {}).get("skip_count", 0)
+                                    else:
+                                        # 数据不符合预期结构，尝试其他位置
+                                        success_count = result_data.get("success_count", 0)
+                                        skip_count = result_data.get("skip_count", 0)
                                         
-                                        total_success += success_count
-                                        total_skip += skip_count
+                                    total_success += success_count
+                                    total_skip += skip_count
                                         
-                                        processed_categories.append({
-                                            "category3_value": category3_value,
-                                            "category3_label": category3_label,
-                                            "success_count": success_count,
-                                            "skip_count": skip_count
-                                        })
+                                    processed_categories.append({
+                                        "category3_value": category3_value,
+                                        "category3_label": category3_label,
+                                        "success_count": success_count,
+                                        "skip_count": skip_count
+                                    })
                                         
-                                        # 添加到category3_info
-                                        category3_info.append({
-                                            "value": category3_value,
-                                            "label": category3_label,
-                                            "success_count": success_count,
-                                            "skip_count": skip_count
-                                        })
+                                    # 添加到category3_info
+                                    category3_info.append({
+                                        "value": category3_value,
+                                        "label": category3_label,
+                                        "success_count": success_count,
+                                        "skip_count": skip_count
+                                    })
                                         
-                                        logger.info(f"三级类目 {category3_label}({category3_value}) 数据处理完成: 新增 {success_count} 条，跳过 {skip_count} 条")
-                                    else:
-                                        # 结果返回非成功状态码
-                                        raise Exception(f"返回码不为200: {result_data.get('message', '未知错误')}")
-                                except Exception as parse_error:
-                                    logger.error(f"解析结果数据失败: {str(parse_error)}")
-                                    raise
-                            else:
-                                # 处理非200状态码
-                                error_message = f"请求返回非200状态码: {result.status_code}"
-                                if hasattr(result, 'description'):
-                                    try:
-                                        error_data = json.loads(result.description)
-                                        if 'message' in error_data:
-                                            error_message = error_data['message']
-                                    except:
-                                        pass
-                                raise Exception(error_message)
+                                    logger.info(f"三级类目 {category3_label}({category3_value}) 数据处理完成: 新增 {success_count} 条，跳过 {skip_count} 条")
+                                else:
+                                    # 结果返回非成功状态码
+                                    raise Exception(f"返回码不为200: {result_data.get('message', '未知错误')}")
+                            except Exception as parse_error:
+                                logger.error(f"解析结果数据失败: {str(parse_error)}")
+                                raise
+                        else:
+                            # 处理非200状态码
+                            error_message = f"请求返回非200状态码: {result.status_code}"
+                            if hasattr(result, 'description'):
+                                try:
+                                    error_data = json.loads(result.description)
+                                    if 'message' in error_data:
+                                        error_message = error_data['message']
+                                except:
+                                    pass
+                            raise Exception(error_message)
                                 
-                        except Exception as service_error:
-                            logger.error(f"调用fetch_and_store_kalodata_service失败: {str(service_error)}")
-                            total_fail += 1
-                            failed_categories.append({
-                                "category3_value": category3_value,
-                                "category3_label": category3_label,
-                                "error": str(service_error)
-                            })
-                            logger.error(f"三级类目 {category3_label}({category3_value}) 数据获取存储失败: {str(service_error)}")
-                            
-                        # 随机等待3-5秒，避免请求过快
-                        await asyncio.sleep(random.uniform(3, 5))
-                        
-                    except Exception as e:
+                    except Exception as service_error:
+                        logger.error(f"调用fetch_and_store_kalodata_service失败: {str(service_error)}")
                         total_fail += 1
                         failed_categories.append({
                             "category3_value": category3_value,
                             "category3_label": category3_label,
-                            "error": str(e)
+                            "error": str(service_error)
                         })
-                        logger.error(f"处理三级类目 {category3_label}({category3_value}) 时发生错误: {str(e)}")
-                        await asyncio.sleep(random.uniform(3, 5))  # 即使失败也等待，避免请求过快
-                        continue
-
-                # 返回处理结果
-                return ApiResponse.success(
-                    message=f"根据二级类目和国家批量获取存储完成。新增: {total_success} 条，跳过: {total_skip} 条，失败类目: {total_fail} 个",
-                    data={
-                        "category2_value": category2_value,
-                        "category2_label": category2_label,
-                        "country": country,
-                        "total_category3": len(category3_list),
-                        "start_date": start_date,
-                        "end_date": end_date,
-                        "success_count": total_success,
-                        "skip_count": total_skip,
-                        "failed_categories_count": total_fail,
-                        "category3_info": category3_info,
-                        "failed_categories": failed_categories,
-                        "processed_categories": processed_categories
-                    }
-                )
-            except Exception as e:
-                logger.error(f"获取类目数据失败: {str(e)}")
-                return ApiResponse.error(
-                    message=f"获取类目数据失败: {str(e)}",
-                    status_code=500
-                )
+                        logger.error(f"三级类目 {category3_label}({category3_value}) 数据获取存储失败: {str(service_error)}")
+                            
+                    # 随机等待3-5秒，避免请求过快
+                    await asyncio.sleep(random.uniform(3, 5))
+                        
+                except Exception as e:
+                    total_fail += 1
+                    failed_categories.append({
+                        "category3_value": category3_value,
+                        "category3_label": category3_label,
+                        "error": str(e)
+                    })
+                    logger.error(f"处理三级类目 {category3_label}({category3_value}) 时发生错误: {str(e)}")
+                    await asyncio.sleep(random.uniform(3, 5))  # 即使失败也等待，避免请求过快
+                    continue
+
+            # 返回处理结果
+            return ApiResponse.success(
+                message=f"根据二级类目和国家批量获取存储完成。新增: {total_success} 条，跳过: {total_skip} 条，失败类目: {total_fail} 个",
+                data={
+                    "category2_value": category2_value,
+                    "category2_label": category2_label,
+                    "country": country,
+                    "total_category3": len(category3_list),
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "success_count": total_success,
+                    "skip_count": total_skip,
+                    "failed_categories_count": total_fail,
+                    "category3_info": category3_info,
+                    "failed_categories": failed_categories,
+                    "processed_categories": processed_categories
+                }
+            )
+        except Exception as e:
+            logger.error(f"获取类目数据失败: {str(e)}")
+            return ApiResponse.error(
+                message=f"获取类目数据失败: {str(e)}",
+                status_code=500
+            )
     except Exception as e:
         logger.error(f"根据二级类目和国家批量获取并存储kalodata数据服务发生未知异常: {str(e)}")
         return ApiResponse.error(
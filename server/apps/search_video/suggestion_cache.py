@@ -0,0 +1,97 @@
+"""
+拍摄建议缓存
+
+同一天里大量用户会搜索相同的 (商品名称, 类目, 国家)，拍摄建议按规范化后的组合缓存在 Redis 中，
+多个worker共享；同一进程内相同组合的并发请求只调用一次大模型
+"""
+import os
+import re
+import asyncio
+import hashlib
+import unicodedata
+from core.cache import Cache
+from core.logger import setup_logger
+
+logger = setup_logger('shooting_suggestion_cache')
+
+# 拍摄建议缓存的过期时间（秒）
+SUGGESTION_CACHE_TTL = int(os.getenv('SUGGESTION_CACHE_TTL', 86400))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_product_name(product_name: str) -> str:
+    """规范化商品名称：全角转半角、统一小写、合并空白"""
+    text = unicodedata.normalize('NFKC', product_name or '')
+    return _WHITESPACE.sub(' ', text).strip().lower()
+
+
+def _short_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class SuggestionCache:
+    """
+    拍摄建议缓存
+    """
+    _inflight = {}
+
+    @staticmethod
+    def _key(product_name: str = None, category: str = None, country: str = None) -> str:
+        """缓存键，未指定的部分用 * 代替（用于按模式清除）"""
+        return "search_video:suggestion:{}:{}:{}".format(
+            _short_hash(country) if country else "*",
+            _short_hash(category) if category else "*",
+            _short_hash(normalize_product_name(product_name)) if product_name else "*"
+        )
+
+    @classmethod
+    async def get_or_generate(cls, product_name: str, category: str, country: str, generate):
+        """
+        优先从缓存获取拍摄建议，未命中时调用大模型生成并缓存
+
+        参数:
+            product_name: 商品名称
+            category: 商品类目
+            country: 销售国家
+            generate: 未命中时调用的协程函数（无参数），失败时返回False
+
+        返回:
+            dict: 拍摄建议，生成失败时返回False
+        """
+        key = cls._key(product_name, category, country)
+        try:
+            cached = await Cache.get(key)
+            if cached is not None:
+                logger.info(f"拍摄建议缓存命中: {key}")
+                return cached
+        except Exception as e:
+            logger.error(f"查询拍摄建议缓存失败: {str(e)}")
+
+        # 同一进程内相同组合的并发请求共用一次生成
+        task = cls._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(cls._generate(key, generate))
+            cls._inflight[key] = task
+            task.add_done_callback(lambda _: cls._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _generate(cls, key: str, generate):
+        result = await generate()
+        if result:
+            try:
+                await Cache.set(key, result, expire=SUGGESTION_CACHE_TTL)
+            except Exception as e:
+                logger.error(f"写入拍摄建议缓存失败: {str(e)}")
+        return result
+
+    @classmethod
+    async def purge(cls, product_name: str = None, category: str = None, country: str = None) -> int:
+        """
+        清除拍摄建议缓存，参数都为空时清除全部
+        :return: 删除的键数量
+        """
+        count = await Cache.delete_pattern(cls._key(product_name, category, country))
+        logger.info(f"清除拍摄建议缓存: product_name={product_name}, category={category}, country={country}, count={count}")
+        return count
@@ -0,0 +1,74 @@
+"""
+对标视频搜索的 top 视频索引
+
+每个 (国家, 三级类目) 在 Redis 中保存一份最新 N 条 kalodata 数据，
+入库提交后只刷新受影响的键，搜索时一次按键读取，不再做过滤+COUNT查询
+"""
+import os
+from core.cache import Cache
+from core.logger import setup_logger
+from apps.search_video import crud as video_search_crud
+
+logger = setup_logger('kalodata_top_index')
+
+# 每个(国家, 三级类目)保存的视频条数
+KALODATA_TOP_N = int(os.getenv('KALODATA_TOP_N', 20))
+# 索引键的过期时间（秒），过期后在下一次搜索时从数据库重建
+KALODATA_TOP_INDEX_TTL = int(os.getenv('KALODATA_TOP_INDEX_TTL', 7 * 86400))
+
+
+class TopVideoIndex:
+    """
+    (国家, 三级类目) -> 最新N条视频 的物化索引
+    """
+
+    @staticmethod
+    def _key(country: str, category3: str) -> str:
+        return f"kalodata:top:{country}:{category3}"
+
+    @classmethod
+    async def rebuild(cls, db, country: str, category3: str) -> list:
+        """从数据库重建单个键的索引"""
+        items = await video_search_crud.get_top_kalodata_data(db, country, category3, KALODATA_TOP_N)
+        items = [item.to_dict() for item in items]
+        try:
+            await Cache.set(cls._key(country, category3), {"items": items}, expire=KALODATA_TOP_INDEX_TTL)
+        except Exception as e:
+            logger.error(f"写入top视频索引失败: country={country}, category3={category3}, error={str(e)}")
+        return items
+
+    @classmethod
+    async def get_top(cls, db, country: str, category3: str, limit: int = 5) -> list:
+        """
+        获取指定国家和三级类目下最新的视频
+        索引不存在时从数据库重建
+        """
+        cached = await Cache.get(cls._key(country, category3))
+        if cached is not None:
+            items = cached.get("items", [])
+        else:
+            items = await cls.rebuild(db, country, category3)
+        return items[:limit]
+
+    @classmethod
+    async def refresh_for_rows(cls, db, rows: list):
+        """
+        入库提交后刷新受影响的(国家, 三级类目)索引
+        :param rows: 本次写入的kalodata数据字典列表
+        """
+        keys = {(row.get("country"), row.get("category3")) for row in rows if row.get("country") and row.get("category3")}
+        for country, category3 in keys:
+            try:
+                await cls.rebuild(db, country, category3)
+            except Exception as e:
+                logger.error(f"刷新top视频索引失败: country={country}, category3={category3}, error={str(e)}")
+
+    @classmethod
+    async def invalidate(cls, country: str, category3: str):
+        """删除单个键的索引（数据被修改或删除时调用）"""
+        await Cache.delete(cls._key(country, category3))
+
+    @classmethod
+    async def invalidate_all(cls):
+        """删除所有索引（排序规则或历史数据批量变化时调用）"""
+        return await Cache.delete_pattern("kalodata:top:*")
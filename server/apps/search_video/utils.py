@@ -1,12 +1,51 @@
-import requests
+import os
+import re
 import json
+import math
 import logging
 import asyncio
-from sqlalchemy import select
+import httpx
+from core.http_client import HttpClient
+from apps.search_video.quota import KalodataQuota
+from apps.search_video.detail_cache import DetailCache
 
 logger = logging.getLogger(__name__)
 
-def query_video_list(cookie, country, startDate, endDate, cateIds):
+# 详情/产品请求的最大并发数
+KALODATA_MAX_CONCURRENCY = int(os.getenv('KALODATA_MAX_CONCURRENCY', 5))
+
+# kalodata详情接口次数用尽时返回的错误信息
+DETAIL_LIMIT_MESSAGE = "Today's detail times has been used up"
+
+
+class KalodataLimitError(Exception):
+    """kalodata详情接口调用次数用尽(DETAIL.ACCESS_TIMES)"""
+    pass
+
+
+def _detail_headers(cookie, country):
+    """详情类接口通用请求头"""
+    return {
+        "Accept": "application/json, text/plain, */*",
+        "Accept-Language": "zh-CN,zh;q=0.9",
+        "Content-Type": "application/json",
+        "Cookie": cookie,
+        "country": country,
+        "Origin": "https://www.kalodata.com",
+        "Referer": "https://www.kalodata.com/video",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36"
+    }
+
+
+def _is_limit_response(response_data):
+    """判断响应是否为详情调用次数用尽"""
+    if not response_data.get('success') and response_data.get('message'):
+        error_message = response_data.get('message')
+        return isinstance(error_message, str) and DETAIL_LIMIT_MESSAGE in error_message
+    return False
+
+
+async def query_video_list(cookie, country, startDate, endDate, cateIds):
     """
     向kalodata请求视频列表数据
     
@@ -25,7 +64,6 @@ def query_video_list(cookie, country, startDate, endDate, cateIds):
     # 确保cateIds是列表格式
     if isinstance(cateIds, str):
         try:
-            import json
             cateIds = json.loads(cateIds)
         except:
             cateIds = [cateIds]
@@ -71,19 +109,17 @@ def query_video_list(cookie, country, startDate, endDate, cateIds):
     logger.info(f"请求数据: {data}")
     
     try:
-        # 使用session来处理请求，这样可以更好地处理cookie
-        with requests.Session() as session:
-            response = session.post(url, headers=headers, json=data, timeout=30)
-            logger.info(f"API响应状态码: {response.status_code}")
-            logger.info(f"API响应内容: {response.text[:1000]}...")  # 只记录前1000个字符
-            
-            response.raise_for_status()  # 如果响应状态码不是200，将引发异常
-            
-            response_data = response.json()
-            if not response_data.get('success'):
-                logger.error(f"API返回错误: {response_data.get('message', '未知错误')}")
-            return response_data
-    except requests.exceptions.RequestException as e:
+        response = await HttpClient.post(url, headers=headers, json_data=data)
+        logger.info(f"API响应状态码: {response.status_code}")
+        logger.info(f"API响应内容: {response.text[:1000]}...")  # 只记录前1000个字符
+        
+        response.raise_for_status()  # 如果响应状态码不是200，将引发异常
+        
+        response_data = response.json()
+        if not response_data.get('success'):
+            logger.error(f"API返回错误: {response_data.get('message', '未知错误')}")
+        return response_data
+    except httpx.HTTPError as e:
         logger.error(f"请求失败: {str(e)}")
         return None
     except json.JSONDecodeError as e:
@@ -93,7 +129,7 @@ def query_video_list(cookie, country, startDate, endDate, cateIds):
         logger.error(f"未知错误: {str(e)}")
         return None
 
-def get_video_detail(cookie, country, video_id, startDate, endDate):
+async def get_video_detail(cookie, country, video_id, startDate, endDate):
     """
     获取视频的详细信息
     
@@ -109,17 +145,6 @@ def get_video_detail(cookie, country, video_id, startDate, endDate):
     """
     url = "https://www.kalodata.com/video/detail"
     
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-CN,zh;q=0.9",
-        "Content-Type": "application/json",
-        "Cookie": cookie,
-        "country": country,
-        "Origin": "https://www.kalodata.com",
-        "Referer": "https://www.kalodata.com/video",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36"
-    }
-    
     data = {
         "id": video_id,
         "startDate": startDate,
@@ -128,23 +153,21 @@ def get_video_detail(cookie, country, video_id, startDate, endDate):
     }
     
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
+        response = await HttpClient.post(url, headers=_detail_headers(cookie, country), json_data=data)
         response.raise_for_status()
         response_data = response.json()
         
         # 检查是否存在API调用次数限制错误
-        if not response_data.get('success') and response_data.get('message'):
-            error_message = response_data.get('message')
-            if isinstance(error_message, str) and "Today's detail times has been used up" in error_message:
-                logger.warning(f"获取视频详情失败: video_id={video_id}, response={response_data}")
-                return {"success": False, "message": error_message, "data": None, "is_limit_error": True, "cause": "DETAIL.ACCESS_TIMES"}
+        if _is_limit_response(response_data):
+            logger.warning(f"获取视频详情失败: video_id={video_id}, response={response_data}")
+            return {"success": False, "message": response_data.get('message'), "data": None, "is_limit_error": True, "cause": "DETAIL.ACCESS_TIMES"}
         
         return response_data
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"请求视频详情出错: {e}")
         return None
 
-def enrich_video_data(cookie, country, startDate, endDate, cateIds, video_ids):
+async def enrich_video_data(cookie, country, startDate, endDate, cateIds, video_ids):
     """
     获取视频的产品ID信息
     
@@ -161,17 +184,6 @@ def enrich_video_data(cookie, country, startDate, endDate, cateIds, video_ids):
     """
     url = "https://www.kalodata.com/video/enrich"
     
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-CN,zh;q=0.9",
-        "Content-Type": "application/json",
-        "Cookie": cookie,
-        "country": country,
-        "Origin": "https://www.kalodata.com",
-        "Referer": "https://www.kalodata.com/video",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36"
-    }
-    
     data = {
         "ids": video_ids,
         "country": country,
@@ -181,14 +193,14 @@ def enrich_video_data(cookie, country, startDate, endDate, cateIds, video_ids):
     }
     
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
+        response = await HttpClient.post(url, headers=_detail_headers(cookie, country), json_data=data)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"请求product_id出错: {e}")
+    except httpx.HTTPError as e:
+        logger.error(f"请求product_id出错: {e}")
         return None
 
-def get_product_detail(cookie, country, product_id, startDate, endDate):
+async def get_product_detail(cookie, country, product_id, startDate, endDate):
     """
     获取产品详细信息
     
@@ -204,17 +216,6 @@ def get_product_detail(cookie, country, product_id, startDate, endDate):
     """
     url = "https://www.kalodata.com/product/detail"
     
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-CN,zh;q=0.9",
-        "Content-Type": "application/json",
-        "Cookie": cookie,
-        "country": country,
-        "Origin": "https://www.kalodata.com",
-        "Referer": "https://www.kalodata.com/video",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36"
-    }
-    
     data = {
         "id": product_id,
         "startDate": startDate,
@@ -223,41 +224,82 @@ def get_product_detail(cookie, country, product_id, startDate, endDate):
     }
     
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
+        response = await HttpClient.post(url, headers=_detail_headers(cookie, country), json_data=data)
         response.raise_for_status()
         response_data = response.json()
         
         # 检查是否存在API调用次数限制错误
-        if not response_data.get('success') and response_data.get('message'):
-            error_message = response_data.get('message')
-            if isinstance(error_message, str) and "Today's detail times has been used up" in error_message:
-                logger.warning(f"获取产品详情失败: product_id={product_id}, response={response_data}")
-                return {"success": False, "message": error_message, "data": None, "is_limit_error": True, "cause": "DETAIL.ACCESS_TIMES"}
+        if _is_limit_response(response_data):
+            logger.warning(f"获取产品详情失败: product_id={product_id}, response={response_data}")
+            return {"success": False, "message": response_data.get('message'), "data": None, "is_limit_error": True, "cause": "DETAIL.ACCESS_TIMES"}
             
         return response_data
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"请求产品详情出错: {e}")
         return None
 
+# 指标数值的单位换算
+METRIC_UNITS = {
+    "万": 1e4,
+    "亿": 1e8,
+    "K": 1e3,
+    "M": 1e6,
+    "B": 1e9,
+}
+
+def parse_metric_number(value):
+    """
+    将kalodata返回的指标字符串解析为数值
+    例如 "¥1.2万" -> 12000.0, "3.5K" -> 3500.0, "12.5%" -> 12.5, "1,234" -> 1234.0, "5e-05" -> 5e-05
+    区间值（如 "1万-2万"）取下限
+    
+    参数:
+        value: 指标值
+    
+    返回:
+        float: 解析后的数值，无法解析（空值、unknown等）时返回None
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    text = str(value).strip().replace(",", "").replace(" ", "")
+    if not text or text.lower() in ("unknown", "none", "null", "-", "--"):
+        return None
+
+    # 纯数字（包括 str(float) 产生的科学计数法，如 "5e-05"）
+    try:
+        number = float(text)
+        return number if math.isfinite(number) else None
+    except ValueError:
+        pass
+
+    # 取第一个数值及其后的单位，区间值（"1万-2万"、"1万~2万"）即取下限
+    match = re.search(r"-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?", text)
+    if not match:
+        return None
+    number = float(match.group())
+    unit = text[match.end():match.end() + 1].upper()
+    return number * METRIC_UNITS.get(unit, 1)
+
 # 添加获取类目名称的函数
 async def get_category3_label(db, category_value):
     """
-    从数据库中获取三级类目的标签名称
+    从类目索引中获取三级类目的标签名称
     
     参数：
-        db: 数据库会话
+        db: 数据库会话（类目索引已加载时不会使用）
         category_value: 三级类目ID
         
     返回：
         str: 三级类目的标签名称，如果未找到则返回类目ID
     """
-    from apps.search_video.models import CategoryLevel3
+    from apps.search_video.category_index import CategoryRegistry
     
     try:
-        # 查询指定value的三级类目
-        query = select(CategoryLevel3).where(CategoryLevel3.value == category_value)
-        result = await db.execute(query)
-        category = result.scalar_one_or_none()
+        category_index = await CategoryRegistry.get()
+        category = category_index.level3_by_value.get(category_value)
         
         if category:
             return category.label
@@ -266,9 +308,79 @@ async def get_category3_label(db, category_value):
         logger.error(f"获取三级类目标签失败: {str(e)}")
         return category_value  # 出错时返回原始ID值
 
-def get_complete_video_data(cookie, country, startDate, endDate, cateIds):
+async def fetch_details_concurrently(fetch_detail, item_ids, label):
+    """
+    以有限并发批量获取详情，遇到调用次数限制时取消所有未完成的请求
+    
+    参数:
+        fetch_detail (callable): 接收单个ID并返回详情响应的协程函数
+        item_ids (list): 待获取详情的ID列表
+        label (str): 日志中使用的详情类型名称
+    
+    返回:
+        dict: ID到详情数据的映射
+    
+    异常:
+        KalodataLimitError: 详情接口调用次数用尽
+    """
+    semaphore = asyncio.Semaphore(KALODATA_MAX_CONCURRENCY)
+    details = {}
+
+    async def worker(item_id):
+        try:
+            async with semaphore:
+                detail = await fetch_detail(item_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"获取{label}异常: id={item_id}, error={str(e)}")
+            return
+        if detail and detail.get('is_limit_error'):
+            raise KalodataLimitError(f"{label}API调用受限")
+        if detail and detail.get('success') and 'data' in detail:
+            details[item_id] = detail.get('data', {})
+            logger.info(f"成功获取{label}: id={item_id}")
+        else:
+            logger.warning(f"获取{label}失败: id={item_id}, response={detail}")
+
+    tasks = [asyncio.create_task(worker(item_id)) for item_id in item_ids]
+    try:
+        await asyncio.gather(*tasks)
+    except KalodataLimitError:
+        # 次数已用尽，剩余请求全部作废
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return details
+
+async def fetch_detail_with_rotation(cookie_pool, fetch_detail):
+    """
+    在cookie池中轮换调用详情接口，次数用尽的cookie会被停用到每日重置
+    
+    参数:
+        cookie_pool (list): cookie池
+        fetch_detail (callable): 接收cookie并返回详情响应的协程函数
+    
+    返回:
+        dict: 详情响应；所有cookie都用尽时返回次数限制响应
+    """
+    tried = set()
+    while True:
+        cookie = await KalodataQuota.acquire(cookie_pool, exclude=tried)
+        if cookie is None:
+            return {"success": False, "message": DETAIL_LIMIT_MESSAGE, "data": None, "is_limit_error": True, "cause": "DETAIL.ACCESS_TIMES"}
+        detail = await fetch_detail(cookie)
+        if detail and detail.get('is_limit_error'):
+            await KalodataQuota.mark_exhausted(cookie)
+            tried.add(cookie)
+            continue
+        return detail
+
+async def get_complete_video_data(cookie, country, startDate, endDate, cateIds):
     """
     获取完整的视频数据，包括产品详情和URL
+    视频详情与产品ID并发获取，详情请求按KALODATA_MAX_CONCURRENCY限流
     
     参数:
         cookie (str): 用户的Cookie值
@@ -283,7 +395,7 @@ def get_complete_video_data(cookie, country, startDate, endDate, cateIds):
     logger.info(f"开始获取视频列表数据: country={country}, startDate={startDate}, endDate={endDate}, cateIds={cateIds}")
     
     # 1. 获取视频列表数据
-    video_data = query_video_list(cookie, country, startDate, endDate, cateIds)
+    video_data = await query_video_list(cookie, country, startDate, endDate, cateIds)
     if not video_data:
         logger.error("获取视频列表失败: API返回为空")
         return []
@@ -303,64 +415,69 @@ def get_complete_video_data(cookie, country, startDate, endDate, cateIds):
     
     logger.info(f"提取到的视频ID列表: {video_ids}")
     
-    # 3. 获取每个视频的详细信息
-    video_details = {}
-    is_detail_api_limited = False
-    
-    for video_id in video_ids:
-        try:
-            detail = get_video_detail(cookie, country, video_id, startDate, endDate)
-            if detail and detail.get('is_limit_error'):
-                logger.warning("视频详情API调用受限")
-                is_detail_api_limited = True
-                break
-            elif detail and detail.get('success') and 'data' in detail:
-                video_details[video_id] = detail.get('data', {})
-                logger.info(f"成功获取视频详情: video_id={video_id}")
-            else:
-                logger.warning(f"获取视频详情失败: video_id={video_id}, response={detail}")
-        except Exception as e:
-            logger.error(f"获取视频详情异常: video_id={video_id}, error={str(e)}")
+    # 详情优先读取缓存；未命中时在cookie池中轮换调用，单个cookie次数用尽时切换到下一个
+    cookie_pool = KalodataQuota.build_pool(cookie)
+
+    # 3. 并发获取每个视频的详细信息和产品ID（两者互不依赖）
+    detail_task = asyncio.create_task(fetch_details_concurrently(
+        lambda video_id: DetailCache.get_or_fetch(
+            "video", country, video_id, startDate, endDate,
+            lambda: fetch_detail_with_rotation(
+                cookie_pool, lambda c: get_video_detail(c, country, video_id, startDate, endDate)
+            )
+        ),
+        video_ids,
+        "视频详情"
+    ))
     
     # 4. 获取产品ID
     try:
-        product_id_data = enrich_video_data(cookie, country, startDate, endDate, cateIds, video_ids)
+        product_id_data = await enrich_video_data(cookie, country, startDate, endDate, cateIds, video_ids)
         logger.info(f"产品ID数据获取结果: {product_id_data}")
     except Exception as e:
         logger.error(f"获取产品ID数据异常: {str(e)}")
-        return []
+        product_id_data = None
     
     if not product_id_data or not product_id_data.get('success'):
         logger.error("获取产品ID失败")
+        detail_task.cancel()
+        await asyncio.gather(detail_task, return_exceptions=True)
         return []
     
+    video_details = {}
+    is_api_limited = False
+    try:
+        video_details = await detail_task
+    except KalodataLimitError as e:
+        logger.warning(str(e))
+        is_api_limited = True
+    
     # 创建视频ID到产品ID的映射
     product_map = {item.get('id'): {'product_id': item.get('product_id')} 
                   for item in product_id_data.get('data', []) if 'id' in item and 'product_id' in item}
     
     logger.info(f"视频ID到产品ID的映射: {product_map}")
     
-    # 5. 获取每个产品的详细信息
+    # 5. 获取每个产品的详细信息（次数已用尽时详情数据不会被使用，直接跳过）
     unique_product_ids = list(set(item.get('product_id') for item in product_id_data.get('data', []) 
                              if 'product_id' in item))
     
     product_details = {}
-    is_product_api_limited = False
-    
-    for product_id in unique_product_ids:
+    if not is_api_limited:
         try:
-            detail = get_product_detail(cookie, country, product_id, startDate, endDate)
-            if detail and detail.get('is_limit_error'):
-                logger.warning("产品详情API调用受限")
-                is_product_api_limited = True
-                break
-            elif detail and detail.get('success') and 'data' in detail:
-                product_details[product_id] = detail.get('data', {})
-                logger.info(f"成功获取产品详情: product_id={product_id}")
-            else:
-                logger.warning(f"获取产品详情失败: product_id={product_id}, response={detail}")
-        except Exception as e:
-            logger.error(f"获取产品详情异常: product_id={product_id}, error={str(e)}")
+            product_details = await fetch_details_concurrently(
+                lambda product_id: DetailCache.get_or_fetch(
+                    "product", country, product_id, startDate, endDate,
+                    lambda: fetch_detail_with_rotation(
+                        cookie_pool, lambda c: get_product_detail(c, country, product_id, startDate, endDate)
+                    )
+                ),
+                unique_product_ids,
+                "产品详情"
+            )
+        except KalodataLimitError as e:
+            logger.warning(str(e))
+            is_api_limited = True
     
     # 6. 构建完整数据，传入API限制标志
     complete_data = build_complete_data(
@@ -369,7 +486,7 @@ def get_complete_video_data(cookie, country, startDate, endDate, cateIds):
         product_details, 
         video_details, 
         country, 
-        is_detail_api_limited or is_product_api_limited,
+        is_api_limited,
         cateIds
     )
     
@@ -511,7 +628,7 @@ if __name__ == "__main__":
     
 
     # 获取完整的视频数据
-    complete_data = get_complete_video_data(test_cookie, test_country, test_startDate, test_endDate, test_cateIds)
+    complete_data = asyncio.run(get_complete_video_data(test_cookie, test_country, test_startDate, test_endDate, test_cateIds))
     
     # 解析并打印结果中的关键字段
     parse_video_data(complete_data)
@@ -19,7 +19,15 @@ from apps.search_video.views.views import (
     get_kalodata_data_statistics,
     fetch_and_store_kalodata_by_category1,
     fetch_and_store_kalodata_by_category2,
-    get_kalodata_data_by_category_country
+    get_kalodata_data_by_category_country,
+    get_kalodata_crawl_job,
+    resume_kalodata_crawl_job,
+    get_kalodata_quota,
+    get_kalodata_detail_cache_stats,
+    backfill_kalodata_numeric,
+    get_kalodata_numeric_backfill_status,
+    reload_category_index,
+    purge_shooting_suggestion_cache
 )
 
 def search_video_view_routes(app):
@@ -44,9 +52,17 @@ def search_video_view_routes(app):
 
     app.add_route(route_type="GET", endpoint="/search_video/category/level2", handler=get_category_level2) # 获取所有二级类目路由
     app.add_route(route_type="GET", endpoint="/search_video/category/level3", handler=get_category_level3) # 获取所有三级类目路由
+    app.add_route(route_type="POST", endpoint="/api/search_video/category/reload", handler=reload_category_index) # 后台：重新加载类目索引路由
+    app.add_route(route_type="POST", endpoint="/api/search_video/suggestion_cache/purge", handler=purge_shooting_suggestion_cache) # 后台：清除拍摄建议缓存路由
 
     app.add_route(route_type="POST", endpoint="/api/search_video/kalodata/fetch_and_store", handler=fetch_and_store_kalodata) # 获取并存储kalodata数据路由
-    app.add_route(route_type="POST", endpoint="/api/search_video/kalodata/fetch_and_store_by_categories", handler=fetch_and_store_kalodata_by_categories) # 根据所有三级类目批量获取并存储kalodata数据路由
+    app.add_route(route_type="POST", endpoint="/api/search_video/kalodata/fetch_and_store_by_categories", handler=fetch_and_store_kalodata_by_categories) # 根据所有三级类目批量获取并存储kalodata数据路由（创建后台爬取任务）
+    app.add_route(route_type="GET", endpoint="/api/search_video/kalodata/crawl_jobs/:job_id", handler=get_kalodata_crawl_job) # 获取kalodata爬取任务状态路由
+    app.add_route(route_type="POST", endpoint="/api/search_video/kalodata/crawl_jobs/:job_id/resume", handler=resume_kalodata_crawl_job) # 从检查点继续kalodata爬取任务路由
+    app.add_route(route_type="GET", endpoint="/api/search_video/kalodata/quota", handler=get_kalodata_quota) # 获取kalodata cookie池详情次数使用情况路由
+    app.add_route(route_type="GET", endpoint="/api/search_video/kalodata/detail_cache/stats", handler=get_kalodata_detail_cache_stats) # 获取kalodata详情缓存命中统计路由
+    app.add_route(route_type="POST", endpoint="/api/search_video/kalodata/backfill_numeric", handler=backfill_kalodata_numeric) # 启动kalodata指标数值列回填任务路由
+    app.add_route(route_type="GET", endpoint="/api/search_video/kalodata/backfill_numeric", handler=get_kalodata_numeric_backfill_status) # 获取kalodata指标数值列回填任务进度路由
 
     app.add_route(route_type="GET", endpoint="/api/search_video/kalodata/data/:id", handler=get_kalodata_data) # 获取单个kalodata数据路由
     app.add_route(route_type="GET", endpoint="/api/search_video/kalodata/datas", handler=get_kalodata_datas) # 获取所有kalodata数据路由
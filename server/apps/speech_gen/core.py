@@ -1,33 +1,15 @@
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser
 import json
 import os
 from typing import Dict, Any
 import asyncio
 from core.response import ApiResponse
 from robyn import Response, status_codes
+from core.llm import LLMRegistry
 
-# 初始化模型
-async def init_model():
-    try:
-        model = ChatOpenAI(
-            openai_api_key="31711a19-2c64-4337-a7b1-70be31e1fdd2",
-            openai_api_base="https://ark.cn-beijing.volces.com/api/v3",
-            model_name="doubao-pro-32k-241215",
-            temperature=0.7,
-            streaming=True
-        )
-        return model
-    except Exception as e:
-        raise Exception(f"模型初始化失败: {str(e)}")
-
-async def speech_generation(input, Scenario):
-    try:
-        # 定义系统提示词
-        system_prompt_1 = """# 角色
+# 产品解析系统提示词
+SYSTEM_PROMPT_ANALYZE = """# 角色
         你是一位经验丰富且专业的电商直播产品卖点解析大师，凭借深厚的行业经验和敏锐的市场洞察力，能够深入剖析用户提供的产品信息，精准提炼并生成极具吸引力的电商直播话术相关内容。
 
         ## 技能
@@ -61,28 +43,8 @@ async def speech_generation(input, Scenario):
 
         """
 
-        # 定义提示词模板
-        prompt_template1 = ChatPromptTemplate.from_messages([
-            ('system', system_prompt_1),
-            ('user', '{input}')
-        ])
-
-        model = await init_model()
-        parser = JsonOutputParser()
-        chain1 = prompt_template1 | model | parser
-
-        # 产品解析生成输出 
-        analyze_products = await chain1.ainvoke({"input": input})
-
-        product_name = analyze_products['product_name']
-        product_category = analyze_products['product_category']
-        selling_points = analyze_products['selling_points']
-        discount = analyze_products['discount']
-        crowd = analyze_products['crowd']
-
-        # 话术生成
-        # 定义系统提示词
-        system_prompt_2 = """
+# 话术生成系统提示词
+SYSTEM_PROMPT_SPEECH = """
         # 角色
         你是一位经验丰富、专业资深的电商直播话术生成专家，对各类电商产品和直播话术技巧有着深入的了解。你擅长结合产品详细信息（包括名称、类目、卖点、折扣、目标人群）以及不同的直播场景（日常、大促、节日），生成完整且具有吸引力的话术脚本，涵盖开场白、产品介绍、促销环节、逼单策略以及结尾等各个部分。
 
@@ -128,14 +90,27 @@ async def speech_generation(input, Scenario):
         - 回复内容需语言通顺、逻辑合理。 
         """
 
-        # 定义提示词模板
-        prompt_template2 = ChatPromptTemplate.from_messages([
-            ('system', system_prompt_2),
-            ('user', '商品名称：{product_name},商品类目：{product_category},商品卖点：{selling_points},商品折扣：{discount},目标人群：{crowd},直播场景：{Scenario}')
-        ])
+# 预先构建的产品解析、话术生成链（导入时构建一次，所有请求复用）
+ANALYZE_PRODUCT_CHAIN = LLMRegistry.build_chain(SYSTEM_PROMPT_ANALYZE, '{input}', model="doubao-pro")
+SPEECH_GENERATION_CHAIN = LLMRegistry.build_chain(
+    SYSTEM_PROMPT_SPEECH,
+    '商品名称：{product_name},商品类目：{product_category},商品卖点：{selling_points},商品折扣：{discount},目标人群：{crowd},直播场景：{Scenario}',
+    model="doubao-pro"
+)
+
+async def speech_generation(input, Scenario):
+    try:
+        # 产品解析生成输出 
+        analyze_products = await ANALYZE_PRODUCT_CHAIN.ainvoke({"input": input})
+
+        product_name = analyze_products['product_name']
+        product_category = analyze_products['product_category']
+        selling_points = analyze_products['selling_points']
+        discount = analyze_products['discount']
+        crowd = analyze_products['crowd']
 
-        chain2 = prompt_template2 | model | parser
-        speech_generation = await chain2.ainvoke({"product_name": product_name, "product_category": product_category, "selling_points": selling_points, "discount": discount, "crowd": crowd, "Scenario": Scenario})
+        # 话术生成
+        speech_generation = await SPEECH_GENERATION_CHAIN.ainvoke({"product_name": product_name, "product_category": product_category, "selling_points": selling_points, "discount": discount, "crowd": crowd, "Scenario": Scenario})
         output = speech_generation['output']
 
 
@@ -156,6 +131,38 @@ async def speech_generation(input, Scenario):
         print(f"Error: {e}")
         return False
 
+async def speech_generation_stream(input, Scenario):
+    """
+    流式话术生成：产品解析完成后立即产出解析结果，随后逐段产出生成的话术
+
+    产出:
+        tuple: (事件名, 数据)
+            product - 产品解析结果 {"product_name", "product_category", "selling_points", "discount", "crowd"}
+            token   - 话术增量 {"section": 话术段落（开场白/产品介绍/...）, "text": 新增文本}
+            result  - 与 speech_generation 返回值一致的完整结果
+    """
+    # 产品解析生成输出
+    analyze_products = await ANALYZE_PRODUCT_CHAIN.ainvoke({"input": input})
+    product = {key: analyze_products[key] for key in ("product_name", "product_category", "selling_points", "discount", "crowd")}
+    yield "product", product
+
+    # 话术生成：JSON解析器按流式输出逐步给出部分结果，只推送每个段落新增的文本
+    sent = {}
+    output = {}
+    async for partial in SPEECH_GENERATION_CHAIN.astream({**product, "Scenario": Scenario}):
+        output = partial.get("output") if isinstance(partial, dict) else None
+        if not isinstance(output, dict):
+            continue
+        for section, text in output.items():
+            if not isinstance(text, str):
+                continue
+            delta = text[sent.get(section, 0):]
+            if delta:
+                sent[section] = len(text)
+                yield "token", {"section": section, "text": delta}
+
+    yield "result", {**product, "Scenario": Scenario, "output": output}
+
 async def main():
     input = """云南高山黑糖姜茶 姨妈期必备 
 ❗划重点：无添加蔗糖！3秒速溶！ 
@@ -178,4 +178,100 @@ async def get_vio_words_by_phone_service(request: Request) -> Response:
         return ApiResponse.error(
             message="获取用户违规词检测记录失败",
             status_code=500
-        ) 
\ No newline at end of file
+        ) 
+
+# 话术生成记录中各文本字段的长度限制（与列定义一致）
+SPEECH_GEN_FIELD_LIMITS = {
+    "product_name": 255,
+    "product_category": 255,
+    "selling_points": 255,
+    "discount": 255,
+    "crowd": 255,
+    "output": 1000
+}
+
+def format_speech_output(output: dict) -> str:
+    """将分段话术整理为文本（### 段落名 + 内容）"""
+    return "\n\n".join(f"### {section}\n{text}" for section, text in output.items())
+
+async def speech_gen_stream_service(request_data: dict, send) -> str:
+    """
+    流式话术生成服务
+    预扣权益次数后，产品解析结果和话术增量生成后立即推送，
+    话术生成结束后一次性保存记录；生成失败时归还次数
+
+    参数:
+        request_data: 请求数据 {"input", "Scenario", "phone", "ai_product_id"}
+        send: 推送事件帧的协程函数
+
+    推送事件:
+        product: 产品解析结果
+        token: 话术增量 {"section", "text"}
+
+    返回:
+        str: 最后一帧事件
+            result: {"result": 完整生成结果, "daily_remaining": 剩余次数}
+            error: {"code", "message"}
+    """
+    from apps.speech_gen.core import speech_generation_stream
+    from apps.speech_gen import crud as speech_gen_crud
+    from apps.business.quota import EntitlementQuota
+
+    input_text = request_data.get("input") or ""
+    scenario = request_data.get("Scenario") or "日常"
+    phone = request_data.get("phone")
+    ai_product_id = request_data.get("ai_product_id")
+
+    if not input_text.strip() or not phone or not ai_product_id:
+        return ApiResponse.stream_event("error", {"code": 400, "message": "缺少必要参数"})
+    if len(input_text) > 255:
+        return ApiResponse.stream_event("error", {"code": 400, "message": "输入字符长度不要超过255哦"})
+
+    # 预扣次数（Redis原子扣减），生成失败时归还
+    try:
+        entitlement_id, daily_remaining, quota_source = await EntitlementQuota.reserve(phone, ai_product_id)
+    except Exception as e:
+        logger.error(f"查询用户权益失败: {str(e)}")
+        return ApiResponse.stream_event("error", {"code": 500, "message": "查询用户权益失败"})
+    if entitlement_id is None:
+        return ApiResponse.stream_event("error", {"code": 403, "message": "暂无权益"})
+    if daily_remaining is None:
+        return ApiResponse.stream_event("error", {"code": 403, "message": "使用额度不足"})
+
+    result = None
+    try:
+        async for event, data in speech_generation_stream(input_text, scenario):
+            if event == "result":
+                result = data
+            else:
+                await send(ApiResponse.stream_event(event, data))
+        if not result or not result.get("output"):
+            raise ValueError("话术生成结果为空")
+    except Exception as e:
+        logger.error(f"流式话术生成失败: {str(e)}")
+        await EntitlementQuota.release(entitlement_id, quota_source)
+        return ApiResponse.stream_event("error", {"code": 500, "message": "话术生成失败"})
+
+    # 话术生成结束后一次性保存记录
+    try:
+        speech_gen_data = {
+            "phone": phone,
+            "input": input_text,
+            "product_name": str(result.get("product_name", "")),
+            "product_category": str(result.get("product_category", "")),
+            "selling_points": str(result.get("selling_points", "")),
+            "discount": str(result.get("discount", "")),
+            "crowd": str(result.get("crowd", "")),
+            "output": format_speech_output(result["output"]),
+            "is_deleted": False
+        }
+        for field, limit in SPEECH_GEN_FIELD_LIMITS.items():
+            if len(speech_gen_data[field]) > limit:
+                logger.warning(f"字段 {field} 长度超过限制: {len(speech_gen_data[field])}，将进行截断")
+                speech_gen_data[field] = speech_gen_data[field][:limit]
+        async with AsyncSessionLocal() as db:
+            await speech_gen_crud.create_speech_gen(db, speech_gen_data)
+    except Exception as e:
+        logger.error(f"保存话术生成记录失败: {str(e)}")
+
+    return ApiResponse.stream_event("result", {"result": result, "daily_remaining": daily_remaining})
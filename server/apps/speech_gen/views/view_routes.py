@@ -1,13 +1,12 @@
-from robyn import Robyn, Request
-from apps.vio_word.views.views import vio_check, get_vio_words, get_vio_word, get_vio_words_by_phone
+from robyn import Robyn, Request, WebSocket
+from apps.speech_gen.views.views import speech_gen_stream
 
-def vio_word_view_routes(app):
+def speech_gen_view_routes(app):
     """
-    违规词检测 路由 
+    AI话术生成 路由 
     路由层 应该专注于 处理请求 并 返回响应
     """
-    
-    app.add_route(route_type="POST", endpoint="/vio_word/check", handler=vio_check) # 违规词检测路由
-    app.add_route(route_type="GET", endpoint="/vio_word/words", handler=get_vio_words) # 获取所有违规词检测记录路由
-    app.add_route(route_type="GET", endpoint="/vio_word/words/:id", handler=get_vio_word) # 获取单个违规词检测记录路由
-    app.add_route(route_type="GET", endpoint="/vio_word/words/phone/:phone", handler=get_vio_words_by_phone) # 根据手机号搜索违规词检测记录路由
+
+    # 流式话术生成（WebSocket），产品解析结果和话术增量生成后立即推送
+    speech_gen_ws = WebSocket(app, "/speech_gen/generate/stream")
+    speech_gen_ws.on("message")(speech_gen_stream)
@@ -168,3 +168,32 @@ async def get_vio_words_by_phone(request: Request) -> Response:
 
 
 
+
+async def speech_gen_stream(ws, msg) -> str:
+    """
+    流式话术生成（WebSocket消息处理）
+    客户端发送 {"input", "Scenario", "phone", "ai_product_id"}，
+    先推送产品解析结果，再逐段推送生成的话术
+    """
+    from apps.speech_gen.services import speech_gen_stream_service
+    from core.cache import Cache
+
+    try:
+        request_data = json.loads(msg)
+    except (TypeError, ValueError):
+        return ApiResponse.stream_event("error", {"code": 400, "message": "请求数据格式错误"})
+
+    # 按手机号限流，每分钟最多5次请求
+    phone = request_data.get("phone")
+    try:
+        count = await Cache.incr(f"speech_gen:stream_rate:{phone}", expire=60)
+        if count > 5:
+            return ApiResponse.stream_event("error", {"code": 429, "message": "请求过于频繁，请稍后再试"})
+    except Exception as e:
+        logger.error(f"流式话术生成限流不可用: {str(e)}")
+
+    async def send(frame: str):
+        await ws.async_send_to(ws.id, frame)
+
+    # 返回值作为最后一帧（完整结果或错误）发送给客户端
+    return await speech_gen_stream_service(request_data, send)
@@ -1,33 +1,19 @@
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser
 import json
 import os
 from typing import Dict, Any
 import asyncio
 from core.response import ApiResponse
 from robyn import Response, status_codes
+from core.llm import LLMRegistry
+from core.logger import setup_logger
+from apps.vio_word.prefilter import BannedWordFilter, VIO_PREFILTER_ENABLED
 
-# 初始化模型
-async def init_model():
-    try:
-        model = ChatOpenAI(
-            openai_api_key="31711a19-2c64-4337-a7b1-70be31e1fdd2",
-            openai_api_base="https://ark.cn-beijing.volces.com/api/v3",
-            model_name="doubao-pro-32k-241215",
-            temperature=0.7,
-            streaming=True
-        )
-        return model
-    except Exception as e:
-        raise Exception(f"模型初始化失败: {str(e)}")
+logger = setup_logger('vio_word_core')
 
-async def vio_word_check(input):
-    try:
-        # 定义系统提示词
-        system_prompt_1 = """# 角色
+# 违规词检测系统提示词
+SYSTEM_PROMPT_DETECT = """# 角色
         你是一位专业的电商领域违规词检测专家，具备深厚的电商行业知识和敏锐的语言洞察力，能够精准检测用户输入内容中的违规词，并详细解释违规原因。
 
         ## 技能
@@ -61,30 +47,8 @@ async def vio_word_check(input):
         }}
         """
 
-        # 定义提示词模板
-        prompt_template1 = ChatPromptTemplate.from_messages([
-            ('system', system_prompt_1),
-            ('user', '{input}')
-        ])
-
-        model = await init_model()
-        parser = JsonOutputParser()
-        chain1 = prompt_template1 | model | parser
-
-        # 违规词检测生成输出 
-        Violations_words = await chain1.ainvoke({"input": input})
-
-        is_Violations = Violations_words['is_Violations']
-        words = Violations_words['words']
-        reason = Violations_words['reason']
-
-        if is_Violations == '是':
-            # print(f"违规词：{words}")
-            # print(f"违规原因：{reason}")
-
-            # 违规话术优化
-            # 定义系统提示词
-            system_prompt_2 = """
+# 违规话术优化系统提示词
+SYSTEM_PROMPT_OPTIMIZE = """
             # 角色
             你是一位专业且权威的资深电商主播违规词检测优化大师，对各大电商平台规则烂熟于心，拥有顶级的电商领域违规词检测与优化能力，具备海量的实践经验。用户将提供原始话术及违规词违规原因，你需要输出优化后的话术及其优化思路，优化后的话术要既符合平台要求，又适合主播直播话术场景。
 
@@ -108,24 +72,8 @@ async def vio_word_check(input):
             }}
             """
 
-            # 定义提示词模板
-            prompt_template2 = ChatPromptTemplate.from_messages([
-                ('system', system_prompt_2),
-                ('user', '话术：{input}，违规词：{words}，违规原因：{reason}')
-            ])
-
-            chain2 = prompt_template2 | model | parser
-            Violations_words = await chain2.ainvoke({"input": input, "words": words, "reason": reason})
-            op = Violations_words['op']
-            ideas = Violations_words['ideas']
-
-            # print(f"优化后的话术1：{optimization1}")
-            # print(f"优化后的话术2：{optimization2}")
-            # print(f"优化后的话术3：{optimization3}")
-            # print(f"优化思路：{ideas}")
-
-            # 话术打分大模型
-            system_prompt_3 = """
+# 话术打分系统提示词
+SYSTEM_PROMPT_SCORE = """
             # 角色
             你是一位专业且权威的电商直播话术违规词检测与打分专家，在电商直播话术领域经验丰富、极具权威性。你需要对直播话术进行全面细致的分析，精准判断其中是否存在违规词，并根据违规情况进行合理扣分，给出准确的分值。同时，对于 AI 优化后的话术，要给予客观公正的高分评价。
 
@@ -164,48 +112,218 @@ async def vio_word_check(input):
             - 输出内容必须严格按照 JSON 格式，包含 old_score 和 new_score 和 old_rating 和 new_rating 四个字段。
             """
 
-            # 定义提示词模板
-            prompt_template3 = ChatPromptTemplate.from_messages([
-                ('system', system_prompt_3),
-                ('user', '原始话术：{input},优化后的话术：{op}')
-            ])
-
-            chain3 = prompt_template3 | model | parser
-            score = await chain3.ainvoke({"input": input, "op": op})
-            old_score = score['old_score']
-            new_score = score['new_score']
-            old_rating = score['old_rating']
-            new_rating = score['new_rating']
-
-            # print(f"原始话术分值：{old_score}")
-            # print(f"优化后话术分值：{new_score}")
-            # print(f"原始话术评级：{old_rating}")
-            # print(f"优化后话术评级：{new_rating}")
-
-            # 整合json输出结果
-            result = {
-                "is_Violations": is_Violations,
-                "words": words,
-                "reason": reason,
-                "op": op,
-                "ideas": ideas,
-                "old_score": old_score,
-                "new_score": new_score,
-                "old_rating": old_rating,
-                "new_rating": new_rating
-            }
-            print(result)
-            return result  # 直接返回字典结果
+# 单次调用模式系统提示词（检测、优化、打分一次完成）
+SYSTEM_PROMPT_COMBINED = """# 角色
+        你是一位专业且权威的电商直播话术违规词检测、优化与打分专家，对各大电商平台规则烂熟于心，能够精准检测话术中的违规词并解释原因，给出符合平台要求又适合主播直播场景的优化话术，并为优化前后的话术打分。
+
+        ## 技能
+        ### 技能 1: 检测违规词
+        1. 仔细分析用户输入的话术，全面检测其中是否包含违规词，不会将无违规内容的话术判定为违规。
+        2. 若存在违规词，明确指出包含哪些违规词，并针对每一个违规词单独解释违规原因。
+
+        ### 技能 2: 优化违规话术（仅在违规时）
+        1. 依据各大电商平台规则，对原始话术进行优化，优化后的话术需符合平台要求且适合主播直播场景。
+        2. 给出核心优化思路。
+
+        ### 技能 3: 打分与评级（仅在违规时）
+        1. 根据违规的严重程度和数量为原始话术扣分，满分 100 分；优化后的话术给予尽可能高的分数，满分 100 分。
+        2. 在"小白，业余，专业，资深，大师"中选择评级：0-25分：小白；26-50分：业余；51-75分：专业；76-90分：资深；91-100分：大师。
 
+        ## 输出字段解释：
+        is_Violations：是否违规（是/否）
+        words：违规词(可能是多个，多个违规词用逗号隔开，没有则填无)
+        reason：违规原因(针对每个违规词输出违规原因，多个原因用；隔开)
+        op：优化后的话术
+        ideas：核心优化思路
+        old_score：原始话术的分值
+        new_score：优化后话术的分值
+        old_rating：原始话术的评级
+        new_rating：优化后话术的评级
+
+        ## 示例（违规）：
+        {{
+            "is_Violations": "是",
+            "words": "违规词1,违规词2",
+            "reason": "违规原因1;违规原因2",
+            "op": "优化后的话术",
+            "ideas": "核心优化思路",
+            "old_score": 70,
+            "new_score": 95,
+            "old_rating": "专业",
+            "new_rating": "大师"
+        }}
+
+        ## 示例（未违规）：
+        {{
+            "is_Violations": "否",
+            "words": "无",
+            "reason": ""
+        }}
+
+        ## 限制:
+        - 只专注于电商直播话术的违规词检测、优化与打分，拒绝回答与该主题无关的话题。
+        - 输出内容必须严格按照 JSON 格式，不要输出其他内容。
+        """
+
+# 预先构建的检测、优化、打分链（导入时构建一次，所有请求复用）
+DETECT_CHAIN = LLMRegistry.build_chain(SYSTEM_PROMPT_DETECT, '{input}', model="doubao-pro")
+DETECT_WITH_HINTS_CHAIN = LLMRegistry.build_chain(
+    SYSTEM_PROMPT_DETECT,
+    '{input}\n\n（本地词库命中的疑似违规词：{hints}，请结合语境判断是否违规，并检查是否还有其他违规词）',
+    model="doubao-pro"
+)
+OPTIMIZE_CHAIN = LLMRegistry.build_chain(SYSTEM_PROMPT_OPTIMIZE, '话术：{input}，违规词：{words}，违规原因：{reason}', model="doubao-pro")
+SCORE_CHAIN = LLMRegistry.build_chain(SYSTEM_PROMPT_SCORE, '原始话术：{input},优化后的话术：{op}', model="doubao-pro")
+COMBINED_CHAIN = LLMRegistry.build_chain(SYSTEM_PROMPT_COMBINED, '{input}', model="doubao-pro")
+COMBINED_WITH_HINTS_CHAIN = LLMRegistry.build_chain(
+    SYSTEM_PROMPT_COMBINED,
+    '{input}\n\n（本地词库命中的疑似违规词：{hints}，请结合语境判断是否违规，并检查是否还有其他违规词）',
+    model="doubao-pro"
+)
+
+# 检测流水线模式：staged 检测、优化、打分三次调用；single 单次调用，结果校验失败时回退到 staged
+VIO_PIPELINE_MODES = ("staged", "single")
+VIO_PIPELINE_MODE = os.getenv('VIO_PIPELINE_MODE', 'staged')
+
+def validate_combined_result(data):
+    """
+    校验单次调用模式的输出
+    :return: 与 vio_word_check 返回值一致的结果，校验失败时返回None
+    """
+    if not isinstance(data, dict) or data.get("is_Violations") not in ("是", "否"):
+        return None
+    if data["is_Violations"] == "否":
+        return {"is_Violations": "否"}
+
+    result = {"is_Violations": "是"}
+    for key in ("words", "reason", "op", "ideas", "old_rating", "new_rating"):
+        if not isinstance(data.get(key), str) or not data[key]:
+            return None
+        result[key] = data[key]
+    for key in ("old_score", "new_score"):
+        try:
+            score = int(data.get(key))
+        except (TypeError, ValueError):
+            return None
+        if not 0 <= score <= 100:
+            return None
+        result[key] = score
+    return result
+
+async def _combined_check(input, hints):
+    """单次调用完成检测、优化、打分，输出校验失败时返回None"""
+    try:
+        if hints:
+            data = await COMBINED_WITH_HINTS_CHAIN.ainvoke({"input": input, "hints": "，".join(hints)})
         else:
-            result = {
-                "is_Violations": "否"
-            }
-            
-            print("未违规")
-            return result  # 直接返回字典结果
+            data = await COMBINED_CHAIN.ainvoke({"input": input})
+    except Exception as e:
+        logger.warning(f"单次调用模式检测失败，回退到分阶段检测: {str(e)}")
+        return None
+    result = validate_combined_result(data)
+    if result is None:
+        logger.warning(f"单次调用模式输出校验失败，回退到分阶段检测: {data}")
+    return result
+
+async def vio_word_check_stages(input, mode=None):
+    """
+    分阶段执行违规词检测，每个阶段完成后立即产出结果
+    
+    参数:
+        input: 话术
+        mode: 流水线模式（staged/single），为空时使用 VIO_PIPELINE_MODE
+    
+    产出:
+        tuple: (阶段名, 阶段结果)
+            detect   - {"is_Violations", "words", "reason"}
+            optimize - {"op", "ideas"}（仅违规时）
+            score    - {"old_score", "new_score", "old_rating", "new_rating"}（仅违规时）
+            result   - 与 vio_word_check 返回值一致的完整结果
+    """
+    # 本地词库预过滤：未命中任何词库词时直接判定为未违规
+    hints = None
+    if VIO_PREFILTER_ENABLED:
+        try:
+            hints = BannedWordFilter.scan(input)
+        except Exception as e:
+            logger.error(f"违规词本地预过滤失败，直接调用大模型检测: {str(e)}")
+    if hints == []:
+        yield "detect", {"is_Violations": "否", "words": "无", "reason": ""}
+        yield "result", {"is_Violations": "否"}
+        return
+
+    # 单次调用模式，输出校验失败时继续走分阶段检测
+    if (mode or VIO_PIPELINE_MODE) == "single":
+        result = await _combined_check(input, hints)
+        if result is not None:
+            async for stage, data in result_to_stages(result):
+                yield stage, data
+            return
+
+    # 违规词检测生成输出 
+    if hints:
+        Violations_words = await DETECT_WITH_HINTS_CHAIN.ainvoke({"input": input, "hints": "，".join(hints)})
+    else:
+        Violations_words = await DETECT_CHAIN.ainvoke({"input": input})
+
+    is_Violations = Violations_words['is_Violations']
+    words = Violations_words['words']
+    reason = Violations_words['reason']
+    yield "detect", {"is_Violations": is_Violations, "words": words, "reason": reason}
+
+    if is_Violations != '是':
+        logger.debug("未违规")
+        yield "result", {"is_Violations": "否"}
+        return
+
+    # 违规话术优化
+    Violations_words = await OPTIMIZE_CHAIN.ainvoke({"input": input, "words": words, "reason": reason})
+    op = Violations_words['op']
+    ideas = Violations_words['ideas']
+    yield "optimize", {"op": op, "ideas": ideas}
+
+    # 话术打分大模型
+    score = await SCORE_CHAIN.ainvoke({"input": input, "op": op})
+    old_score = score['old_score']
+    new_score = score['new_score']
+    old_rating = score['old_rating']
+    new_rating = score['new_rating']
+    yield "score", {"old_score": old_score, "new_score": new_score, "old_rating": old_rating, "new_rating": new_rating}
+
+    # 整合json输出结果
+    result = {
+        "is_Violations": is_Violations,
+        "words": words,
+        "reason": reason,
+        "op": op,
+        "ideas": ideas,
+        "old_score": old_score,
+        "new_score": new_score,
+        "old_rating": old_rating,
+        "new_rating": new_rating
+    }
+    logger.debug(f"违规词检测结果: {result}")
+    yield "result", result
+
+async def result_to_stages(result):
+    """
+    将完整检测结果（缓存结果或单次调用模式的结果）按阶段产出（与 vio_word_check_stages 一致）
+    """
+    yield "detect", {key: result.get(key) for key in ("is_Violations", "words", "reason")}
+    if result.get("is_Violations") == '是':
+        yield "optimize", {key: result.get(key) for key in ("op", "ideas")}
+        yield "score", {key: result.get(key) for key in ("old_score", "new_score", "old_rating", "new_rating")}
+    yield "result", result
+
+async def vio_word_check(input, mode=None):
+    try:
+        result = None
+        async for stage, data in vio_word_check_stages(input, mode):
+            if stage == "result":
+                result = data
+        return result  # 直接返回字典结果
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"违规词检测失败: {str(e)}")
         return False
 
 async def main():
@@ -1,5 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert
 from core.database import AsyncSessionLocal
 from core.logger import setup_logger
 from apps.vio_word.models import Vio_word
@@ -87,4 +87,16 @@ async def delete_vio_word(db: AsyncSession, id: int):
         return vio_word
     except Exception as e:
         await db.rollback()
-        raise e 
\ No newline at end of file
+        raise e 
+
+async def bulk_create_vio_words(db: AsyncSession, vio_words_data: list) -> int:
+    """批量创建违规词检测记录（单条INSERT语句）"""
+    if not vio_words_data:
+        return 0
+    try:
+        await db.execute(insert(Vio_word), vio_words_data)
+        await db.commit()
+        return len(vio_words_data)
+    except Exception as e:
+        await db.rollback()
+        raise e
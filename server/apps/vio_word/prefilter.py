@@ -0,0 +1,124 @@
+"""
+违规词本地预过滤
+
+用电商违规词词库构建 Aho-Corasick 自动机常驻内存，检测话术时先在本地扫描：
+未命中任何词库词的话术直接判定为未违规，不再调用大模型；
+命中的词作为提示交给大模型检测。词库修改后通过 reload 接口重新加载
+"""
+import os
+import asyncio
+from collections import deque
+from core.logger import setup_logger
+from apps.vio_word.result_cache import normalize_text
+
+logger = setup_logger('vio_prefilter')
+
+# 违规词词库文件
+BANNED_WORDS_FILE = os.getenv(
+    'VIO_BANNED_WORDS_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "banned_words.txt")
+)
+# 是否启用本地预过滤（未命中词库的话术不再调用大模型）
+VIO_PREFILTER_ENABLED = os.getenv('VIO_PREFILTER_ENABLED', 'true').lower() == 'true'
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机（构建后只读）
+    """
+
+    def __init__(self, words):
+        # goto[state]: 字符 -> 下一个状态；output[state]: 在该状态结束的词
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        self.words = tuple(sorted({word for word in words if word}))
+
+        for word in self.words:
+            state = 0
+            for char in word:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] = self.output[state] + (word,)
+
+        # 按层构建失败指针，并合并失败链上的输出
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text: str) -> list:
+        """
+        扫描文本，返回命中的词（按首次出现顺序，去重）
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        found = {}
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for word in output[state]:
+                found.setdefault(word, None)
+        return list(found)
+
+
+class BannedWordFilter:
+    """
+    进程内违规词自动机注册表
+    """
+    _automaton = None
+    _lock = None
+
+    @classmethod
+    def _get_lock(cls) -> asyncio.Lock:
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        return cls._lock
+
+    @staticmethod
+    def _load() -> AhoCorasick:
+        """从词库文件构建自动机"""
+        words = []
+        with open(BANNED_WORDS_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                word = normalize_text(line.split('#', 1)[0])
+                if word:
+                    words.append(word)
+        automaton = AhoCorasick(words)
+        logger.info(f"加载违规词词库: {len(automaton.words)} 个词，{len(automaton.goto)} 个状态")
+        return automaton
+
+    @classmethod
+    def get(cls) -> AhoCorasick:
+        """获取自动机，未加载时先加载"""
+        if cls._automaton is None:
+            cls._automaton = cls._load()
+        return cls._automaton
+
+    @classmethod
+    async def reload(cls) -> AhoCorasick:
+        """重新加载词库，构建完成后整体替换"""
+        async with cls._get_lock():
+            cls._automaton = await asyncio.to_thread(cls._load)
+        return cls._automaton
+
+    @classmethod
+    def scan(cls, text: str) -> list:
+        """
+        扫描话术中命中的词库词
+        :return: 命中的词列表
+        """
+        return cls.get().find_all(normalize_text(text))
@@ -0,0 +1,163 @@
+"""
+违规词检测结果缓存
+
+直播话术重复率很高，检测结果按规范化后的话术缓存在 Redis 中：
+精确层按规范化文本的哈希查询；近似层（可选）用字符n-gram的MinHash签名
+做LSH分桶，相似度达到阈值的话术直接复用已有的检测结果
+"""
+import os
+import re
+import hashlib
+import random
+import unicodedata
+from core.cache import Cache
+from core.logger import setup_logger
+
+logger = setup_logger('vio_result_cache')
+
+# 检测结果缓存的过期时间（秒）
+VIO_RESULT_CACHE_TTL = int(os.getenv('VIO_RESULT_CACHE_TTL', 7 * 86400))
+# 是否启用近似重复缓存
+VIO_NEAR_DUP_ENABLED = os.getenv('VIO_NEAR_DUP_ENABLED', 'false').lower() == 'true'
+# 近似重复的相似度阈值（MinHash估计的Jaccard相似度）
+VIO_NEAR_DUP_THRESHOLD = float(os.getenv('VIO_NEAR_DUP_THRESHOLD', 0.9))
+
+# MinHash参数：字符n-gram长度、签名长度、LSH分段数（每段 MINHASH_PERMUTATIONS // LSH_BANDS 行）
+NGRAM_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+# 每个LSH桶最多保存的话术数量
+LSH_BUCKET_SIZE = 20
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 固定种子，保证多进程之间的签名一致
+_rng = random.Random(20250101)
+_PERMUTATIONS = [
+    (_rng.randint(1, _MERSENNE_PRIME - 1), _rng.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """规范化话术：全角转半角、统一小写、去除空白"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return _WHITESPACE.sub('', text).lower()
+
+
+def minhash_signature(normalized: str) -> list:
+    """计算规范化文本的字符n-gram MinHash签名"""
+    if len(normalized) <= NGRAM_SIZE:
+        grams = {normalized}
+    else:
+        grams = {normalized[i:i + NGRAM_SIZE] for i in range(len(normalized) - NGRAM_SIZE + 1)}
+    hashes = [
+        int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=4).digest(), 'big')
+        for gram in grams
+    ]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(signature1: list, signature2: list) -> float:
+    """根据两个MinHash签名估计Jaccard相似度"""
+    same = sum(1 for x, y in zip(signature1, signature2) if x == y)
+    return same / MINHASH_PERMUTATIONS
+
+
+def _band_keys(signature: list) -> list:
+    """签名的LSH分桶键"""
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    keys = []
+    for band in range(LSH_BANDS):
+        chunk = ','.join(str(value) for value in signature[band * rows:(band + 1) * rows])
+        digest = hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16]
+        keys.append(f"vio_word:result:lsh:{band}:{digest}")
+    return keys
+
+
+class VioResultCache:
+    """
+    违规词检测结果缓存
+    """
+
+    @staticmethod
+    def _exact_key(digest: str) -> str:
+        return f"vio_word:result:exact:{digest}"
+
+    @staticmethod
+    def _digest(normalized: str) -> str:
+        return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+    @classmethod
+    async def get(cls, input_text: str):
+        """
+        查询话术的检测结果缓存
+        :return: 缓存的检测结果，未命中时返回None
+        """
+        normalized = normalize_text(input_text)
+        if not normalized:
+            return None
+        try:
+            entry = await Cache.get(cls._exact_key(cls._digest(normalized)))
+            if entry is not None:
+                logger.info("违规词检测结果缓存命中（精确）")
+                return entry["result"]
+
+            if VIO_NEAR_DUP_ENABLED:
+                return await cls._get_near_duplicate(normalized)
+        except Exception as e:
+            logger.error(f"查询违规词检测结果缓存失败: {str(e)}")
+        return None
+
+    @classmethod
+    async def _get_near_duplicate(cls, normalized: str):
+        """通过LSH分桶查找相似度达到阈值的话术"""
+        signature = minhash_signature(normalized)
+        candidates = set()
+        for key in _band_keys(signature):
+            bucket = await Cache.get(key)
+            if bucket:
+                candidates.update(bucket.get("digests", []))
+
+        best, best_similarity = None, 0
+        for digest in candidates:
+            entry = await Cache.get(cls._exact_key(digest))
+            if not entry or not entry.get("signature"):
+                continue
+            similarity = estimate_similarity(signature, entry["signature"])
+            if similarity >= VIO_NEAR_DUP_THRESHOLD and similarity > best_similarity:
+                best, best_similarity = entry, similarity
+
+        if best is not None:
+            logger.info(f"违规词检测结果缓存命中（近似，相似度 {best_similarity:.2f}）")
+            return best["result"]
+        return None
+
+    @classmethod
+    async def set(cls, input_text: str, result: dict):
+        """缓存话术的检测结果"""
+        normalized = normalize_text(input_text)
+        if not normalized or not result:
+            return
+        digest = cls._digest(normalized)
+        try:
+            entry = {"result": result}
+            signature = None
+            if VIO_NEAR_DUP_ENABLED:
+                signature = minhash_signature(normalized)
+                entry["signature"] = signature
+            await Cache.set(cls._exact_key(digest), entry, expire=VIO_RESULT_CACHE_TTL)
+
+            if signature is not None:
+                for key in _band_keys(signature):
+                    bucket = await Cache.get(key) or {"digests": []}
+                    digests = [item for item in bucket["digests"] if item != digest]
+                    digests.append(digest)
+                    await Cache.set(key, {"digests": digests[-LSH_BUCKET_SIZE:]}, expire=VIO_RESULT_CACHE_TTL)
+        except Exception as e:
+            logger.error(f"写入违规词检测结果缓存失败: {str(e)}")
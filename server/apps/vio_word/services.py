@@ -1,3 +1,4 @@
+import os
 from robyn import Request, Response
 from core.response import ApiResponse
 from core.middleware import error_handler, request_logger
@@ -8,6 +9,10 @@ from apps.vio_word import crud as vio_word_crud
 # 设置日志记录器
 logger = setup_logger('vio_word_services')
 
+# 批量检测单次最多的话术条数和并发检测数
+VIO_BATCH_MAX_INPUTS = int(os.getenv('VIO_BATCH_MAX_INPUTS', 50))
+VIO_BATCH_CONCURRENCY = int(os.getenv('VIO_BATCH_CONCURRENCY', 5))
+
 async def get_vio_words_service(request: Request) -> Response:
     """
     获取所有违规词检测记录服务
@@ -178,4 +183,200 @@ async def get_vio_words_by_phone_service(request: Request) -> Response:
         return ApiResponse.error(
             message="获取用户违规词检测记录失败",
             status_code=500
-        ) 
\ No newline at end of file
+        ) 
+
+async def reload_banned_words_service(request: Request) -> Response:
+    """
+    重新加载违规词词库服务（修改词库文件后调用）
+    """
+    try:
+        from apps.vio_word.prefilter import BannedWordFilter
+        automaton = await BannedWordFilter.reload()
+        return ApiResponse.success(
+            message="违规词词库重新加载成功",
+            data={"word_count": len(automaton.words)}
+        )
+    except Exception as e:
+        logger.error(f"重新加载违规词词库失败: {str(e)}")
+        return ApiResponse.error(
+            message="重新加载违规词词库失败",
+            status_code=500
+        )
+
+def build_vio_word_record(phone: str, input_text: str, result: dict) -> dict:
+    """
+    根据检测结果构建违规词检测记录
+    """
+    return {
+        "phone": phone,
+        "input": input_text,
+        "is_violation": result.get("is_Violations") == "是",
+        "words": result.get("words", ""),
+        "reasons": result.get("reason", ""),  # 注意：API返回的是 reason，而不是 reasons
+        "op": result.get("op", ""),
+        "ideas": result.get("ideas", ""),
+        "old_score": result.get("old_score", 0),
+        "new_score": result.get("new_score", 0),
+        "old_rating": result.get("old_rating", ""),
+        "new_rating": result.get("new_rating", ""),
+        "is_deleted": False
+    }
+
+async def vio_check_stream_service(request_data: dict, send) -> str:
+    """
+    流式违规词检测服务
+    每个检测阶段完成后立即推送结果，最后推送完整结果和剩余次数
+
+    参数:
+        request_data: 请求数据 {"input", "phone", "ai_product_id", "mode"(可选，staged/single)}
+        send: 推送事件帧的协程函数
+
+    推送事件:
+        detect / optimize / score: 各阶段结果
+
+    返回:
+        str: 最后一帧事件
+            result: {"result": 完整检测结果, "daily_remaining": 剩余次数}
+            error: {"code", "message"}
+    """
+    from apps.vio_word.core import vio_word_check_stages, result_to_stages, VIO_PIPELINE_MODES
+    from apps.vio_word.result_cache import VioResultCache
+    from apps.business.quota import EntitlementQuota
+
+    input_text = request_data.get("input") or ""
+    phone = request_data.get("phone")
+    ai_product_id = request_data.get("ai_product_id")
+    mode = request_data.get("mode")
+
+    # 判断输入字符长度
+    if len(input_text) > 120:
+        return ApiResponse.stream_event("error", {"code": 400, "message": "输入字符长度不要超过120哦"})
+    if mode and mode not in VIO_PIPELINE_MODES:
+        return ApiResponse.stream_event("error", {"code": 400, "message": f"mode 只能是 {'/'.join(VIO_PIPELINE_MODES)}"})
+
+    # 预扣次数（Redis原子扣减），检测失败时归还
+    try:
+        entitlement_id, daily_remaining, quota_source = await EntitlementQuota.reserve(phone, ai_product_id)
+    except Exception as e:
+        logger.error(f"查询用户权益服务异常: {str(e)}")
+        return ApiResponse.stream_event("error", {"code": 500, "message": "查询用户权益失败"})
+    if entitlement_id is None:
+        return ApiResponse.stream_event("error", {"code": 403, "message": "暂无权益"})
+    if daily_remaining is None:
+        return ApiResponse.stream_event("error", {"code": 403, "message": "使用额度不足"})
+
+    # 逐阶段推送检测结果，命中结果缓存时直接按阶段推送缓存结果
+    cached = await VioResultCache.get(input_text)
+    stages = result_to_stages(cached) if cached is not None else vio_word_check_stages(input_text, mode)
+    result = None
+    try:
+        async for stage, data in stages:
+            if stage == "result":
+                result = data
+            else:
+                await send(ApiResponse.stream_event(stage, data))
+    except Exception as e:
+        logger.error(f"流式违规词检测失败: {str(e)}")
+        await EntitlementQuota.release(entitlement_id, quota_source)
+        return ApiResponse.stream_event("error", {"code": 500, "message": "检测失败"})
+    if cached is None:
+        await VioResultCache.set(input_text, result)
+
+    # 保存检测记录
+    try:
+        async with AsyncSessionLocal() as db:
+            await vio_word_crud.create_vio_word(db, build_vio_word_record(phone, input_text, result))
+    except Exception as e:
+        logger.error(f"保存违规词检测记录失败: {str(e)}")
+
+    return ApiResponse.stream_event("result", {"result": result, "daily_remaining": daily_remaining})
+
+async def vio_check_batch_service(request: Request) -> Response:
+    """
+    批量违规词检测服务
+    输入按规范化文本去重后以有限并发检测，每个检测成功的去重话术扣减一次使用次数，
+    检测记录一次批量写入
+
+    请求数据:
+        {"inputs": [话术...], "phone", "ai_product_id", "mode"(可选，staged/single)}
+    """
+    import asyncio
+    from apps.vio_word.core import vio_word_check, VIO_PIPELINE_MODES
+    from apps.vio_word.result_cache import VioResultCache, normalize_text
+    from apps.business.quota import EntitlementQuota
+
+    request_data = request.json()
+    inputs = request_data.get("inputs")
+    phone = request_data.get("phone")
+    ai_product_id = request_data.get("ai_product_id")
+    mode = request_data.get("mode")
+
+    if not isinstance(inputs, list) or not inputs:
+        return ApiResponse.validation_error("inputs 必须是非空的话术列表")
+    if len(inputs) > VIO_BATCH_MAX_INPUTS:
+        return ApiResponse.validation_error(f"单次最多检测 {VIO_BATCH_MAX_INPUTS} 条话术")
+    invalid = [index for index, item in enumerate(inputs) if not isinstance(item, str) or not item.strip() or len(item) > 120]
+    if invalid:
+        return ApiResponse.validation_error("话术不能为空且长度不要超过120哦", errors={"invalid_indexes": invalid})
+    if mode and mode not in VIO_PIPELINE_MODES:
+        return ApiResponse.validation_error(f"mode 只能是 {'/'.join(VIO_PIPELINE_MODES)}")
+
+    # 按规范化文本去重，保留首次出现的原文
+    unique_inputs = {}
+    for item in inputs:
+        unique_inputs.setdefault(normalize_text(item), item)
+
+    # 按去重后的话术数量预扣次数，检测失败的话术归还
+    try:
+        entitlement_id, daily_remaining, quota_source = await EntitlementQuota.reserve(phone, ai_product_id, len(unique_inputs))
+    except Exception as e:
+        logger.error(f"查询用户权益服务异常: {str(e)}")
+        return ApiResponse.error(message="查询用户权益失败", status_code=500)
+    if entitlement_id is None:
+        return ApiResponse.success(message="暂无权益", status_code=403)
+    if daily_remaining is None:
+        return ApiResponse.error(message=f"使用额度不足，本次需要 {len(unique_inputs)} 次", status_code=403)
+
+    # 有限并发检测
+    semaphore = asyncio.Semaphore(VIO_BATCH_CONCURRENCY)
+
+    async def check(input_text: str):
+        async with semaphore:
+            result = await VioResultCache.get(input_text)
+            if result is None:
+                result = await vio_word_check(input_text, mode)
+                if result:
+                    await VioResultCache.set(input_text, result)
+            return result
+
+    results = await asyncio.gather(*(check(item) for item in unique_inputs.values()))
+    results = dict(zip(unique_inputs.keys(), results))
+
+    # 只对检测成功的话术扣减次数并保存记录
+    succeeded = {key: result for key, result in results.items() if result}
+    failed_count = len(unique_inputs) - len(succeeded)
+    if failed_count:
+        await EntitlementQuota.release(entitlement_id, quota_source, failed_count)
+        daily_remaining += failed_count
+    if succeeded:
+        try:
+            async with AsyncSessionLocal() as db:
+                await vio_word_crud.bulk_create_vio_words(db, [
+                    build_vio_word_record(phone, unique_inputs[key], result) for key, result in succeeded.items()
+                ])
+        except Exception as e:
+            logger.error(f"批量保存违规词检测记录失败: {str(e)}")
+
+    items = []
+    for item in inputs:
+        result = results[normalize_text(item)]
+        items.append({"input": item, "success": bool(result), "result": result or None})
+    return ApiResponse.success(
+        data={
+            "items": items,
+            "unique_count": len(unique_inputs),
+            "success_count": len(succeeded),
+            "daily_remaining": daily_remaining
+        },
+        message="批量检测完成"
+    )
@@ -1,5 +1,5 @@
-from robyn import Robyn, Request
-from apps.vio_word.views.views import vio_check, get_vio_words, get_vio_word, get_vio_words_by_phone
+from robyn import Robyn, Request, WebSocket
+from apps.vio_word.views.views import vio_check, vio_check_batch, vio_check_stream, get_vio_words, get_vio_word, get_vio_words_by_phone, reload_banned_words
 
 def vio_word_view_routes(app):
     """
@@ -8,6 +8,12 @@ def vio_word_view_routes(app):
     """
     
     app.add_route(route_type="POST", endpoint="/vio_word/check", handler=vio_check) # 违规词检测路由
+    app.add_route(route_type="POST", endpoint="/vio_word/check/batch", handler=vio_check_batch) # 批量违规词检测路由
     app.add_route(route_type="GET", endpoint="/vio_word/words", handler=get_vio_words) # 获取所有违规词检测记录路由
     app.add_route(route_type="GET", endpoint="/vio_word/words/:id", handler=get_vio_word) # 获取单个违规词检测记录路由
     app.add_route(route_type="GET", endpoint="/vio_word/words/phone/:phone", handler=get_vio_words_by_phone) # 根据手机号搜索违规词检测记录路由
+    app.add_route(route_type="POST", endpoint="/vio_word/banned_words/reload", handler=reload_banned_words) # 重新加载违规词词库路由（管理员）
+
+    # 流式违规词检测（WebSocket），各检测阶段完成后立即推送结果
+    vio_check_ws = WebSocket(app, "/vio_word/check/stream")
+    vio_check_ws.on("message")(vio_check_stream)
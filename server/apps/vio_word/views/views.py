@@ -1,13 +1,14 @@
 from robyn import Request, Response
 from core.response import ApiResponse
-from apps.vio_word.core import vio_word_check
+from apps.vio_word.core import vio_word_check, VIO_PIPELINE_MODES
+from apps.vio_word.result_cache import VioResultCache
 from core.middleware import error_handler, request_logger, auth_required, admin_required, rate_limit, auth_userinfo
 from core.logger import setup_logger
 import json
 from apps.users.crud import get_user, update_user
 from core.database import AsyncSessionLocal
 from apps.vio_word import crud as vio_word_crud
-from apps.business import crud as business_crud
+from apps.business.quota import EntitlementQuota
 
 # 设置日志记录器
 logger = setup_logger('vio_word_views')
@@ -27,50 +28,43 @@ async def vio_check(request: Request) -> Response:
             description=json.dumps({"code": 400, "message": "输入字符长度不要超过120哦"})
         )
 
+    # 检测流水线模式（可选）：staged 分阶段调用，single 单次调用
+    mode = request_data.get("mode")
+    if mode and mode not in VIO_PIPELINE_MODES:
+        return ApiResponse.validation_error(f"mode 只能是 {'/'.join(VIO_PIPELINE_MODES)}")
+
     phone = request_data.get("phone")
     ai_product_id = request_data.get("ai_product_id")
     
+    # 预扣次数（Redis原子扣减），检测失败时归还
     try:
-        async with AsyncSessionLocal() as db:
-            filters = {
-                "phone": phone,
-                "ai_product_id": ai_product_id,
-                "is_deleted": False
-            }
-            
-            entitlements, total_count = await business_crud.get_user_entitlements_by_filters(
-                db, 
-                filters=filters,
-                order_by={"created_at": "desc"},
-                page=1,
-                page_size=1
-            )
-            if not entitlements:
-                return ApiResponse.success(
-                    message="暂无权益",
-                    status_code=403
-                )
+        entitlement_id, daily_remaining, quota_source = await EntitlementQuota.reserve(phone, ai_product_id)
     except Exception as e:
         logger.error(f"查询用户权益服务异常: {str(e)}")
         return ApiResponse.error(
             message="查询用户权益失败",
             status_code=500
         )
-
-    # 获取最新的权益记录
-    entitlement = entitlements[0]
-    entitlement_id = entitlement.entitlement_id
-    daily_remaining = entitlement.daily_remaining 
-    
-    if daily_remaining == 0:
+    if entitlement_id is None:
+        return ApiResponse.success(
+            message="暂无权益",
+            status_code=403
+        )
+    if daily_remaining is None:
         return Response(
             status_code=403,
             headers={"Content-Type": "application/json"},
             description=json.dumps({"code": 403, "message": "使用额度不足"})
         )
 
-    result = await vio_word_check(input_text)  # 正确等待异步函数的结果
+    # 优先使用检测结果缓存，命中时同样扣减次数并保存检测记录
+    result = await VioResultCache.get(input_text)
+    if result is None:
+        result = await vio_word_check(input_text, mode)  # 正确等待异步函数的结果
+        if result:
+            await VioResultCache.set(input_text, result)
     if result == False:
+        await EntitlementQuota.release(entitlement_id, quota_source)
         response_data = {
             "code": 500,
             "message": "fail",
@@ -84,30 +78,11 @@ async def vio_check(request: Request) -> Response:
             description=json.dumps(response_data)
         )
     
-    # 更新用户权益使用次数
-    daily_remaining -= 1
-    await business_crud.update_user_entitlement(db, entitlement_id, {"daily_remaining": daily_remaining})
-
     # 保存检测记录
     try:
-        # 处理 is_Violations 字段
-        is_violation = result.get("is_Violations") == "是"
-        
-        vio_word_data = {
-            "phone": phone,
-            "input": input_text,
-            "is_violation": is_violation,
-            "words": result.get("words", ""),
-            "reasons": result.get("reason", ""),  # 注意：API返回的是 reason，而不是 reasons
-            "op": result.get("op", ""),
-            "ideas": result.get("ideas", ""),
-            "old_score": result.get("old_score", 0),
-            "new_score": result.get("new_score", 0),
-            "old_rating": result.get("old_rating", ""),
-            "new_rating": result.get("new_rating", ""),
-            "is_deleted": False
-        }
-        await vio_word_crud.create_vio_word(db, vio_word_data)
+        from apps.vio_word.services import build_vio_word_record
+        async with AsyncSessionLocal() as db:
+            await vio_word_crud.create_vio_word(db, build_vio_word_record(phone, input_text, result))
     except Exception as e:
         logger.error(f"保存违规词检测记录失败: {str(e)}")
         # 继续执行，不影响返回结果
@@ -128,6 +103,16 @@ async def vio_check(request: Request) -> Response:
         description=json.dumps(response_data)
     )
 
+@error_handler
+@request_logger
+@rate_limit(max_requests=5, time_window=60)  # 每分钟最多5次请求
+async def vio_check_batch(request: Request) -> Response:
+    """
+    批量违规词检测
+    """
+    from apps.vio_word.services import vio_check_batch_service
+    return await vio_check_batch_service(request)
+
 @error_handler
 @request_logger
 # @auth_required
@@ -161,10 +146,49 @@ async def get_vio_words_by_phone(request: Request) -> Response:
     from apps.vio_word.services import get_vio_words_by_phone_service
     return await get_vio_words_by_phone_service(request)
 
+@error_handler
+@request_logger
+# @auth_required
+# @admin_required
+async def reload_banned_words(request: Request) -> Response:
+    """
+    重新加载违规词词库
+    """
+    from apps.vio_word.services import reload_banned_words_service
+    return await reload_banned_words_service(request)
+
+
+
+
 
 
 
 
 
+async def vio_check_stream(ws, msg) -> str:
+    """
+    流式违规词检测（WebSocket消息处理）
+    客户端发送 {"input", "phone", "ai_product_id", "mode"}，各检测阶段完成后立即推送结果
+    """
+    from apps.vio_word.services import vio_check_stream_service
+    from core.cache import Cache
+
+    try:
+        request_data = json.loads(msg)
+    except (TypeError, ValueError):
+        return ApiResponse.stream_event("error", {"code": 400, "message": "请求数据格式错误"})
+
+    # 按手机号限流，每分钟最多5次请求（与 /vio_word/check 一致）
+    phone = request_data.get("phone")
+    try:
+        count = await Cache.incr(f"vio_word:stream_rate:{phone}", expire=60)
+        if count > 5:
+            return ApiResponse.stream_event("error", {"code": 429, "message": "请求过于频繁，请稍后再试"})
+    except Exception as e:
+        logger.error(f"流式检测限流不可用: {str(e)}")
 
+    async def send(frame: str):
+        await ws.async_send_to(ws.id, frame)
 
+    # 返回值作为最后一帧（完整结果或错误）发送给客户端
+    return await vio_check_stream_service(request_data, send)
@@ -0,0 +1,57 @@
+"""
+search_video 类目校验的单次请求开销对比
+
+before: 旧实现，把全部三级类目序列化成响应JSON，再解析回来构建 label->value 字典后校验
+        （不含原实现中查询数据库的耗时）
+after:  CategoryIndex.lookup_leaf（CategoryRegistry.lookup_leaf 的实际查询），从共享索引中 O(1) 查询
+
+运行方式（在 server 目录下）:
+    python -m benchmarks.bench_category_lookup
+"""
+import json
+import asyncio
+import timeit
+from apps.search_video.category_index import CategoryIndex, CategoryRegistry, CATEGORY_FILE
+from core.response import ApiResponse
+
+
+def old_lookup(level3: tuple, category: str):
+    """旧实现：get_category_level3_service 序列化 -> json.loads -> 构建字典"""
+    response = ApiResponse.success(
+        data=[node.to_dict() for node in level3],
+        message="获取所有三级类目成功"
+    )
+    category_list = json.loads(response.description).get("data", [])
+    category_map = {item.get("label"): item.get("value") for item in category_list}
+    if category not in category_map:
+        return None
+    return category_map[category]
+
+
+async def new_lookup(category: str):
+    """新实现：从共享索引中查询"""
+    node = await CategoryRegistry.lookup_leaf(category)
+    return node.value if node else None
+
+
+def main(number: int = 200):
+    with open(CATEGORY_FILE, 'r', encoding='utf-8') as f:
+        index = CategoryIndex.from_tree(json.load(f))
+    CategoryRegistry._index = index
+
+    hit = index.level3[len(index.level3) // 2].label
+    miss = "不存在的类目"
+    loop = asyncio.new_event_loop()
+
+    print(f"三级类目数量: {len(index.level3)}")
+    for name, category in (("命中", hit), ("未命中", miss)):
+        assert old_lookup(index.level3, category) == loop.run_until_complete(new_lookup(category))
+        before = timeit.timeit(lambda: old_lookup(index.level3, category), number=number) / number
+        # 只计查询本身，不计事件循环调度开销
+        after = timeit.timeit(lambda: index.lookup_leaf(category), number=number * 1000) / (number * 1000)
+        print(f"[{name}] before: {before * 1e6:10.1f} us/次   after: {after * 1e6:8.2f} us/次   提升: {before / after:,.0f}x")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
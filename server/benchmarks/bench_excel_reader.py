@@ -0,0 +1,144 @@
+"""
+订单Excel解析对比：原有实现（临时文件 + pd.read_excel 全表 + iterrows 逐行处理） vs
+ExcelReader（只读流式读取所需列 + 按列标准化）
+
+生成与课程平台导出格式一致的合成工作簿（40列，约2%的无效行），
+分别统计读取和标准化两个阶段的耗时，并校验两种实现输出的订单一致。
+
+运行方式（在 server 目录下）:
+    python -m benchmarks.bench_excel_reader --rows 100000
+"""
+import io
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+from openpyxl import Workbook
+
+from common.utils.r_excel import ExcelReader
+
+COLUMN_COUNT = 40
+COURSES = ["直播带货实战课【星火学苑】", "短视频 运营【星火 学苑】", "TikTok跨境电商入门", "主播话术进阶【云帆学苑】"]
+
+
+def build_workbook(rows: int) -> bytes:
+    """生成合成订单导出表"""
+    rng = random.Random(42)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([f"列{i + 1}" for i in range(COLUMN_COUNT)])
+    base_time = datetime(2025, 1, 1)
+    for i in range(rows):
+        row = [f"v{i}"] * COLUMN_COUNT
+        roll = rng.random()
+        phone = 13000000000 + rng.randrange(10 ** 9)
+        row[1] = phone if i % 3 else str(float(phone))
+        if roll < 0.01:
+            row[1] = "1380000"  # 无效手机号
+        row[5] = rng.choice(COURSES)
+        row[13] = f"T{i:010d}"
+        purchase_time = base_time + timedelta(seconds=rng.randrange(180 * 86400))
+        if i % 2:
+            row[25] = purchase_time
+        elif i % 4:
+            row[25] = purchase_time.strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            row[25] = purchase_time.strftime('%Y-%m-%d')
+        if 0.01 <= roll < 0.02:
+            row[25] = "2025/13/45"  # 无法解析的支付时间
+        row[37] = "已退款" if rng.random() < 0.05 else "无"
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def legacy_read(file_content: bytes) -> pd.DataFrame:
+    """原有实现的读取阶段"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
+        temp_file.write(file_content)
+        temp_file_path = temp_file.name
+    try:
+        return pd.read_excel(temp_file_path, engine='openpyxl')
+    finally:
+        os.unlink(temp_file_path)
+
+
+def legacy_normalize(df: pd.DataFrame) -> list:
+    """原有实现的逐行标准化阶段"""
+    columns = df.columns.tolist()
+    selected_df = df[[columns[1], columns[5], columns[13], columns[25], columns[37]]]
+    selected_df.columns = ['手机号', '课程标题', '三方支付单号', '支付时间', '退款状态']
+    selected_df = selected_df.dropna(how='all').reset_index(drop=True)
+    orders = []
+    for _, row in selected_df.iterrows():
+        purchase_time = row['支付时间']
+        if isinstance(purchase_time, str):
+            try:
+                purchase_time = datetime.strptime(purchase_time, '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                try:
+                    purchase_time = datetime.strptime(purchase_time, '%Y-%m-%d')
+                except ValueError:
+                    continue
+        is_refund = True if str(row['退款状态']).strip() == '已退款' else False
+        phone = str(row['手机号']).strip()
+        if '.' in phone:
+            phone = phone.split('.')[0]
+        if not phone.isdigit() or len(phone) != 11:
+            continue
+        course_name = str(row['课程标题']).strip().replace(' ', '')
+        if '【' in course_name and '】' in course_name:
+            parts = course_name.split('【')
+            course_name = f"{parts[0].strip()}【{parts[1].replace('】', '').strip()}】"
+        order_id = str(row['三方支付单号']).strip()
+        if not order_id:
+            continue
+        orders.append({
+            'order_id': order_id,
+            'phone': phone,
+            'course_name': course_name,
+            'purchase_time': datetime.strptime(purchase_time.strftime('%Y-%m-%d %H:%M:%S'), '%Y-%m-%d %H:%M:%S'),
+            'is_refund': is_refund,
+            'is_generate': False
+        })
+    return orders
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(args):
+    print(f"生成 {args.rows} 行合成工作簿...")
+    file_content, build_seconds = timed(build_workbook, args.rows)
+    print(f"工作簿大小: {len(file_content) / 1024 / 1024:.1f} MB  生成耗时: {build_seconds:.1f}s")
+
+    df, legacy_read_seconds = timed(legacy_read, file_content)
+    legacy_orders, legacy_normalize_seconds = timed(legacy_normalize, df)
+
+    raw, read_seconds = timed(ExcelReader.read_order_columns, file_content)
+    (orders, rejected), normalize_seconds = timed(ExcelReader.normalize_orders, raw)
+    records = orders.to_dict('records')
+
+    assert records == legacy_orders, "两种实现输出的订单不一致"
+
+    print(f"有效订单: {len(records)}  无效行: {len(rejected)} {rejected['原因'].value_counts().to_dict()}")
+    print(f"{'实现':<10}{'读取(s)':>10}{'标准化(s)':>12}{'合计(s)':>10}")
+    legacy_total = legacy_read_seconds + legacy_normalize_seconds
+    total = read_seconds + normalize_seconds
+    print(f"{'legacy':<10}{legacy_read_seconds:>10.2f}{legacy_normalize_seconds:>12.2f}{legacy_total:>10.2f}")
+    print(f"{'vector':<10}{read_seconds:>10.2f}{normalize_seconds:>12.2f}{total:>10.2f}")
+    print(f"标准化加速: {legacy_normalize_seconds / normalize_seconds:.1f}x  整体加速: {legacy_total / total:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="订单Excel解析 原有实现/按列实现 耗时对比")
+    parser.add_argument("--rows", type=int, default=100000)
+    main(parser.parse_args())
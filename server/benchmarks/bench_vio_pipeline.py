@@ -0,0 +1,186 @@
+"""
+违规词检测流水线模式对比：staged（检测、优化、打分三次调用） vs single（单次调用）
+
+在本地启动一个兼容 OpenAI 流式接口的桩服务，按 首字延迟 + 每token耗时 模拟大模型，
+对两种模式分别发起请求，统计 p50/p99 延迟以及每次检测的 token 消耗（按字符数估算）。
+--invalid-rate 可模拟单次调用输出校验失败的比例（失败后回退到 staged）。
+
+运行方式（在 server 目录下）:
+    python -m benchmarks.bench_vio_pipeline --requests 200 --concurrency 20
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+# 违规样例话术（均为违规，保证两种模式都走完整流程）
+SAMPLES = [
+    "家人们这款面霜是全网最低价，错过今天再等一年！",
+    "我们的保健茶可以根治失眠，喝一周立竿见影",
+    "这是全球第一款百分百纯天然的洗发水",
+    "国家级专家推荐，绝对无副作用，放心买",
+]
+
+OUTPUTS = {
+    "detect": {"is_Violations": "是", "words": "全网最低价", "reason": "使用极限用语，违反广告法"},
+    "optimize": {"op": "家人们这款面霜今天直播间有专属优惠，喜欢的抓紧下单", "ideas": "删除极限用语，改为描述直播间优惠"},
+    "score": {"old_score": 60, "new_score": 95, "old_rating": "专业", "new_rating": "大师"},
+}
+OUTPUTS["single"] = {**OUTPUTS["detect"], **OUTPUTS["optimize"], **OUTPUTS["score"]}
+
+
+class StubLLMServer:
+    """
+    OpenAI 兼容的流式 chat/completions 桩服务
+    """
+
+    def __init__(self, first_token_ms: float, per_token_ms: float, invalid_rate: float):
+        self.first_token_ms = first_token_ms
+        self.per_token_ms = per_token_ms
+        self.invalid_rate = invalid_rate
+        self.usage = {}
+        self._random = random.Random(7)
+
+    @staticmethod
+    def _stage(system_prompt: str) -> str:
+        """根据系统提示词判断调用的阶段"""
+        if "优化与打分" in system_prompt:
+            return "single"
+        if "优化大师" in system_prompt:
+            return "optimize"
+        if "打分专家" in system_prompt:
+            return "score"
+        return "detect"
+
+    def _record(self, stage: str, prompt_tokens: int, completion_tokens: int):
+        usage = self.usage.setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        usage["calls"] += 1
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+
+    def reset(self):
+        self.usage = {}
+
+    async def _respond(self, body: dict, writer: asyncio.StreamWriter):
+        messages = body.get("messages", [])
+        system_prompt = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        stage = self._stage(system_prompt)
+
+        output = OUTPUTS[stage]
+        if stage == "single" and self._random.random() < self.invalid_rate:
+            output = {"is_Violations": "是", "words": OUTPUTS["detect"]["words"]}  # 缺少字段，校验失败
+        content = json.dumps(output, ensure_ascii=False)
+
+        # token 按字符数估算
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages)
+        self._record(stage, prompt_tokens, len(content))
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await asyncio.sleep(self.first_token_ms / 1000)
+        step = 8
+        for i in range(0, len(content), step):
+            piece = content[i:i + step]
+            chunk = {
+                "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}]
+            }
+            self._write_event(writer, chunk)
+            await writer.drain()
+            await asyncio.sleep(self.per_token_ms * len(piece) / 1000)
+        self._write_event(writer, {
+            "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def _write_event(self, writer, event: dict):
+        self._write_chunk(writer, f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个keep-alive连接上的所有请求"""
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._respond(json.loads(body or b"{}"), writer)
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    index = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+async def run_mode(vio_word_check, mode: str, requests: int, concurrency: int) -> list:
+    """以指定并发执行检测，返回每次检测的耗时（毫秒）"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await vio_word_check(SAMPLES[i % len(SAMPLES)], mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert result and result.get("is_Violations") == "是", result
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+async def main(args):
+    stub = StubLLMServer(args.first_token_ms, args.per_token_ms, args.invalid_rate)
+    server = await asyncio.start_server(stub.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    # 必须在导入检测模块之前设置，使共享模型客户端指向桩服务；关闭本地预过滤，只比较大模型调用
+    os.environ["LLM_API_BASE"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["VIO_PREFILTER_ENABLED"] = "false"
+    from apps.vio_word.core import vio_word_check
+    from core.llm import LLMRegistry
+    # 模型客户端在首次调用时创建，提前创建避免计入第一批请求的耗时
+    LLMRegistry.get_model("doubao-pro")
+
+    print(f"请求数: {args.requests}  并发: {args.concurrency}  首字延迟: {args.first_token_ms}ms  "
+          f"每token: {args.per_token_ms}ms  单次调用校验失败率: {args.invalid_rate:.0%}")
+    print(f"{'mode':<8}{'p50(ms)':>10}{'p99(ms)':>10}{'mean(ms)':>10}{'calls/次':>10}{'prompt tok/次':>15}{'completion tok/次':>19}")
+    for mode in ("staged", "single"):
+        stub.reset()
+        latencies = await run_mode(vio_word_check, mode, args.requests, args.concurrency)
+        calls = sum(u["calls"] for u in stub.usage.values())
+        prompt_tokens = sum(u["prompt_tokens"] for u in stub.usage.values())
+        completion_tokens = sum(u["completion_tokens"] for u in stub.usage.values())
+        print(f"{mode:<8}{percentile(latencies, 50):>10.1f}{percentile(latencies, 99):>10.1f}"
+              f"{statistics.mean(latencies):>10.1f}{calls / args.requests:>10.2f}"
+              f"{prompt_tokens / args.requests:>15.0f}{completion_tokens / args.requests:>19.0f}")
+
+    await LLMRegistry.close()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="违规词检测 staged/single 模式延迟与token消耗对比")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--per-token-ms", type=float, default=2)
+    parser.add_argument("--invalid-rate", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -1,125 +1,137 @@
+import io
 import pandas as pd
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from openpyxl import load_workbook
+from typing import List, Dict, Any, Tuple
 from core.logger import setup_logger
-import os
-import tempfile
 
 logger = setup_logger('excel_utils')
 
+# 订单导出表中使用的列（从0开始）：1:手机号 5:课程标题 13:三方支付单号 25:支付时间 37:退款状态
+ORDER_COLUMNS = {1: '手机号', 5: '课程标题', 13: '三方支付单号', 25: '支付时间', 37: '退款状态'}
+
+# 支付时间支持的格式（按顺序尝试）
+PURCHASE_TIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
 class ExcelReader:
     """Excel表格读取工具类"""
-    
+
+    @staticmethod
+    def read_order_columns(file_content: bytes) -> pd.DataFrame:
+        """
+        以只读流式模式从内存读取订单导出表中需要的列（不写临时文件，不加载整张表的其他列）
+
+        Args:
+            file_content: Excel文件的二进制内容
+
+        Returns:
+            DataFrame: 列为 手机号、课程标题、三方支付单号、支付时间、退款状态
+        """
+        workbook = load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            indexes = list(ORDER_COLUMNS)
+            data = [
+                [row[i] if i < len(row) else None for i in indexes]
+                for row in sheet.iter_rows(min_row=2, values_only=True)
+            ]
+        finally:
+            workbook.close()
+        return pd.DataFrame(data, columns=list(ORDER_COLUMNS.values()), dtype=object)
+
+    @staticmethod
+    def parse_purchase_time(values: pd.Series) -> pd.Series:
+        """
+        按列解析支付时间：日期单元格直接使用，字符串依次按 PURCHASE_TIME_FORMATS 解析
+        无法解析的值为 NaT
+        """
+        parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+        is_date = values.map(lambda value: isinstance(value, datetime))
+        if is_date.any():
+            parsed[is_date] = pd.to_datetime(values[is_date], errors='coerce')
+        text = values[values.map(lambda value: isinstance(value, str))].str.strip()
+        for time_format in PURCHASE_TIME_FORMATS:
+            text = text[parsed[text.index].isna()]
+            if text.empty:
+                break
+            parsed[text.index] = pd.to_datetime(text, format=time_format, errors='coerce')
+        return parsed
+
     @staticmethod
-    def process_uploaded_excel(file_content: bytes) -> List[Dict[str, Any]]:
+    def normalize_course_names(values: pd.Series) -> pd.Series:
+        """按列标准化课程名称：移除空格，统一 课程名【学苑】 格式"""
+        names = values.astype(str).str.strip().str.replace(' ', '', regex=False)
+        has_academy = names.str.contains('【', regex=False) & names.str.contains('】', regex=False)
+        # 提取课程名称和学苑名称（学苑名称取第一个【之后、下一个【之前的部分，去掉】）
+        parts = names[has_academy].str.extract(r'^([^【]*)【([^【]*)')
+        names[has_academy] = parts[0] + '【' + parts[1].str.replace('】', '', regex=False) + '】'
+        return names
+
+    @staticmethod
+    def normalize_orders(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
-        处理上传的Excel文件内容
-        
+        按列标准化订单数据
+
+        Args:
+            df: read_order_columns 读取的原始数据
+
+        Returns:
+            Tuple[DataFrame, DataFrame]: (订单数据, 被拒绝的行)
+                被拒绝的行保留原始列，并增加 行号（Excel中的行号）和 原因 两列
+        """
+        # 删除空行（保留原始行号）
+        df = df.dropna(how='all')
+
+        # 处理支付时间
+        purchase_time = ExcelReader.parse_purchase_time(df['支付时间'])
+        # 处理手机号（兼容浮点数格式）
+        phone = df['手机号'].astype(str).str.strip().str.extract(r'^(\d{11})(?:\.\d*)?$', expand=False)
+        # 处理订单号
+        order_id = df['三方支付单号'].where(df['三方支付单号'].notna(), '').astype(str).str.strip()
+        # 处理退款状态
+        is_refund = df['退款状态'].astype(str).str.strip() == '已退款'
+
+        # 按原有的校验顺序标记拒绝原因
+        reason = pd.Series(None, index=df.index, dtype=object)
+        reason[order_id == ''] = '订单号为空'
+        reason[phone.isna()] = '无效的手机号'
+        reason[purchase_time.isna()] = '无法解析支付时间'
+        valid = reason.isna()
+
+        rejected = df[~valid].copy()
+        rejected.insert(0, '行号', rejected.index + 2)
+        rejected['原因'] = reason[~valid]
+        rejected = rejected.reset_index(drop=True)
+
+        orders = pd.DataFrame({
+            'order_id': order_id[valid],
+            'phone': phone[valid],
+            'course_name': ExcelReader.normalize_course_names(df.loc[valid, '课程标题']),
+            'purchase_time': pd.Series(
+                [value.to_pydatetime() for value in purchase_time[valid]], index=purchase_time[valid].index, dtype=object
+            ),
+            'is_refund': is_refund[valid],
+            'is_generate': False
+        }).reset_index(drop=True)
+        return orders, rejected
+
+    @staticmethod
+    def process_uploaded_excel(file_content: bytes) -> Tuple[List[Dict[str, Any]], pd.DataFrame]:
+        """
+        处理上传的Excel文件内容（同步执行，调用方应放到线程中运行）
+
         Args:
             file_content: Excel文件的二进制内容
-            
+
         Returns:
-            List[Dict]: 处理后的订单数据列表
+            Tuple[List[Dict], DataFrame]: (处理后的订单数据列表, 被拒绝的行)
         """
         try:
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-                temp_file.write(file_content)
-                temp_file_path = temp_file.name
-            
-            try:
-                # 读取Excel文件
-                df = pd.read_excel(temp_file_path, engine='openpyxl')
-                
-                # 获取所有列名
-                columns = df.columns.tolist()
-                
-                # 提取指定列的数据
-                # 2:手机号 6:课程标题 14:三方支付单号 26:支付时间 38:退款状态
-                selected_columns = [columns[1], columns[5], columns[13], columns[25], columns[37]]
-                print("##########################################")
-                print(selected_columns)
-                print("##########################################")
-                # 创建新的DataFrame只包含选定的列
-                selected_df = df[selected_columns]
-                
-                # 重命名列
-                selected_df.columns = ['手机号', '课程标题', '三方支付单号', '支付时间', '退款状态']
-                
-                # 删除空行
-                selected_df = selected_df.dropna(how='all')
-                
-                # 重置索引
-                selected_df = selected_df.reset_index(drop=True)
-                
-                # 转换为订单数据列表
-                orders = []
-                for _, row in selected_df.iterrows():
-                    # 处理支付时间
-                    purchase_time = row['支付时间']
-                    if isinstance(purchase_time, str):
-                        try:
-                            purchase_time = datetime.strptime(purchase_time, '%Y-%m-%d %H:%M:%S')
-                        except ValueError:
-                            # 尝试其他常见格式
-                            try:
-                                purchase_time = datetime.strptime(purchase_time, '%Y-%m-%d')
-                            except ValueError:
-                                logger.error(f"无法解析支付时间: {purchase_time}")
-                                continue
-                    
-                    # 处理退款状态
-                    is_refund = True if str(row['退款状态']).strip() == '已退款' else False
-                    
-                    # 处理手机号
-                    phone = str(row['手机号']).strip()
-                    # 处理可能的浮点数格式
-                    if '.' in phone:
-                        phone = phone.split('.')[0]
-                    if not phone.isdigit() or len(phone) != 11:
-                        logger.error(f"无效的手机号: {phone}")
-                        continue
-                    
-                    # 处理课程名称（标准化处理）
-                    course_name = str(row['课程标题']).strip()
-                    # 移除所有空格
-                    course_name = course_name.replace(' ', '')
-                    # 标准化课程名称格式
-                    if '【' in course_name and '】' in course_name:
-                        # 提取课程名称和学苑名称
-                        parts = course_name.split('【')
-                        main_name = parts[0].strip()
-                        academy = parts[1].replace('】', '').strip()
-                        # 重新组合，确保格式一致
-                        course_name = f"{main_name}【{academy}】"
-                    
-                    # 处理订单号
-                    order_id = str(row['三方支付单号']).strip()
-                    if not order_id:
-                        logger.error("订单号为空")
-                        continue
-                    
-                    order = {
-                        'order_id': order_id,
-                        'phone': phone,
-                        'course_name': course_name,
-                        'purchase_time': purchase_time.strftime('%Y-%m-%d %H:%M:%S'),
-                        'is_refund': is_refund,
-                        'is_generate': False
-                    }
-                    orders.append(order)
-                print("r_excel##########################################")
-                print(orders)
-                print("##########################################")
-                return orders
-                
-            finally:
-                # 删除临时文件
-                try:
-                    os.unlink(temp_file_path)
-                except Exception as e:
-                    logger.error(f"删除临时文件失败: {str(e)}")
-                    
+            orders, rejected = ExcelReader.normalize_orders(ExcelReader.read_order_columns(file_content))
+            if not rejected.empty:
+                logger.error(f"Excel中 {len(rejected)} 行数据无效: {rejected['原因'].value_counts().to_dict()}")
+            return orders.to_dict('records'), rejected
+
         except Exception as e:
             logger.error(f"处理Excel文件失败: {str(e)}")
             raise
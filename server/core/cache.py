@@ -185,6 +185,111 @@ class Cache:
             return False 
         
     
+    @classmethod
+    async def eval(cls, script: str, keys: list = None, args: list = None):
+        """
+        执行Lua脚本（在Redis中原子执行）
+        :param script: Lua脚本
+        :param keys: 脚本使用的键（KEYS）
+        :param args: 脚本参数（ARGV）
+        :return: 脚本返回值
+        """
+        try:
+            await cls.ensure_connection()
+            keys = keys or []
+            return await cls._redis.eval(script, len(keys), *keys, *(args or []))
+        except Exception as e:
+            logger.error(f"Failed to eval script: {str(e)}")
+            raise
+
+    @classmethod
+    async def set_nx(cls, key: str, value: str, expire: int) -> bool:
+        """
+        键不存在时设置（用于分布式锁）
+        :param key: 键
+        :param value: 值（如锁持有者标识）
+        :param expire: 过期时间（秒）
+        :return: 是否设置成功
+        """
+        try:
+            await cls.ensure_connection()
+            return bool(await cls._redis.set(key, value, nx=True, ex=expire))
+        except Exception as e:
+            logger.error(f"Failed to set key {key} with NX: {str(e)}")
+            raise
+
+    @classmethod
+    async def delete_pattern(cls, pattern: str) -> int:
+        """
+        按模式批量删除缓存
+        :param pattern: 键模式，如 "prefix:*"
+        :return: 删除的键数量
+        """
+        try:
+            await cls.ensure_connection()
+            count = 0
+            batch = []
+            async for key in cls._redis.scan_iter(match=pattern, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    count += await cls._redis.delete(*batch)
+                    batch = []
+            if batch:
+                count += await cls._redis.delete(*batch)
+            logger.debug(f"Cache deleted by pattern {pattern}: {count}")
+            return count
+        except Exception as e:
+            logger.error(f"Error deleting cache by pattern {pattern}: {str(e)}")
+            return 0
+
+    @classmethod
+    async def incr(cls, key: str, amount: int = 1, expire: int = None) -> int:
+        """
+        计数器自增
+        :param key: 键
+        :param amount: 增量
+        :param expire: 过期时间（秒），仅在计数器首次创建时设置
+        :return: 自增后的值
+        """
+        try:
+            await cls.ensure_connection()
+            value = await cls._redis.incrby(key, amount)
+            if expire and value == amount:
+                await cls._redis.expire(key, expire)
+            return value
+        except Exception as e:
+            logger.error(f"Failed to increase counter {key}: {str(e)}")
+            raise
+
+    @classmethod
+    async def get_counter(cls, key: str) -> int:
+        """
+        获取计数器的值
+        :param key: 键
+        :return: 计数器的值，不存在时返回0
+        """
+        try:
+            await cls.ensure_connection()
+            value = await cls._redis.get(key)
+            return int(value) if value else 0
+        except Exception as e:
+            logger.error(f"Failed to get counter {key}: {str(e)}")
+            raise
+
+    @classmethod
+    async def ttl(cls, key: str) -> int:
+        """
+        获取键的剩余过期时间
+        :param key: 键
+        :return: 剩余秒数，键不存在返回-2，未设置过期时间返回-1
+        """
+        try:
+            await cls.ensure_connection()
+            return await cls._redis.ttl(key)
+        except Exception as e:
+            logger.error(f"Failed to get ttl for key {key}: {str(e)}")
+            raise
+
     @classmethod
     async def set_message(cls, session_id: str, message: dict, expire: int = None):
         """
@@ -0,0 +1,63 @@
+import os
+import httpx
+from dotenv import load_dotenv
+from pathlib import Path
+from core.logger import setup_logger
+
+# 获取项目根目录
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 加载环境变量
+load_dotenv(os.path.join(BASE_DIR, "robyn.env"))
+
+# HTTP连接池配置
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 20))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', 10))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 30))
+
+logger = setup_logger('http_client')
+
+class HttpClient:
+    """
+    进程内共享的异步HTTP客户端
+    复用keep-alive连接池，避免每次请求重新建立TCP/TLS连接
+    """
+    _client = None
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        """获取共享的异步HTTP客户端（懒加载）"""
+        if cls._client is None or cls._client.is_closed:
+            cls._client = httpx.AsyncClient(
+                timeout=HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+            logger.info(f"HTTP client created: max_connections={HTTP_MAX_CONNECTIONS}, max_keepalive={HTTP_MAX_KEEPALIVE_CONNECTIONS}")
+        return cls._client
+
+    @classmethod
+    async def post(cls, url: str, headers: dict = None, json_data: dict = None) -> httpx.Response:
+        """
+        发送POST请求
+        :param url: 请求地址
+        :param headers: 请求头
+        :param json_data: JSON请求体
+        :return: httpx.Response
+        """
+        client = cls.get_client()
+        return await client.post(url, headers=headers, json=json_data)
+
+    @classmethod
+    async def close(cls):
+        """关闭共享的HTTP客户端"""
+        if cls._client:
+            try:
+                await cls._client.aclose()
+                logger.info("HTTP client closed successfully")
+            except Exception as e:
+                logger.error(f"Error closing HTTP client: {str(e)}")
+            finally:
+                cls._client = None
@@ -0,0 +1,129 @@
+import os
+import httpx
+from dotenv import load_dotenv
+from pathlib import Path
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI
+from core.logger import setup_logger
+
+# 获取项目根目录
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 加载环境变量
+load_dotenv(os.path.join(BASE_DIR, "robyn.env"))
+
+# 大模型接口地址
+LLM_API_BASE = os.getenv('LLM_API_BASE', "https://ark.cn-beijing.volces.com/api/v3")
+# 大模型连接池配置
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 50))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', 20))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 120))
+
+# 模型配置：名称 -> ChatOpenAI参数
+LLM_MODELS = {
+    "doubao-pro": {
+        "api_key": os.getenv('LLM_DOUBAO_PRO_API_KEY', "31711a19-2c64-4337-a7b1-70be31e1fdd2"),
+        "model_name": os.getenv('LLM_DOUBAO_PRO_MODEL', "doubao-pro-32k-241215"),
+        "temperature": 0.7,
+    },
+    "doubao-1.5-pro": {
+        "api_key": os.getenv('LLM_DOUBAO_15_PRO_API_KEY', "4a9c6c92-91fa-4087-beb3-4a894d0ce586"),
+        "model_name": os.getenv('LLM_DOUBAO_15_PRO_MODEL', "doubao-1.5-pro-32k-250115"),
+        "temperature": 0.7,
+    },
+}
+
+logger = setup_logger('llm')
+
+class LLMRegistry:
+    """
+    进程内共享的大模型客户端注册表
+    每个模型只创建一次客户端，所有模型共用一个keep-alive连接池，
+    各业务模块在导入时通过 build_chain 构建好 prompt|model|parser 链并复用，
+    链在每次调用时才从注册表取模型客户端，连接池关闭后再次调用会自动重建
+    """
+    _http_client = None
+    _models = {}
+
+    @classmethod
+    def get_http_client(cls) -> httpx.AsyncClient:
+        """获取大模型调用共享的异步HTTP客户端（懒加载）"""
+        if cls._http_client is None or cls._http_client.is_closed:
+            cls._http_client = httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+            # 连接池重建后，旧的模型客户端不再可用
+            cls._models = {}
+            logger.info(f"LLM http client created: max_connections={LLM_MAX_CONNECTIONS}, max_keepalive={LLM_MAX_KEEPALIVE_CONNECTIONS}")
+        return cls._http_client
+
+    @classmethod
+    def get_model(cls, name: str) -> ChatOpenAI:
+        """
+        获取指定名称的模型客户端
+        :param name: LLM_MODELS 中的模型名称
+        """
+        http_client = cls.get_http_client()
+        if name not in cls._models:
+            config = LLM_MODELS.get(name)
+            if config is None:
+                raise ValueError(f"未配置的模型: {name}")
+            try:
+                cls._models[name] = ChatOpenAI(
+                    openai_api_key=config["api_key"],
+                    openai_api_base=config.get("api_base", LLM_API_BASE),
+                    model_name=config["model_name"],
+                    temperature=config.get("temperature", 0.7),
+                    streaming=config.get("streaming", True),
+                    http_async_client=http_client
+                )
+            except Exception as e:
+                raise Exception(f"模型初始化失败: {str(e)}")
+        return cls._models[name]
+
+    @classmethod
+    def build_chain(cls, system_prompt: str, user_prompt: str, model: str):
+        """
+        构建 prompt|model|parser 链，输出解析为JSON
+        :param system_prompt: 系统提示词
+        :param user_prompt: 用户消息模板
+        :param model: LLM_MODELS 中的模型名称
+        """
+        prompt_template = ChatPromptTemplate.from_messages([
+            ('system', system_prompt),
+            ('user', user_prompt)
+        ])
+        return prompt_template | cls._lazy_model(model) | JsonOutputParser()
+
+    @classmethod
+    def _lazy_model(cls, name: str) -> RunnableLambda:
+        """调用时再获取模型客户端（返回的模型会以同样的输入被调用，流式输出不受影响）"""
+        if name not in LLM_MODELS:
+            raise ValueError(f"未配置的模型: {name}")
+
+        def resolve(_input):
+            return cls.get_model(name)
+
+        async def aresolve(_input):
+            return cls.get_model(name)
+
+        return RunnableLambda(resolve, afunc=aresolve, name=name)
+
+    @classmethod
+    async def close(cls):
+        """关闭共享的连接池并清空模型客户端（之后的调用会重建连接池）"""
+        if cls._http_client:
+            try:
+                await cls._http_client.aclose()
+                logger.info("LLM http client closed successfully")
+            except Exception as e:
+                logger.error(f"Error closing LLM http client: {str(e)}")
+            finally:
+                cls._http_client = None
+                cls._models = {}
@@ -0,0 +1,63 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LocalLRUCache:
+    """
+    进程内LRU缓存，带过期时间
+    用作Redis前的一级缓存，减少热点键的网络往返
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: int = 300):
+        """
+        :param max_size: 最大缓存条数，超出时淘汰最久未使用的条目
+        :param ttl: 过期时间（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """
+        获取缓存
+        :param key: 键
+        :return: 值，不存在或已过期时返回None
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expire_at, value = item
+            if expire_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int = None):
+        """
+        设置缓存
+        :param key: 键
+        :param value: 值
+        :param ttl: 过期时间（秒），默认使用实例的ttl
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        """删除缓存"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -53,6 +53,20 @@ class ApiResponse:
             status_code=status_code
         )
     
+    @staticmethod
+    def raw(body: str, status_code: int = status_codes.HTTP_200_OK) -> Response:
+        """
+        直接返回预先序列化好的JSON响应
+        :param body: 响应JSON字符串
+        :param status_code: HTTP状态码
+        :return: Response对象
+        """
+        return Response(
+            description=body,
+            headers={"Content-Type": "application/json"},
+            status_code=status_code
+        )
+    
     @staticmethod
     def not_found(message: str = "Resource not found") -> Response:
         """
@@ -89,3 +103,13 @@ class ApiResponse:
         :return: Response对象
         """
         return ApiResponse.error(message, status_codes.HTTP_403_FORBIDDEN)
+
+    @staticmethod
+    def stream_event(event: str, data: Any) -> str:
+        """
+        流式推送的事件帧（SSE格式：event + data）
+        :param event: 事件名
+        :param data: 事件数据
+        :return: 事件帧字符串
+        """
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,44 +1,364 @@
+"""
+定时任务调度器
+
+任务按cron表达式（分 时 日 月 周）注册，每个计划时间点在集群内只执行一次：
+先通过 Redis 锁（SET NX）抢占，再写入任务执行记录表（任务名 + 计划时间唯一）作为持久化的去重依据；
+执行记录保存开始/结束时间、耗时和结果。服务重启后，上次执行之后错过的计划时间点合并补跑一次
+"""
+import os
+import json
+import time
+import socket
 import asyncio
-import logging
-from datetime import datetime, time, timedelta
-from apps.business.services import update_daily_remaining_service
-
-logger = logging.getLogger(__name__)
-
-async def run_at_specific_time(target_time: time, coro):
-    """
-    在指定时间运行协程
-    :param target_time: 目标时间
-    :param coro: 要运行的协程
-    """
-    while True:
-        now = datetime.now().time()
-        if now >= target_time:
-            # 如果当前时间已经超过目标时间，等待到明天
-            tomorrow = datetime.now().date() + timedelta(days=1)
-            target_datetime = datetime.combine(tomorrow, target_time)
-        else:
-            # 否则等待到今天的目标时间
-            today = datetime.now().date()
-            target_datetime = datetime.combine(today, target_time)
-        
-        # 计算需要等待的秒数
-        wait_seconds = (target_datetime - datetime.now()).total_seconds()
-        
-        # 等待到目标时间
-        await asyncio.sleep(wait_seconds)
-        
+from datetime import datetime, timedelta
+from sqlalchemy import Column, Integer, DateTime, VARCHAR, UniqueConstraint, select, update
+from sqlalchemy.exc import IntegrityError
+from core.database import Base, AsyncSessionLocal
+from core.cache import Cache
+from core.logger import setup_logger
+
+logger = setup_logger('scheduler')
+
+# 每日重置用户权益剩余额度的计划
+DAILY_REMAINING_RESET_SCHEDULE = os.getenv('DAILY_REMAINING_RESET_SCHEDULE', '0 0 * * *')
+# 订单增量同步到用户权益的计划
+ORDER_SYNC_SCHEDULE = os.getenv('ORDER_SYNC_SCHEDULE', '*/5 * * * *')
+# 调度循环的最长休眠时间（秒），系统时间调整后也能及时发现到期任务
+SCHEDULER_MAX_SLEEP = int(os.getenv('SCHEDULER_MAX_SLEEP', 30))
+
+
+class Scheduler_job_run(Base):
+    """
+    定时任务执行记录模型，每个(任务, 计划时间)一条
+    """
+    __tablename__ = 'scheduler_job_run'
+    __table_args__ = (
+        UniqueConstraint('job_name', 'scheduled_at', name='uq_scheduler_job_run'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True) # 主键
+    job_name = Column(VARCHAR(50), nullable=False) # 任务名称
+    scheduled_at = Column(DateTime, nullable=False) # 计划执行时间
+    started_at = Column(DateTime, nullable=False) # 开始执行时间
+    finished_at = Column(DateTime, nullable=True) # 结束时间
+    duration_ms = Column(Integer, nullable=True) # 执行耗时（毫秒）
+    status = Column(VARCHAR(20), nullable=False, default="running") # 状态: running/success/failed
+    result = Column(VARCHAR(1000), nullable=True) # 执行结果摘要
+    error = Column(VARCHAR(1000), nullable=True) # 失败原因
+    host = Column(VARCHAR(100), nullable=True) # 执行的主机和进程
+
+    def __repr__(self):
+        return (f"Scheduler_job_run(id={self.id}, "
+                f"job_name={self.job_name}, "
+                f"scheduled_at={self.scheduled_at}, "
+                f"status={self.status}, "
+                f"duration_ms={self.duration_ms})")
+
+    def to_dict(self):
+        """转换为字典"""
+        try:
+            return {
+                "id": self.id,
+                "job_name": self.job_name,
+                "scheduled_at": self.scheduled_at.isoformat() if self.scheduled_at else None,
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "duration_ms": self.duration_ms,
+                "status": self.status,
+                "result": self.result,
+                "error": self.error,
+                "host": self.host
+            }
+        except Exception as e:
+            logger.error(f"Error converting scheduler_job_run to dict: {str(e)}")
+            return {}
+
+
+class CronSpec:
+    """
+    cron表达式：分 时 日 月 周（周日为0或7）
+    每段支持 *、数字、a-b、a,b 以及 /n 步长
+    """
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron表达式必须为5段: {expression}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)
+        ]
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        # 日和周都有限制时满足其一即可（与标准cron一致）
+        self.day_restricted = fields[2] != '*'
+        self.weekday_restricted = fields[4] != '*'
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(','):
+            part, has_step, step = part.partition('/')
+            step = int(step) if has_step else 1
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-', 1))
+            else:
+                start = int(part)
+                end = high if has_step else start
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"cron字段超出范围: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """计算严格晚于指定时间的下一个计划时间点"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron表达式没有可执行的时间点: {self.expression}")
+
+    def latest_between(self, start: datetime, end: datetime):
+        """计算 (start, end] 内最晚的计划时间点（从end向前查找），没有时返回None"""
+        candidate = end.replace(second=0, microsecond=0)
+        while candidate > start:
+            if candidate.month not in self.months:
+                candidate = candidate.replace(day=1, hour=0, minute=0) - timedelta(minutes=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) - timedelta(minutes=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) - timedelta(minutes=1)
+            elif candidate.minute not in self.minutes:
+                candidate -= timedelta(minutes=1)
+            else:
+                return candidate
+        return None
+
+
+class ScheduledJob:
+    """
+    已注册的定时任务
+    """
+
+    def __init__(self, name: str, schedule: str, func, lock_ttl: int, catch_up: bool):
+        self.name = name
+        self.cron = CronSpec(schedule)
+        self.func = func
+        self.lock_ttl = lock_ttl
+        self.catch_up = catch_up
+        self.next_run = None
+        self.task = None
+
+
+class Scheduler:
+    """
+    定时任务调度器（进程内单例）
+    """
+    _jobs = {}
+    _loop_task = None
+    _host = f"{socket.gethostname()}:{os.getpid()}"
+
+    @classmethod
+    def register(cls, name: str, schedule: str, func, lock_ttl: int = 3600, catch_up: bool = True):
+        """
+        注册定时任务
+
+        参数:
+            name: 任务名称（集群内唯一）
+            schedule: cron表达式
+            func: 任务协程函数（无参数），返回值记录为执行结果，返回False视为失败
+            lock_ttl: 集群锁的过期时间（秒），应大于任务的最长执行时间
+            catch_up: 服务重启后是否补跑错过的计划时间点
+        """
+        cls._jobs[name] = ScheduledJob(name, schedule, func, lock_ttl, catch_up)
+        logger.info(f"注册定时任务: {name} ({schedule})")
+
+    @classmethod
+    async def start(cls):
+        """计算各任务的下次执行时间（包括需要补跑的时间点）并启动调度循环"""
+        if cls._loop_task is not None and not cls._loop_task.done():
+            return
+        now = datetime.now()
+        for job in cls._jobs.values():
+            job.next_run = job.cron.next_after(now)
+            if not job.catch_up:
+                continue
+            try:
+                last_scheduled_at = await cls._last_scheduled_at(job.name)
+            except Exception as e:
+                logger.error(f"查询定时任务执行记录失败: {job.name}, error={str(e)}")
+                continue
+            if last_scheduled_at:
+                # 停机期间错过的多个时间点只补跑最晚的一次
+                missed = job.cron.latest_between(last_scheduled_at, now)
+                if missed:
+                    logger.info(f"定时任务 {job.name} 错过计划时间 {missed}，立即补跑")
+                    job.next_run = missed
+        cls._loop_task = asyncio.create_task(cls._run_loop())
+        logger.info("定时任务调度器已启动")
+
+    @classmethod
+    async def stop(cls):
+        """停止调度循环（正在执行的任务继续执行完）"""
+        if cls._loop_task is not None:
+            cls._loop_task.cancel()
+            cls._loop_task = None
+            logger.info("定时任务调度器已停止")
+
+    @classmethod
+    async def _run_loop(cls):
+        while True:
+            now = datetime.now()
+            for job in cls._jobs.values():
+                if job.next_run > now:
+                    continue
+                scheduled_at = job.next_run
+                job.next_run = job.cron.next_after(max(now, scheduled_at))
+                # 同一进程内同一任务不并发执行
+                if job.task is not None and not job.task.done():
+                    logger.warning(f"定时任务 {job.name} 上次执行尚未结束，跳过计划时间 {scheduled_at}")
+                    continue
+                job.task = asyncio.create_task(cls._execute(job, scheduled_at))
+            next_run = min((job.next_run for job in cls._jobs.values()), default=None)
+            wait_seconds = SCHEDULER_MAX_SLEEP
+            if next_run is not None:
+                wait_seconds = min(max((next_run - datetime.now()).total_seconds(), 0), SCHEDULER_MAX_SLEEP)
+            await asyncio.sleep(wait_seconds)
+
+    @classmethod
+    async def _execute(cls, job: ScheduledJob, scheduled_at: datetime):
+        """抢占集群锁后执行任务并记录执行结果"""
+        lock_key = f"scheduler:lock:{job.name}:{scheduled_at:%Y%m%d%H%M}"
+        try:
+            if not await Cache.set_nx(lock_key, cls._host, job.lock_ttl):
+                logger.debug(f"定时任务 {job.name} ({scheduled_at}) 已由其他进程执行")
+                return
+        except Exception as e:
+            # Redis不可用时由执行记录表的唯一约束去重
+            logger.error(f"获取定时任务锁失败，使用执行记录去重: {job.name}, error={str(e)}")
+
+        try:
+            run_id = await cls._record_start(job.name, scheduled_at)
+        except Exception as e:
+            logger.error(f"写入定时任务执行记录失败，跳过本次执行: {job.name}, error={str(e)}")
+            return
+        if run_id is None:
+            return
+
+        start = time.perf_counter()
+        status, result, error = "success", None, None
         try:
-            # 执行目标协程
-            await coro()
+            result = await job.func()
+            if result is False:
+                status = "failed"
         except Exception as e:
-            logger.error(f"定时任务执行失败: {str(e)}")
+            status, error = "failed", str(e)
+            logger.error(f"定时任务执行失败: {job.name}, error={error}")
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        await cls._record_finish(run_id, status, duration_ms, result, error)
+        logger.info(f"定时任务 {job.name} ({scheduled_at}) 执行{'成功' if status == 'success' else '失败'}，耗时 {duration_ms}ms")
+
+    @classmethod
+    async def _last_scheduled_at(cls, job_name: str):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Scheduler_job_run.scheduled_at)
+                .where(Scheduler_job_run.job_name == job_name)
+                .order_by(Scheduler_job_run.scheduled_at.desc())
+                .limit(1)
+            )
+            return result.scalar_one_or_none()
+
+    @classmethod
+    async def _record_start(cls, job_name: str, scheduled_at: datetime):
+        """写入执行记录，同一计划时间已有记录时返回None"""
+        try:
+            async with AsyncSessionLocal() as db:
+                run = Scheduler_job_run(
+                    job_name=job_name,
+                    scheduled_at=scheduled_at,
+                    started_at=datetime.now(),
+                    status="running",
+                    host=cls._host
+                )
+                db.add(run)
+                await db.commit()
+                return run.id
+        except IntegrityError:
+            logger.info(f"定时任务 {job_name} ({scheduled_at}) 已有执行记录，跳过")
+            return None
+
+    @classmethod
+    async def _record_finish(cls, run_id: int, status: str, duration_ms: int, result, error: str):
+        try:
+            summary = json.dumps(result, ensure_ascii=False, default=str) if result is not None else None
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Scheduler_job_run)
+                    .where(Scheduler_job_run.id == run_id)
+                    .values(
+                        status=status,
+                        finished_at=datetime.now(),
+                        duration_ms=duration_ms,
+                        result=summary[:1000] if summary else None,
+                        error=error[:1000] if error else None
+                    )
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"更新定时任务执行记录失败: run_id={run_id}, error={str(e)}")
+
+    @classmethod
+    async def get_runs(cls, job_name: str = None, limit: int = 50) -> list:
+        """查询最近的执行记录"""
+        async with AsyncSessionLocal() as db:
+            query = select(Scheduler_job_run)
+            if job_name:
+                query = query.where(Scheduler_job_run.job_name == job_name)
+            result = await db.execute(query.order_by(Scheduler_job_run.scheduled_at.desc()).limit(limit))
+            return [run.to_dict() for run in result.scalars().all()]
+
+
+async def reset_daily_remaining():
+    """
+    每日重置用户权益剩余额度：先回写Redis中的已使用次数，再刷新数据库，最后清空计数器
+    """
+    from apps.business.services import update_daily_remaining_service
+    from apps.business.quota import EntitlementQuota
+    return await EntitlementQuota.reset(update_daily_remaining_service)
+
+async def sync_orders_to_entitlements():
+    """
+    增量同步订单到用户权益
+    """
+    from apps.business.services import sync_orders_to_entitlements_service
+    return await sync_orders_to_entitlements_service()
 
 async def start_scheduler():
     """
-    启动调度器，设置所有定时任务
+    注册所有定时任务并启动调度器
     """
-    # 设置每日0:00更新用户权益剩余额度的任务
-    midnight = time(0, 0)
-    asyncio.create_task(run_at_specific_time(midnight, update_daily_remaining_service))
-    logger.info("定时任务调度器已启动") 
\ No newline at end of file
+    # 每日0:00重置用户权益剩余额度
+    Scheduler.register("daily_remaining_reset", DAILY_REMAINING_RESET_SCHEDULE, reset_daily_remaining, lock_ttl=3600)
+    # 每5分钟增量同步订单到用户权益（从水位线继续，补跑一次即可处理停机期间的全部新订单）
+    Scheduler.register("order_sync", ORDER_SYNC_SCHEDULE, sync_orders_to_entitlements, lock_ttl=600)
+    await Scheduler.start()
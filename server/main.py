@@ -6,11 +6,13 @@ from apps.vio_word.views.view_routes import vio_word_view_routes # 导入违规
 from pathlib import Path
 from settings import configure_cors
 from core.cache import Cache
+from core.http_client import HttpClient
+from core.llm import LLMRegistry
 from core.logger import setup_logger
-import asyncio
 from apps.business.api_routes import business_api_routes # 导入业务接口路由
-from core.scheduler import start_scheduler
+from core.scheduler import start_scheduler, Scheduler
 from apps.search_video.views.view_routes import search_video_view_routes # 导入对标视频搜索与推荐视图路由
+from apps.speech_gen.views.view_routes import speech_gen_view_routes # 导入AI话术生成视图路由
 # 设置日志记录器
 logger = setup_logger('main')
 
@@ -39,6 +41,9 @@ vio_word_view_routes(app)
 # 注册对标视频搜索与推荐视图路由
 search_video_view_routes(app)
 
+# 注册AI话术生成视图路由
+speech_gen_view_routes(app)
+
 # 初始化Redis连接的路由
 @app.get("/initialize")
 async def initialize(request: Request) -> Response:
@@ -59,7 +64,12 @@ async def initialize(request: Request) -> Response:
 async def shutdown(request: Request) -> Response:
     """关闭应用的路由"""
     try:
+        from apps.business.quota import EntitlementQuota
+        await Scheduler.stop()
+        await EntitlementQuota.stop_flusher()
         await Cache.close()
+        await HttpClient.close()
+        await LLMRegistry.close()
         logger.info("Application shutdown completed")
         return Response(status_code=status_codes.HTTP_200_OK, description="Shutdown successful")
     except Exception as e:
@@ -69,23 +79,37 @@ async def shutdown(request: Request) -> Response:
             description="Failed to shutdown"
         )
 
-# 启动调度器函数
-async def init_scheduler():
+# 服务启动时加载类目索引和违规词词库，启动用户权益次数回写任务和定时任务调度器，并从检查点继续未完成的kalodata爬取任务
+async def on_startup():
+    try:
+        from apps.search_video.category_index import CategoryRegistry
+        await CategoryRegistry.get()
+    except Exception as e:
+        logger.error(f"加载类目索引失败: {str(e)}")
+    try:
+        from apps.vio_word.prefilter import BannedWordFilter
+        BannedWordFilter.get()
+    except Exception as e:
+        logger.error(f"加载违规词词库失败: {str(e)}")
     try:
-        # 启动调度器
+        from apps.business.quota import EntitlementQuota
+        EntitlementQuota.start_flusher()
+    except Exception as e:
+        logger.error(f"启动用户权益次数回写任务失败: {str(e)}")
+    try:
+        # 调度器需要在Robyn的事件循环中启动，否则定时任务不会执行
         await start_scheduler()
         logger.info("调度器启动成功")
     except Exception as e:
         logger.error(f"调度器启动失败: {str(e)}")
-        raise
+    try:
+        from apps.search_video.crawler import CrawlJobManager
+        await CrawlJobManager.resume_unfinished()
+    except Exception as e:
+        logger.error(f"继续kalodata爬取任务失败: {str(e)}")
+
+app.startup_handler(on_startup)
 
 if __name__ == "__main__":
-    # 创建并设置事件循环
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    # 启动调度器
-    loop.run_until_complete(init_scheduler())
-    
-    # 直接启动Robyn实例，让Robyn框架接管应用生命周期
+    # 直接启动Robyn实例，让Robyn框架接管应用生命周期（调度器在 on_startup 中启动）
     app.start(port=8080, host="0.0.0.0")
@@ -0,0 +1,53 @@
+"""add kalodata crawl job and checkpoint tables
+
+Revision ID: add_kalodata_crawl_job_tables
+Revises: add_kalodata_dedup_unique_key
+Create Date: 2025-06-05 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_kalodata_crawl_job_tables'
+down_revision = 'add_kalodata_dedup_unique_key'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 爬取任务表
+    op.create_table(
+        'kalodata_crawl_job',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('countries', sa.VARCHAR(255), nullable=False),
+        sa.Column('cookie', sa.Text(), nullable=False),
+        sa.Column('start_date', sa.VARCHAR(20), nullable=False),
+        sa.Column('end_date', sa.VARCHAR(20), nullable=False),
+        sa.Column('status', sa.VARCHAR(20), nullable=False),
+        sa.Column('total_count', sa.Integer(), nullable=False),
+        sa.Column('error', sa.VARCHAR(1000), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True)
+    )
+
+    # 爬取检查点表
+    op.create_table(
+        'kalodata_crawl_checkpoint',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('job_id', sa.Integer(), sa.ForeignKey('kalodata_crawl_job.id'), nullable=False),
+        sa.Column('country', sa.VARCHAR(20), nullable=False),
+        sa.Column('category_value', sa.VARCHAR(50), nullable=False),
+        sa.Column('status', sa.VARCHAR(20), nullable=False),
+        sa.Column('success_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('skip_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.VARCHAR(1000), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint('job_id', 'country', 'category_value', name='uq_crawl_checkpoint')
+    )
+    op.create_index('ix_kalodata_crawl_checkpoint_job_id', 'kalodata_crawl_checkpoint', ['job_id'])
+
+def downgrade():
+    op.drop_index('ix_kalodata_crawl_checkpoint_job_id', table_name='kalodata_crawl_checkpoint')
+    op.drop_table('kalodata_crawl_checkpoint')
+    op.drop_table('kalodata_crawl_job')
@@ -0,0 +1,39 @@
+"""add unique key to kalodata_data
+
+Revision ID: add_kalodata_dedup_unique_key
+Revises: add_ai_product_id_to_user_entitlements
+Create Date: 2025-06-03 10:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_kalodata_dedup_unique_key'
+down_revision = 'add_ai_product_id_to_user_entitlements'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 清理历史重复数据，优先保留未删除的记录，其次保留id最小的记录
+    op.execute("""
+        DELETE t1 FROM kalodata_data t1
+        JOIN kalodata_data t2
+          ON t1.country = t2.country
+         AND t1.video_name = t2.video_name
+         AND t1.product_title = t2.product_title
+         AND t1.start_date = t2.start_date
+         AND t1.end_date = t2.end_date
+         AND (COALESCE(t1.is_deleted, 0) > COALESCE(t2.is_deleted, 0)
+              OR (COALESCE(t1.is_deleted, 0) = COALESCE(t2.is_deleted, 0) AND t1.id > t2.id))
+    """)
+
+    # 添加去重唯一键，供批量 INSERT ... ON DUPLICATE KEY UPDATE 使用
+    op.create_unique_constraint(
+        'uq_kalodata_dedup',
+        'kalodata_data',
+        ['country', 'video_name', 'product_title', 'start_date', 'end_date']
+    )
+
+def downgrade():
+    # 删除去重唯一键
+    op.drop_constraint('uq_kalodata_dedup', 'kalodata_data', type_='unique')
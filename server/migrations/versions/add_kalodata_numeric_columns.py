@@ -0,0 +1,43 @@
+"""add numeric metric columns and revenue index to kalodata_data
+
+Revision ID: add_kalodata_numeric_columns
+Revises: add_kalodata_top_index
+Create Date: 2025-06-10 10:00:00.000000
+
+数值列由后台回填任务填充：POST /api/search_video/kalodata/backfill_numeric
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_kalodata_numeric_columns'
+down_revision = 'add_kalodata_top_index'
+branch_labels = None
+depends_on = None
+
+NUMERIC_COLUMNS = [
+    ('gpm_num', sa.Float()),
+    ('revenue_num', sa.Float()),
+    ('sales_num', sa.BigInteger()),
+    ('views_num', sa.BigInteger()),
+    ('roas_num', sa.Float()),
+    ('ad2cost_num', sa.Float()),
+    ('follower_count_num', sa.BigInteger()),
+]
+
+def upgrade():
+    # 添加指标数值列
+    for name, column_type in NUMERIC_COLUMNS:
+        op.add_column('kalodata_data', sa.Column(name, column_type, nullable=True))
+
+    # 按国家+三级类目过滤，按收益排序的复合索引（按数据日期排序的索引见 add_kalodata_top_index，去重键已有唯一索引 uq_kalodata_dedup）
+    op.create_index(
+        'ix_kalodata_country_cat3_revenue',
+        'kalodata_data',
+        ['country', 'category3', 'is_deleted', 'revenue_num']
+    )
+
+def downgrade():
+    op.drop_index('ix_kalodata_country_cat3_revenue', table_name='kalodata_data')
+    for name, _ in NUMERIC_COLUMNS:
+        op.drop_column('kalodata_data', name)
@@ -0,0 +1,25 @@
+"""add country/category3/end_date index to kalodata_data
+
+Revision ID: add_kalodata_top_index
+Revises: add_kalodata_crawl_job_tables
+Create Date: 2025-06-08 10:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'add_kalodata_top_index'
+down_revision = 'add_kalodata_crawl_job_tables'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 对标视频搜索按国家+三级类目过滤，按数据日期取最新数据
+    op.create_index(
+        'ix_kalodata_country_cat3_end',
+        'kalodata_data',
+        ['country', 'category3', 'is_deleted', 'end_date']
+    )
+
+def downgrade():
+    op.drop_index('ix_kalodata_country_cat3_end', table_name='kalodata_data')
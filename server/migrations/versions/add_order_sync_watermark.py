@@ -0,0 +1,33 @@
+"""add sync_watermark table and orders (created_at, order_id) index
+
+Revision ID: add_order_sync_watermark
+Revises: add_kalodata_numeric_columns
+Create Date: 2025-06-20 10:00:00.000000
+
+订单 -> 用户权益 增量同步按 (created_at, order_id) 游标读取新订单
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_order_sync_watermark'
+down_revision = 'add_kalodata_numeric_columns'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 同步水位线表
+    op.create_table(
+        'sync_watermark',
+        sa.Column('name', sa.VARCHAR(50), primary_key=True),
+        sa.Column('last_created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_id', sa.String(50), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now())
+    )
+
+    # 增量同步的游标索引
+    op.create_index('ix_orders_created_at_order_id', 'orders', ['created_at', 'order_id'])
+
+def downgrade():
+    op.drop_index('ix_orders_created_at_order_id', table_name='orders')
+    op.drop_table('sync_watermark')
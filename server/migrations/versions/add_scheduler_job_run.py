@@ -0,0 +1,35 @@
+"""add scheduler_job_run table
+
+Revision ID: add_scheduler_job_run
+Revises: add_order_sync_watermark
+Create Date: 2025-06-25 10:00:00.000000
+
+定时任务执行记录，(job_name, scheduled_at) 唯一保证每个计划时间点只执行一次
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_scheduler_job_run'
+down_revision = 'add_order_sync_watermark'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'scheduler_job_run',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('job_name', sa.VARCHAR(50), nullable=False),
+        sa.Column('scheduled_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('duration_ms', sa.Integer(), nullable=True),
+        sa.Column('status', sa.VARCHAR(20), nullable=False, server_default='running'),
+        sa.Column('result', sa.VARCHAR(1000), nullable=True),
+        sa.Column('error', sa.VARCHAR(1000), nullable=True),
+        sa.Column('host', sa.VARCHAR(100), nullable=True),
+        sa.UniqueConstraint('job_name', 'scheduled_at', name='uq_scheduler_job_run')
+    )
+
+def downgrade():
+    op.drop_table('scheduler_job_run')
@@ -0,0 +1,27 @@
+import pytest
+from apps.search_video.utils import parse_metric_number
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("¥1.2万", 12000.0),
+    ("3.5K", 3500.0),
+    ("2m", 2e6),
+    ("1.5亿", 1.5e8),
+    ("12.5%", 12.5),
+    ("1,234", 1234.0),
+    ("-3.2", -3.2),
+    ("1万-2万", 1e4),
+    ("10~20", 10.0),
+    ("5e-05", 5e-05),
+    ("1.2E+03", 1200.0),
+    (str(0.00001234), 1.234e-05),
+    (7, 7.0),
+    (0.5, 0.5),
+])
+def test_parse_metric_number(value, expected):
+    assert parse_metric_number(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value", [None, True, "", "unknown", "--", "N/A", "nan", "inf"])
+def test_parse_metric_number_invalid(value):
+    assert parse_metric_number(value) is None